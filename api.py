@@ -0,0 +1,341 @@
+"""Local HTTP API over the generation core, for scripts and collection-management systems.
+
+    GET  /health              model status
+    GET  /metrics             Prometheus metrics
+    GET  /v1/guide?q=...&k=5  offline knowledge base search, no model call
+    GET  /v1/history/export?email=...&format=jsonl|csv|zip-md|zip-txt
+                              a user's saved history, streamed (filters: artwork, output, q)
+    POST /v1/generate         one artwork; {"stream": true} returns NDJSON chunks
+    POST /v1/batch            {"rows": [...]}; {"stream": true} returns NDJSON results as they finish
+
+Connections are kept alive (HTTP/1.1) and every request gets its own thread.
+Set ARTRESTORER_API_TOKEN to require "Authorization: Bearer <token>". History export
+hands out any user's records, so it is refused until a token is set.
+"""
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import batch
+import export
+import gemini_client
+import history_store
+import knowledge_base
+import metrics
+import response_cache
+from generation import GenerationError, build_restoration_prompt, generate_response, stream_response
+
+API_HOST = os.getenv("ARTRESTORER_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("ARTRESTORER_API_PORT", "8765"))
+API_TOKEN = os.getenv("ARTRESTORER_API_TOKEN")
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_BATCH_ROWS = 1000
+MAX_BATCH_WORKERS = 16
+
+STATUS_FOR_ERROR = {
+    'ConfigurationError': 503,
+    'RateLimitedError': 429,
+    'UpstreamUnavailableError': 502,
+    'ModelNotAvailableError': 502,
+    'CircuitOpenError': 503,
+    'DeadlineExceededError': 504,
+    'InvalidRequestError': 400,
+    'BlockedResponseError': 422,
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def request_profile(body, client):
+    # Only the prompt-relevant fields; the client ID keys the scheduler's fair share
+    profile = body.get('profile') or {}
+    if not isinstance(profile, dict):
+        raise BadRequest("'profile' must be an object")
+    user_profile = {f: profile.get(f, response_cache.PROFILE_DEFAULTS[f]) for f in response_cache.PROFILE_FIELDS}
+    for field, choices in response_cache.PROFILE_CHOICES.items():
+        if user_profile[field] not in choices:
+            raise BadRequest(f"'profile.{field}' must be one of {', '.join(choices)}")
+    for field in ('creativity', 'length'):
+        value = user_profile[field]
+        # bool is an int too, but true/false is never a meant setting
+        if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= 10:
+            raise BadRequest(f"'profile.{field}' must be a whole number from 1 to 10")
+    email = profile.get('email') or client
+    if not isinstance(email, str):
+        raise BadRequest("'profile.email' must be a string")
+    user_profile['email'] = email
+    return user_profile
+
+
+def row_prompt(row, user=None):
+    missing = batch.missing_fields(row)
+    if missing:
+        raise BadRequest(f"Missing required fields: {', '.join(missing)}")
+    return build_restoration_prompt(row['artwork_type'], row['period'], row['artist'],
+                                    row['region'], row['damage'], row['output_type'], user)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ArtRestorerAPI/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_json(self, status, error, message):
+        self._send_json(status, {'error': error, 'message': message})
+
+    def _start_stream(self, content_type='application/x-ndjson; charset=utf-8', filename=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if filename:
+            self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.streaming = True
+
+    def _write_chunk(self, data):
+        if data:
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+    def _write_line(self, payload):
+        self._write_chunk((json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8'))
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _authorized(self, token_required=False):
+        if not API_TOKEN:
+            if not token_required:
+                return True
+            self._send_error_json(403, 'Forbidden', "This endpoint is disabled until ARTRESTORER_API_TOKEN is set")
+            return False
+        if self.headers.get('Authorization', '') == f"Bearer {API_TOKEN}":
+            return True
+        self._send_error_json(401, 'Unauthorized', "Missing or wrong bearer token")
+        return False
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise BadRequest(f"Request body over {MAX_BODY_BYTES} bytes")
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            raise BadRequest(f"Body is not valid JSON: {e}")
+        if not isinstance(body, dict):
+            raise BadRequest("Body must be a JSON object")
+        return body
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path
+        if path == '/health':
+            config = gemini_client.peek()
+            if config is None:
+                self._send_json(503, {'status': 'starting', 'model': None, 'error': None})
+                return
+            self._send_json(200 if config.model else 503, {
+                'status': 'ok' if config.model else 'unconfigured',
+                'model': config.model_name,
+                'error': config.api_error,
+            })
+        elif path == '/metrics':
+            body = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == '/v1/guide':
+            if self._authorized():
+                self._guide(parse_qs(url.query))
+        elif path == '/v1/history/export':
+            if self._authorized(token_required=True):
+                self._export(parse_qs(url.query))
+        else:
+            self._send_error_json(404, 'NotFound', f"No endpoint {path}")
+
+    def _guide(self, params):
+        query = params.get('q', [''])[0]
+        if not query.strip():
+            self._send_error_json(400, 'BadRequest', "Missing query parameter 'q'")
+            return
+        try:
+            k = min(50, max(1, int(params.get('k', ['5'])[0])))
+        except ValueError:
+            self._send_error_json(400, 'BadRequest', "'k' must be a number")
+            return
+        start = time.perf_counter()
+        results = knowledge_base.get_knowledge_base().search(query, k)
+        self._send_json(200, {
+            'results': [{'score': round(score, 4), 'source': p['source'], 'text': p['text']} for score, p in results],
+            'seconds': round(time.perf_counter() - start, 6),
+        })
+
+    def _export(self, params):
+        email = params.get('email', [''])[0]
+        fmt = params.get('format', ['jsonl'])[0]
+        if not email:
+            self._send_error_json(400, 'BadRequest', "Missing query parameter 'email'")
+            return
+        if fmt not in export.FORMATS:
+            self._send_error_json(400, 'BadRequest', f"'format' must be one of {', '.join(export.FORMATS)}")
+            return
+        records = history_store.get_store().iter_records(
+            email, artwork=params.get('artwork', [None])[0], output=params.get('output', [None])[0],
+            query=params.get('q', [None])[0])
+        chunks = export.iter_export(records, fmt)
+        # Pull the first chunk (and so run the query) before answering, so early failures get a status
+        try:
+            first = next(chunks, b'')
+        except Exception as e:
+            self.log_error("Error exporting history: %r", e)
+            self._send_error_json(500, 'InternalError', f"{e.__class__.__name__}: {e}")
+            return
+        self._start_stream(export.FORMATS[fmt][0], export.export_filename(fmt, time.strftime('%Y%m%d')))
+        try:
+            self._write_chunk(first)
+            for chunk in chunks:
+                self._write_chunk(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            chunks.close()
+            self.close_connection = True
+            return
+        except Exception as e:
+            # Too late for a status: JSONL gets an error record, and no format gets the closing
+            # zero-length chunk, so clients see a truncated download rather than a complete file
+            self.log_error("Error exporting history: %r", e)
+            self.close_connection = True
+            if fmt == 'jsonl':
+                try:
+                    self._write_line({'error': 'InternalError', 'message': f"{e.__class__.__name__}: {e}"})
+                except OSError:
+                    pass
+            return
+        self._end_stream()
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        if not self._authorized():
+            return
+        self.streaming = False
+        try:
+            body = self._read_body()
+            if path == '/v1/generate':
+                self._generate(body)
+            elif path == '/v1/batch':
+                self._batch(body)
+            else:
+                self._send_error_json(404, 'NotFound', f"No endpoint {path}")
+        except BadRequest as e:
+            self._send_error_json(400, 'BadRequest', str(e))
+        except GenerationError as e:
+            name = e.__class__.__name__
+            self._send_error_json(STATUS_FOR_ERROR.get(name, 500), name, str(e))
+        except Exception as e:
+            # A bug on our side still gets an answer instead of a dropped connection
+            self.log_error("Error handling %s: %r", path, e)
+            if not self.streaming:
+                self._send_error_json(500, 'InternalError', f"{e.__class__.__name__}: {e}")
+                return
+            try:
+                self._write_line({'error': 'InternalError', 'message': f"{e.__class__.__name__}: {e}"})
+                self._end_stream()
+            except OSError:
+                self.close_connection = True
+
+    def _generate(self, body):
+        row = batch.normalize_row(body, 1)
+        profile = request_profile(body, self.client_address[0])
+        prompt = row_prompt(row, profile['email'])
+        use_cache = body.get('use_cache', True)
+        start = time.perf_counter()
+        if not body.get('stream'):
+            response = generate_response(prompt, profile, use_cache=use_cache, output_type=row['output_type'])
+            self._send_json(200, {'id': row['id'], 'response': response,
+                                  'seconds': round(time.perf_counter() - start, 3)})
+            return
+
+        chunks = stream_response(prompt, profile, use_cache=use_cache, output_type=row['output_type'])
+        # Pull the first chunk before answering, so early failures still get a proper status
+        try:
+            first = next(chunks)
+        except StopIteration:
+            first = ''
+        self._start_stream()
+        try:
+            self._write_line({'text': first})
+            for text in chunks:
+                self._write_line({'text': text})
+            self._write_line({'done': True, 'seconds': round(time.perf_counter() - start, 3)})
+        except GenerationError as e:
+            self._write_line({'error': e.__class__.__name__, 'message': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-stream; stop generating for it
+            chunks.close()
+            self.close_connection = True
+            return
+        self._end_stream()
+
+    def _batch(self, body):
+        raw_rows = body.get('rows')
+        if not isinstance(raw_rows, list) or not raw_rows:
+            raise BadRequest("'rows' must be a non-empty list")
+        if len(raw_rows) > MAX_BATCH_ROWS:
+            raise BadRequest(f"At most {MAX_BATCH_ROWS} rows per request")
+        if not all(isinstance(raw, dict) for raw in raw_rows):
+            raise BadRequest("Every row must be an object")
+        rows = [batch.normalize_row(raw, i + 1) for i, raw in enumerate(raw_rows)]
+        profile = request_profile(body, self.client_address[0])
+        try:
+            workers = min(MAX_BATCH_WORKERS, max(1, int(body.get('workers', 4))))
+        except (TypeError, ValueError):
+            raise BadRequest("'workers' must be a number")
+        results = batch.run_batch(rows, profile, workers=workers, use_cache=body.get('use_cache', True))
+
+        if body.get('stream'):
+            self._start_stream()
+            try:
+                for result in results:
+                    self._write_line(result)
+            except (BrokenPipeError, ConnectionResetError):
+                results.close()
+                self.close_connection = True
+                return
+            self._end_stream()
+            return
+
+        order = {row['id']: i for i, row in enumerate(rows)}
+        collected = sorted(results, key=lambda r: order.get(r['id'], len(order)))
+        self._send_json(200, {'results': collected, 'failed': len([r for r in collected if r['error']])})
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, verbose=False):
+        super().__init__(address, ApiHandler)
+        self.verbose = verbose
+
+
+def make_server(host=API_HOST, port=API_PORT, verbose=False):
+    """An ApiServer bound to (host, port); port 0 picks a free one."""
+    # Model discovery runs while the server starts listening
+    gemini_client.warm_up()
+    return ApiServer((host, port), verbose)
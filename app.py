@@ -1,10 +1,32 @@
 import streamlit as st
-import google.generativeai as genai
 from datetime import datetime
+import functools
+import html
 import os
+import re
+import time
+
+import batch
+import chat_context
+import export
+import gemini_client
+import history_store
+import jobs
+import knowledge_base
+import metrics
+import prefetch
+import response_cache
+import router
+import scheduler
+import session_store
+import similarity_index
+from generation import build_restoration_prompt, similarity_scope, OUTPUT_TYPES
 
 st.set_page_config(page_title="ArtRestorer AI", page_icon="🎨", layout="wide")
 
+# Prometheus scrape endpoint, only when ARTRESTORER_METRICS_PORT is set
+metrics.start_http_server()
+
 # Custom CSS - COMPLETELY FIXED COLOR SCHEME
 st.markdown("""
 <style>
@@ -130,131 +152,290 @@ if 'page' not in st.session_state:
     st.session_state.page = 'welcome'
 if 'user' not in st.session_state:
     st.session_state.user = None
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
+# Response and message bodies, stored once per session and compressed
+if 'session_texts' not in st.session_state:
+    st.session_state.session_texts = session_store.TextStore()
 if 'chat_messages' not in st.session_state:
-    st.session_state.chat_messages = []
+    st.session_state.chat_messages = session_store.ChatTranscript(st.session_state.session_texts)
+if 'chat_summary' not in st.session_state:
+    st.session_state.chat_summary = chat_context.new_summary()
+if 'similar_mode' not in st.session_state:
+    st.session_state.similar_mode = "Offer"
+if 'similar_threshold' not in st.session_state:
+    st.session_state.similar_threshold = similarity_index.DEFAULT_THRESHOLD
+if 'stream_responses' not in st.session_state:
+    st.session_state.stream_responses = True
+if 'workspace_jobs' not in st.session_state:
+    st.session_state.workspace_jobs = []
+if 'workspace_outputs' not in st.session_state:
+    st.session_state.workspace_outputs = []
+# Workspace results beyond session_store.MAX_OUTPUTS, on disk
+if 'output_archive' not in st.session_state:
+    st.session_state.output_archive = session_store.OutputArchive()
+if 'chat_job' not in st.session_state:
+    st.session_state.chat_job = None
+if 'prefetch_next' not in st.session_state:
+    st.session_state.prefetch_next = True
+# Pages of CHAT_WINDOW messages shown in the chat, newest first
+if 'chat_pages' not in st.session_state:
+    st.session_state.chat_pages = 1
 
-# Configure Gemini - DYNAMICALLY FIND AVAILABLE MODEL
-model = None
-api_error = None
-api_key = None
-available_models = []
+HISTORY_PAGE_SIZE = 10
 
-try:
-    # Method 1: Try Streamlit secrets (standard location)
-    try:
-        api_key = st.secrets["GEMINI_API_KEY"]
-    except:
-        pass
-    
-    # Method 2: Try reading from .secrets/secrets.toml (your teacher's structure)
-    if not api_key:
-        secrets_path = ".secrets/secrets.toml"
-        if os.path.exists(secrets_path):
-            try:
-                with open(secrets_path, 'r') as f:
-                    content = f.read()
-                    # Parse the TOML file manually
-                    for line in content.split('\n'):
-                        if 'GEMINI_API_KEY' in line and '=' in line:
-                            # Extract the key from line like: GEMINI_API_KEY = "key_here"
-                            api_key = line.split('=')[1].strip().strip('"').strip("'")
-                            break
-            except Exception as e:
-                api_error = f"Found .secrets/secrets.toml but couldn't read it: {str(e)}"
-    
-    # Method 3: Try reading from .streamlit/secrets.toml
-    if not api_key:
-        secrets_path = ".streamlit/secrets.toml"
-        if os.path.exists(secrets_path):
-            try:
-                with open(secrets_path, 'r') as f:
-                    content = f.read()
-                    for line in content.split('\n'):
-                        if 'GEMINI_API_KEY' in line and '=' in line:
-                            api_key = line.split('=')[1].strip().strip('"').strip("'")
-                            break
-            except Exception as e:
-                api_error = f"Found .streamlit/secrets.toml but couldn't read it: {str(e)}"
-    
-    # Method 4: Try environment variable
-    if not api_key:
-        api_key = os.getenv('GEMINI_API_KEY')
-    
-    # Configure the API if we found a key
-    if api_key:
-        genai.configure(api_key=api_key)
-        
-        # DYNAMICALLY LIST AND SELECT AVAILABLE MODELS
-        try:
-            # Get list of all available models that support generateContent
-            all_models = genai.list_models()
-            for m in all_models:
-                if 'generateContent' in m.supported_generation_methods:
-                    available_models.append(m.name)
-            
-            # Prefer gemini models in this order
-            preferred_models = [
-                'models/gemini-1.5-flash',
-                'models/gemini-1.5-pro',
-                'models/gemini-pro',
-                'models/gemini-1.0-pro',
-            ]
-            
-            # Find the first available preferred model
-            model_name = None
-            for pref in preferred_models:
-                if pref in available_models:
-                    model_name = pref
-                    break
-            
-            # If no preferred model found, use the first available one
-            if not model_name and available_models:
-                model_name = available_models[0]
-            
-            if model_name:
-                model = genai.GenerativeModel(model_name)
-            else:
-                api_error = "No models supporting generateContent found for your API key"
-                
-        except Exception as e:
-            api_error = f"Error listing models: {str(e)}"
+# Chat messages shown at once; "Load earlier" adds this many more
+CHAT_WINDOW = 20
+# Sessions whose visible chat messages stay converted; the cache is shared by all of them
+CHAT_CACHE_SESSIONS = int(os.getenv("ARTRESTORER_CHAT_CACHE_SESSIONS", "64"))
+
+# Batch results are appended here as rows finish, so runs can resume
+BATCH_DIR = ".cache/batches"
+
+
+# Output type choice that generates several output types for one artwork at once
+ALL_OUTPUTS = "All Outputs"
+
+# Pages re-check their background jobs this often; only the polling fragment re-runs,
+# and streamed text has to flow in steps well under a second
+JOB_POLL_SECONDS = 0.25
+# A job finishing this quickly (a cache hit, say) is shown by the run that submitted it
+QUICK_RESULT_SECONDS = 0.3
+
+
+def render_job(job):
+    if job.queue:
+        # The scheduler is holding it back for its share of the API quota
+        position, eta = job.queue
+        st.info(f"⏳ Waiting for API quota: {position} request(s) ahead · about {eta:.0f}s")
+    elif job.chunks:
+        st.markdown(f"<div style='color: #2C3E50; background-color: white; padding: 20px; border-radius: 10px;'>{job.text}</div>", unsafe_allow_html=True)
     else:
-        api_error = "No API key found. Please add GEMINI_API_KEY to .secrets/secrets.toml or .streamlit/secrets.toml"
-        
-except Exception as e:
-    api_error = f"Error configuring API: {str(e)}"
+        st.caption("Generating...")
 
-def generate_response(prompt, user_profile):
-    if not model:
-        error_msg = f"⚠️ API Configuration Error: {api_error}\n\n"
-        
-        if available_models:
-            error_msg += f"Available models found: {', '.join(available_models)}\n\n"
-        
-        error_msg += """Please check:
-1. Your API key is valid (get from: https://aistudio.google.com/app/apikey)
-2. You have enabled the Gemini API
-3. Add to .secrets/secrets.toml:
-   GEMINI_API_KEY = "your-key-here"
-"""
-        return error_msg
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_jobs(job_ids, show_labels=True):
+    # Only this fragment re-runs while jobs are pending; a finished job refreshes the page
+    executor = jobs.get_executor()
+    current = [executor.get(job_id) for job_id in job_ids]
+    if any(job is None or not job.pending for job in current):
+        st.rerun()
+    for job in current:
+        if show_labels:
+            st.markdown(f"<p style='color: #2C3E50;'><strong>{job.meta.get('label', '')}</strong></p>", unsafe_allow_html=True)
+        render_job(job)
+
+
+def restoration_request(artwork_type, art_period, artist, region, damage, output_type, use_cache=True, group=None):
+    return {
+        'prompt': build_restoration_prompt(artwork_type, art_period, artist, region, damage, output_type,
+                                           st.session_state.user['email']),
+        'use_cache': use_cache,
+        'similar_text': damage,
+        'similar_scope': similarity_scope(output_type, st.session_state.user, artwork_type, art_period, artist, region),
+        'artwork': artwork_type, 'period': art_period, 'artist': artist, 'region': region,
+        'damage': damage, 'output': output_type, 'group': group,
+    }
+
+
+def request_output(request, response, time=None):
+    return {
+        'artwork': request['artwork'], 'period': request['period'],
+        'damage': request['damage'], 'output': request['output'],
+        'response': response, 'time': time or datetime.now(), 'group': request.get('group'),
+    }
+
+
+def prefetch_next(request):
+    # Warm the cache with what people usually ask for next about the same artwork
+    next_output = prefetch.get_model().predict(request['output'])
+    if not (next_output and request['use_cache'] and st.session_state.prefetch_next):
+        return
+    next_request = restoration_request(request['artwork'], request['period'], request['artist'],
+                                       request['region'], request['damage'], next_output)
+    jobs.get_executor().submit(st.session_state.user['email'], 'prefetch',
+                               jobs.prefetch_job(next_request, dict(st.session_state.user)))
+    metrics.prefetches.inc(output_type=next_output)
+
+
+def full_report(outputs):
+    # Every section of one "All Outputs" run, in the usual output order
+    sections = sorted(outputs, key=lambda o: OUTPUT_TYPES.index(o.output) if o.output in OUTPUT_TYPES else len(OUTPUT_TYPES))
+    first = sections[0]
+    body = "\n\n".join(f"{o.output}\n{'-' * len(o.output)}\n{o.response}" for o in sections)
+    return f"""ArtRestorer AI Report
+Time: {max(o.time for o in sections)}
+Artwork: {first.artwork}
+Period: {first.period}
+Damage: {first.damage}
+
+{body}"""
+
+
+def submit_restoration(request):
+    job_id = jobs.get_executor().submit(
+        st.session_state.user['email'], 'restoration',
+        jobs.restoration_job(request, dict(st.session_state.user), st.session_state.stream_responses),
+        meta={'request': request, 'label': f"{request['output']} · {request['artwork']}"})
+    st.session_state.workspace_jobs.append(job_id)
+    st.session_state.setdefault('jobs_submitted_now', []).append(job_id)
+
+
+@functools.lru_cache(maxsize=CHAT_CACHE_SESSIONS * CHAT_WINDOW)
+def message_html(content):
+    # Memoized, so reruns don't convert the visible messages again
+    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html.escape(content))
+    return f"<p style='color: #2C3E50;'>{text.replace(chr(10), '<br>')}</p>"
+
+
+def send_chat():
+    # on_submit callback: runs before the chat panel re-renders, so it shows the new turn straight away
+    prompt = st.session_state.chat_prompt
+    if not prompt or st.session_state.chat_job:
+        return
+    transcript = st.session_state.chat_messages
+    # Turns the answer poller showed on its own: render the whole panel again, which also stops the poller
+    rerun_panel = len(transcript) != st.session_state.chat_shown
+    transcript.append("user", prompt)
     
-    try:
-        system_prompt = f"""You are an art restoration expert.
-User profile: {user_profile.get('experience', 'intermediate')} level
-Tone: {user_profile.get('tone', 'academic')}
-Creativity: {user_profile.get('creativity', 5)}/10
-Detail: {user_profile.get('length', 5)}/10
+    # A self-contained first question can reuse a near-identical earlier answer
+    first_question = transcript.user_turns == 1
+    chat_scope = similarity_scope("chat", st.session_state.user)
+    match = None
+    if first_question and st.session_state.similar_mode == "Return automatically":
+        match = similarity_index.get_index().best_match(prompt, chat_scope, st.session_state.similar_threshold)
+    
+    if match:
+        transcript.append("assistant", match[1]['response'], context_tokens=0, reused=match[0])
+    else:
+        # Earlier turns go along too, summarized once they exceed the token budget
+        st.session_state.chat_job = jobs.get_executor().submit(
+            st.session_state.user['email'], 'chat',
+            jobs.chat_job(transcript.turns(st.session_state.chat_summary['upto']), dict(st.session_state.user),
+                          st.session_state.chat_summary, st.session_state.stream_responses,
+                          chat_scope if first_question else None))
+        st.session_state.chat_submitted_now = True
+    if rerun_panel:
+        st.rerun(scope="chat_panel")
 
-{prompt}"""
-        
-        response = model.generate_content(system_prompt)
-        return response.text
-        
-    except Exception as e:
-        return f"Error generating response: {str(e)}"
+
+def show_earlier_messages():
+    st.session_state.chat_pages += 1
+
+
+def new_conversation():
+    st.session_state.chat_messages.clear()
+    st.session_state.chat_summary = chat_context.new_summary()
+    st.session_state.chat_job = None
+    st.session_state.chat_pages = 1
+
+
+def finish_chat_answer():
+    # Move the answer from the background job into the transcript, once it has finished
+    job = jobs.get_executor().get(st.session_state.chat_job)
+    if job is not None and job.pending:
+        return
+    st.session_state.chat_job = None
+    transcript = st.session_state.chat_messages
+    if job is not None and job.status == jobs.DONE:
+        st.session_state.chat_summary = job.result['summary']
+        transcript.append("assistant", job.result['response'], context_tokens=job.result['tokens'])
+    else:
+        # Keep user/assistant turns alternating for the next request
+        transcript.pop()
+        st.error(f"⚠️ {job.error if job else 'The answer expired before it was shown; please ask again'}")
+
+
+def chat_message(msg):
+    with st.chat_message(msg["role"]):
+        st.markdown(message_html(msg['content']), unsafe_allow_html=True)
+        if 'reused' in msg:
+            st.caption(f"♻️ Reused the answer to a {msg['reused']:.0%} similar earlier question")
+        elif 'context_tokens' in msg:
+            st.caption(f"~{msg['context_tokens']} tokens sent")
+
+
+def chat_input():
+    st.chat_input("Ask about art restoration...", key="chat_prompt", on_submit=send_chat,
+                  disabled=bool(st.session_state.chat_job))
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def chat_answer():
+    # Only this part of the panel re-runs while the answer is pending. It stops polling when
+    # the panel next re-renders without it; until then it shows the turns added since.
+    if st.session_state.chat_job:
+        finish_chat_answer()
+    for msg in st.session_state.chat_messages.turns(st.session_state.chat_shown):
+        chat_message(msg)
+    if st.session_state.chat_job:
+        with st.chat_message("assistant"):
+            render_job(jobs.get_executor().get(st.session_state.chat_job))
+    chat_input()
+
+
+@st.fragment(key="chat_panel")
+def chat_panel():
+    # Sending, paging and clearing re-run only this panel, not the page setup above it
+    transcript = st.session_state.chat_messages
+    if not len(transcript):
+        transcript.append("assistant", f"Hello {st.session_state.user['name']}! I'm your AI assistant for art restoration. How can I help?")
+    
+    if st.session_state.chat_job:
+        if st.session_state.pop('chat_submitted_now', False):
+            jobs.get_executor().wait([st.session_state.chat_job], QUICK_RESULT_SECONDS)
+        finish_chat_answer()
+    
+    if st.session_state.chat_summary['text']:
+        with st.expander(f"📝 Summary of {st.session_state.chat_summary['upto']} earlier messages"):
+            st.markdown(f"<p style='color: #2C3E50;'>{st.session_state.chat_summary['text']}</p>", unsafe_allow_html=True)
+    
+    # Only the newest messages are rendered, so a turn costs the same however long the chat is
+    start = max(0, len(transcript) - st.session_state.chat_pages * CHAT_WINDOW)
+    if start:
+        st.button(f"⬆️ Load earlier messages ({start} more)", on_click=show_earlier_messages)
+    for msg in transcript.turns(start):
+        chat_message(msg)
+    st.session_state.chat_shown = len(transcript)
+    
+    if st.session_state.chat_job:
+        chat_answer()
+    else:
+        chat_input()
+    
+    if len(transcript) > 1:
+        st.button("🧹 New Conversation", on_click=new_conversation)
+
+
+def add_output(output):
+    # Newest first; the selector in the guidance panel jumps to it
+    outputs = st.session_state.workspace_outputs
+    outputs.insert(0, session_store.OutputRecord(st.session_state.session_texts, **output))
+    for dropped in outputs[session_store.MAX_OUTPUTS:]:
+        st.session_state.output_archive.add(dropped)
+        dropped.release()
+    del outputs[session_store.MAX_OUTPUTS:]
+    st.session_state.output_choice = 0
+
+# Configure Gemini - resolved once per process and shared across sessions.
+# Discovery (and the SDK import) runs in the background, so pages render straight away;
+# the first generation waits for it if it hasn't finished yet.
+streamlit_key = None
+try:
+    streamlit_key = st.secrets["GEMINI_API_KEY"]
+except:
+    pass
+
+gemini_client.warm_up(streamlit_key)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def wait_for_model():
+    # Only rendered while discovery is running; the full rerun then shows the status
+    if gemini_client.peek() is not None:
+        st.rerun()
+    st.info("⏳ Connecting to Gemini...")
 
 # WELCOME PAGE
 if st.session_state.page == 'welcome':
@@ -264,13 +445,16 @@ if st.session_state.page == 'welcome':
     st.markdown("<p style='color: #2C3E50;'>Many historical artworks are damaged or partially lost. This application provides AI-assisted, text-based restoration guidance for museums, students, and cultural researchers.</p>", unsafe_allow_html=True)
     
     # Show API status with detailed info
-    if api_error:
-        st.error(f"⚠️ API Configuration Issue: {api_error}")
+    gemini = gemini_client.peek()
+    if gemini is None:
+        wait_for_model()
+    elif gemini.api_error:
+        st.error(f"⚠️ API Configuration Issue: {gemini.api_error}")
         
-        if available_models:
-            st.warning(f"📋 Found {len(available_models)} available models, but couldn't initialize")
+        if gemini.available_models:
+            st.warning(f"📋 Found {len(gemini.available_models)} available models, but couldn't initialize")
             with st.expander("Available Models"):
-                for m in available_models:
+                for m in gemini.available_models:
                     st.write(f"- {m}")
         
         st.info("""💡 **How to fix:**
@@ -296,17 +480,22 @@ streamlit run app.py
         
         # Debug info
         with st.expander("🔍 Debug Information"):
-            st.write("API Key found:", "Yes" if api_key else "No")
-            if api_key:
-                st.write(f"API Key starts with: {api_key[:10]}...")
-                st.write(f"API Key length: {len(api_key)} characters")
-            st.write(f"Available models: {len(available_models)}")
+            st.write("API Key found:", "Yes" if gemini.api_key else "No")
+            if gemini.api_key:
+                st.write(f"API Key starts with: {gemini.api_key[:10]}...")
+                st.write(f"API Key length: {len(gemini.api_key)} characters")
+            st.write(f"Available models: {len(gemini.available_models)}")
             st.write(f".secrets/secrets.toml exists: {os.path.exists('.secrets/secrets.toml')}")
             st.write(f".streamlit/secrets.toml exists: {os.path.exists('.streamlit/secrets.toml')}")
     else:
         st.success("✅ API Configured Successfully")
-        if model:
-            st.info(f"Using model: {model.model_name}")
+        if gemini.model:
+            st.info(f"Using model: {gemini.model.model_name}")
+        speedup = gemini_client.speedup_summary()
+        if speedup:
+            st.caption(f"Model resolved in {speedup['resolve_seconds']:.2f}s; reruns reuse it in "
+                       f"{speedup['cached_lookup_seconds'] * 1000:.3f} ms "
+                       f"({speedup['seconds_saved']:.1f}s saved over {speedup['cached_lookups']} reruns)")
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -377,6 +566,7 @@ elif st.session_state.page == 'dashboard' and st.session_state.user:
         ])
         
         if st.button("🚪 Logout"):
+            st.session_state.output_archive.clear()
             st.session_state.user = None
             st.session_state.page = 'welcome'
             st.rerun()
@@ -394,144 +584,394 @@ elif st.session_state.page == 'dashboard' and st.session_state.user:
                 artist = st.text_input("Artist Name (Optional)", key="artist_input")
                 region = st.text_input("Cultural Region (Optional)", key="region_input")
                 damage = st.text_area("Damage Description", height=150, key="damage_input")
-                output_type = st.selectbox("Output Type", ["", "Restoration Technique", "Stylistic Reconstruction", "Symbol Interpretation", "Visitor Summary", "Conservation Advice"], key="output_input")
+                output_type = st.selectbox("Output Type", [""] + OUTPUT_TYPES + [ALL_OUTPUTS], key="output_input")
+                fan_out = st.multiselect(f"Output Types for \"{ALL_OUTPUTS}\"", OUTPUT_TYPES, default=OUTPUT_TYPES, key="fan_out_input")
+                regenerate = st.checkbox("Regenerate (skip cached answer)", key="regenerate_input")
                 
                 if st.form_submit_button("Generate Guidance", use_container_width=True):
                     if artwork_type and damage and output_type:
-                        prompt = f"""Artwork: {artwork_type}
-Period: {art_period}
-Artist: {artist}
-Region: {region}
-Damage: {damage}
-Output: {output_type}
-
-Provide detailed restoration guidance."""
-                        
-                        with st.spinner("Generating..."):
-                            response = generate_response(prompt, st.session_state.user)
-                            st.session_state.current_output = {
-                                'artwork': artwork_type, 'period': art_period,
-                                'damage': damage, 'output': output_type,
-                                'response': response, 'time': datetime.now()
-                            }
-                        st.rerun()
+                        st.session_state.pop('similar_offer', None)
+                        if output_type == ALL_OUTPUTS:
+                            # One job per output type, all running at once; each shows up as it finishes
+                            group = datetime.now().strftime('%Y%m%d%H%M%S%f')
+                            for each_type in fan_out or OUTPUT_TYPES:
+                                request = restoration_request(artwork_type, art_period, artist, region, damage, each_type, not regenerate, group)
+                                match = None
+                                if st.session_state.similar_mode == "Return automatically" and not regenerate:
+                                    match = similarity_index.get_index().best_match(
+                                        request['similar_text'], request['similar_scope'], st.session_state.similar_threshold)
+                                if match:
+                                    add_output(request_output(request, match[1]['response']))
+                                else:
+                                    submit_restoration(request)
+                        else:
+                            request = restoration_request(artwork_type, art_period, artist, region, damage, output_type, not regenerate)
+                            prefetch.get_model().record(st.session_state.user['email'], ' '.join([artwork_type, art_period, artist, region, damage]), output_type)
+                            match = None
+                            if st.session_state.similar_mode != "Off" and not regenerate:
+                                match = similarity_index.get_index().best_match(
+                                    request['similar_text'], request['similar_scope'], st.session_state.similar_threshold)
+                            
+                            if match and st.session_state.similar_mode == "Return automatically":
+                                add_output(request_output(request, match[1]['response']))
+                                st.session_state.similar_notice = f"♻️ Reused the answer to a {match[0]:.0%} similar earlier request"
+                            elif match:
+                                st.session_state.similar_offer = {'request': request, 'score': match[0], 'match': match[1]}
+                            else:
+                                # Runs in the background; the guidance panel polls for it
+                                submit_restoration(request)
+                            prefetch_next(request)
                     else:
                         st.error("Please fill in all required fields")
         
         with col2:
             st.markdown("<h2 style='color: #4A5D3F;'>AI-Generated Guidance</h2>", unsafe_allow_html=True)
             
-            if 'current_output' in st.session_state:
-                st.markdown(f"<p style='color: #2C3E50;'><strong>Time:</strong> {st.session_state.current_output['time'].strftime('%Y-%m-%d %H:%M')}</p>", unsafe_allow_html=True)
+            if 'similar_offer' in st.session_state:
+                offer = st.session_state.similar_offer
+                st.info(f"♻️ A {offer['score']:.0%} similar request was answered before: *{offer['match']['text'][:150]}*")
+                col_use, col_new = st.columns(2)
+                with col_use:
+                    if st.button("Use This Answer", use_container_width=True):
+                        request = st.session_state.pop('similar_offer')['request']
+                        add_output(request_output(request, offer['match']['response']))
+                        st.rerun()
+                with col_new:
+                    if st.button("Generate New", use_container_width=True):
+                        submit_restoration(st.session_state.pop('similar_offer')['request'])
+                        st.rerun()
+            
+            # Finished background jobs become outputs; errors are shown, never stored
+            executor = jobs.get_executor()
+            submitted_now = st.session_state.pop('jobs_submitted_now', None)
+            if submitted_now:
+                executor.wait(submitted_now, QUICK_RESULT_SECONDS)
+            for job_id in list(st.session_state.workspace_jobs):
+                job = executor.get(job_id)
+                if job is not None and job.pending:
+                    continue
+                st.session_state.workspace_jobs.remove(job_id)
+                if job is None:
+                    continue
+                if job.status == jobs.DONE:
+                    add_output(dict(request_output(job.meta['request'], job.result, datetime.fromtimestamp(job.finished)), job_id=job.id))
+                else:
+                    st.error(f"⚠️ {job.error}")
+            
+            if st.session_state.workspace_jobs:
+                poll_jobs(st.session_state.workspace_jobs)
+            
+            if 'similar_notice' in st.session_state:
+                st.caption(st.session_state.pop('similar_notice'))
+            
+            if st.session_state.workspace_outputs:
+                outputs = st.session_state.workspace_outputs
+                if len(outputs) > 1:
+                    st.selectbox("Show Result", range(len(outputs)), key="output_choice",
+                                 format_func=lambda i: f"{outputs[i].output} · {outputs[i].artwork} · {outputs[i].time.strftime('%H:%M:%S')}")
+                # The selected record itself, not a copy
+                st.session_state.current_output = current = outputs[min(st.session_state.get('output_choice', 0), len(outputs) - 1)]
+                response = current.response
+                st.markdown(f"<p style='color: #2C3E50;'><strong>Time:</strong> {current.time.strftime('%Y-%m-%d %H:%M')}</p>", unsafe_allow_html=True)
                 st.divider()
-                st.markdown(f"<div style='color: #2C3E50; background-color: white; padding: 20px; border-radius: 10px;'>{st.session_state.current_output['response']}</div>", unsafe_allow_html=True)
+                st.markdown(f"<div style='color: #2C3E50; background-color: white; padding: 20px; border-radius: 10px;'>{response}</div>", unsafe_allow_html=True)
                 
                 st.write("")  # spacing
                 col_a, col_b = st.columns(2)
                 with col_a:
                     if st.button("💾 Save", use_container_width=True):
-                        st.session_state.history.append(st.session_state.current_output)
+                        history_store.get_store().add(st.session_state.user['email'], current.to_dict())
+                        saved_job = jobs.get_executor().get(current.job_id)
+                        if saved_job:
+                            saved_job.meta['saved'] = True
                         st.success("Saved!")
                 
                 with col_b:
-                    text = f"""ArtRestorer AI Report
-Time: {st.session_state.current_output['time']}
-Artwork: {st.session_state.current_output['artwork']}
-Period: {st.session_state.current_output['period']}
-Damage: {st.session_state.current_output['damage']}
-
-{st.session_state.current_output['response']}"""
+                    text = export.report_text(current.to_dict())
                     st.download_button("📥 Export", text, f"restoration_{datetime.now().strftime('%Y%m%d')}.txt", use_container_width=True)
-            else:
+                
+                group = current.group
+                group_outputs = [o for o in outputs if group and o.group == group]
+                if len(group_outputs) > 1:
+                    st.download_button(f"📥 Full Report ({len(group_outputs)} sections)", full_report(group_outputs),
+                                       f"restoration_report_{datetime.now().strftime('%Y%m%d')}.txt", use_container_width=True)
+                
+                archive = st.session_state.output_archive
+                if len(archive):
+                    with st.expander(f"🗄️ Earlier Results ({len(archive)})"):
+                        st.caption(f"Only the newest {session_store.MAX_OUTPUTS} results stay in the workspace; older ones are kept here until you log out")
+                        archived = archive.records()
+                        chosen = archived[st.selectbox("Earlier Result", range(len(archived)), key="archive_choice",
+                                                       format_func=lambda i: f"{archived[i]['output']} · {archived[i]['artwork']} · {archived[i]['time'].strftime('%H:%M:%S')}")]
+                        st.markdown(f"<div style='color: #2C3E50; background-color: white; padding: 20px; border-radius: 10px;'>{chosen['response']}</div>", unsafe_allow_html=True)
+                        col_c, col_d = st.columns(2)
+                        with col_c:
+                            if st.button("💾 Save Earlier Result", use_container_width=True):
+                                history_store.get_store().add(st.session_state.user['email'], chosen)
+                                st.success("Saved!")
+                        with col_d:
+                            st.download_button("📥 Export Earlier Result", export.report_text(chosen),
+                                               f"restoration_{datetime.now().strftime('%Y%m%d')}.txt", use_container_width=True)
+            elif not st.session_state.workspace_jobs:
                 st.info("Fill the form and generate guidance")
+        
+        st.divider()
+        with st.expander("📦 Batch Mode - upload a CSV/JSONL catalogue"):
+            st.markdown("<p style='color: #2C3E50;'>One artwork per row with columns <strong>artwork_type, period, artist, region, damage, output_type</strong>. Re-running the same file resumes where it stopped.</p>", unsafe_allow_html=True)
+            uploaded = st.file_uploader("Catalogue File", type=["csv", "jsonl"], key="batch_upload")
+            col_w, col_r = st.columns(2)
+            with col_w:
+                workers = st.slider("Parallel Workers", 1, 16, 4, key="batch_workers")
+            with col_r:
+                rate = st.number_input("Max Calls per Minute (0 = no limit)", 0, 1000, 60, key="batch_rate")
+            
+            if uploaded:
+                batch_file = batch.results_path(BATCH_DIR, uploaded.getvalue(), st.session_state.user)
+                if st.button("▶️ Run Batch", use_container_width=True):
+                    rows = batch.read_rows(uploaded.getvalue(), name=uploaded.name)
+                    done_ids = batch.completed_ids(batch_file)
+                    todo = len([r for r in rows if r['id'] not in done_ids])
+                    progress = batch.BatchProgress(todo)
+                    bar = st.progress(0.0)
+                    status = st.empty()
+                    with batch.ResultWriter(batch_file) as writer:
+                        for result in batch.run_batch(rows, st.session_state.user, workers=workers,
+                                                      rate_per_minute=rate or None, skip_ids=done_ids):
+                            writer.write(result)
+                            progress.record(result)
+                            bar.progress(progress.done / todo)
+                            status.markdown(f"<p style='color: #2C3E50;'>{progress.done}/{todo} rows · {progress.failed} errors · {progress.rows_per_minute:.1f} rows/min</p>", unsafe_allow_html=True)
+                            if result['error']:
+                                st.warning(f"Row {result['id']}: {result['error']}")
+                    if todo == 0:
+                        st.success("All rows were already completed")
+                
+                results = batch.load_results(batch_file)
+                if results:
+                    failed = len([r for r in results if r['error']])
+                    st.markdown(f"<p style='color: #2C3E50;'><strong>{len(results)}</strong> rows processed, <strong>{failed}</strong> with errors</p>", unsafe_allow_html=True)
+                    col_j, col_c = st.columns(2)
+                    with col_j:
+                        st.download_button("📥 Results (JSONL)", batch.results_to_jsonl(results), f"restoration_batch_{datetime.now().strftime('%Y%m%d')}.jsonl", use_container_width=True)
+                    with col_c:
+                        st.download_button("📥 Results (CSV)", batch.results_to_csv(results), f"restoration_batch_{datetime.now().strftime('%Y%m%d')}.csv", use_container_width=True)
     
     # AI CHATBOT
     elif menu == "💬 AI Chatbot":
         st.markdown("<h1 style='color: #4A5D3F;'>AI Chatbot</h1>", unsafe_allow_html=True)
         
-        if not st.session_state.chat_messages:
-            st.session_state.chat_messages = [{
-                "role": "assistant",
-                "content": f"Hello {st.session_state.user['name']}! I'm your AI assistant for art restoration. How can I help?"
-            }]
-        
-        for msg in st.session_state.chat_messages:
-            with st.chat_message(msg["role"]):
-                st.markdown(f"<p style='color: #2C3E50;'>{msg['content']}</p>", unsafe_allow_html=True)
-        
-        if prompt := st.chat_input("Ask about art restoration..."):
-            st.session_state.chat_messages.append({"role": "user", "content": prompt})
-            with st.chat_message("user"):
-                st.markdown(f"<p style='color: #2C3E50;'>{prompt}</p>", unsafe_allow_html=True)
-            
-            with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    response = generate_response(f"Art restoration question: {prompt}", st.session_state.user)
-                    st.markdown(f"<p style='color: #2C3E50;'>{response}</p>", unsafe_allow_html=True)
-            
-            st.session_state.chat_messages.append({"role": "assistant", "content": response})
+        chat_panel()
     
     # ART GUIDE
     elif menu == "📚 Art Guide":
         st.markdown("<h1 style='color: #4A5D3F;'>Art Guide</h1>", unsafe_allow_html=True)
         
-        with st.expander("🎨 Major Art Periods", expanded=True):
-            st.markdown("""
-            <div style='color: #2C3E50;'>
-            <strong>Ancient (3000 BCE - 400 CE):</strong> Egyptian, Greek, Roman<br><br>
-            <strong>Medieval (400 - 1400):</strong> Byzantine, Romanesque, Gothic<br><br>
-            <strong>Renaissance (1400 - 1600):</strong> Linear perspective, naturalism, humanism<br><br>
-            <strong>Baroque (1600 - 1750):</strong> Drama, movement, rich color<br><br>
-            <strong>Modern (1850 - 1970):</strong> Impressionism, Expressionism, Cubism, Abstract<br><br>
-            <strong>Contemporary (1970 - Present):</strong> Diverse movements, new media
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with st.expander("🔧 Common Damage Types"):
-            st.markdown("""
-            <div style='color: #2C3E50;'>
-            • <strong>Paint Layer Damage:</strong> Cracking, flaking, blistering<br>
-            • <strong>Canvas Issues:</strong> Tears, punctures, sagging<br>
-            • <strong>Environmental:</strong> Water stains, mold growth<br>
-            • <strong>Chemical:</strong> Darkened varnish, oxidation<br>
-            • <strong>Physical:</strong> Scratches, broken fragments
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with st.expander("⚖️ Ethical Principles"):
-            st.markdown("""
-            <div style='color: #2C3E50;'>
-            • Respect for Authenticity<br>
-            • Minimal Intervention<br>
-            • Reversibility<br>
-            • Documentation<br>
-            • Cultural Sensitivity<br>
-            • Professional Competence
-            </div>
-            """, unsafe_allow_html=True)
+        for i, section in enumerate(knowledge_base.GUIDE_SECTIONS):
+            with st.expander(section['title'], expanded=i == 0):
+                if section['style'] == 'paragraphs':
+                    body = "<br><br>".join(f"<strong>{name}:</strong> {description}" for name, description in section['entries'])
+                else:
+                    body = "<br>".join(f"• <strong>{name}:</strong> {description}" if description else f"• {name}"
+                                       for name, description in section['entries'])
+                st.markdown(f"<div style='color: #2C3E50;'>{body}</div>", unsafe_allow_html=True)
+        
+        kb = knowledge_base.get_knowledge_base()
+        st.markdown("<h3 style='color: #4A5D3F;'>🔎 Search the Guide</h3>", unsafe_allow_html=True)
+        guide_query = st.text_input("Periods, damage types, principles or your reference documents", key="guide_query")
+        if guide_query.strip():
+            # Answered from the local index; no model call
+            start = time.perf_counter()
+            results = kb.search(guide_query, k=5, user=st.session_state.user['email'])
+            elapsed = time.perf_counter() - start
+            if results:
+                for score, passage in results:
+                    st.markdown(f"<div style='color: #2C3E50; background-color: white; padding: 12px; border-radius: 10px; margin-bottom: 8px;'>"
+                                f"<strong>{passage['source']}</strong><br>{passage['text']}</div>", unsafe_allow_html=True)
+            else:
+                st.info("Nothing in the guide or your documents matches that")
+            st.caption(f"{len(results)} passages in {elapsed * 1000:.1f} ms · offline")
+        
+        with st.expander("📄 Reference Documents"):
+            st.markdown("<p style='color: #2C3E50;'>Text or Markdown documents added here are searched above and "
+                        "quoted in your restoration prompts when they match the artwork and damage. Only you see the documents you add.</p>", unsafe_allow_html=True)
+            uploaded = st.file_uploader("Add a document", type=["txt", "md"], key="knowledge_upload")
+            if uploaded is not None and st.button("Add to Knowledge Base"):
+                name = kb.add_document(uploaded.name, uploaded.getvalue().decode('utf-8', errors='replace'),
+                                       st.session_state.user['email'])
+                if name == os.path.basename(uploaded.name):
+                    st.success(f"Added {name}")
+                else:
+                    st.success(f"Added as {name}; a document named {uploaded.name} already exists")
+            email = st.session_state.user['email']
+            for name in kb.documents(email):
+                col_n, col_r = st.columns([3, 1])
+                with col_n:
+                    st.markdown(f"<p style='color: #2C3E50;'>{name}</p>", unsafe_allow_html=True)
+                with col_r:
+                    # Shared documents are listed for everyone but only removed by an admin
+                    if kb.can_remove(name, email) and st.button("Remove", key=f"kb_remove_{name}", use_container_width=True):
+                        try:
+                            kb.remove_document(name, email)
+                        except PermissionError as e:
+                            st.error(str(e))
+                        else:
+                            st.rerun()
+            stats = kb.stats()
+            query_stats = metrics.latency_by('op', metrics.knowledge_seconds).get('query')
+            st.caption(f"{stats['passages']} passages · {stats['terms']} terms · index built in {stats['build_seconds'] * 1000:.1f} ms"
+                       + (f" · median query {query_stats['p50'] * 1000:.2f} ms" if query_stats else ""))
     
     # HISTORY
     elif menu == "📋 History":
         st.markdown("<h1 style='color: #4A5D3F;'>Saved History</h1>", unsafe_allow_html=True)
         
+        store = history_store.get_store()
+        user_email = st.session_state.user['email']
+        saved_count = store.count(user_email)
+        
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Saved Records", len(st.session_state.history))
+            st.metric("Saved Records", saved_count)
         with col2:
             st.metric("Chat Messages", len(st.session_state.chat_messages))
         with col3:
-            st.metric("Total", len(st.session_state.history) + len(st.session_state.chat_messages))
+            st.metric("Total", saved_count + len(st.session_state.chat_messages))
+        
+        # Restoration jobs from any of this user's sessions, including ones left running
+        recent_jobs = jobs.get_executor().for_owner(user_email, 'restoration')[:HISTORY_PAGE_SIZE]
+        if recent_jobs:
+            with st.expander(f"⏳ Background Jobs ({len([j for j in recent_jobs if j.pending])} running)", expanded=any(j.pending for j in recent_jobs)):
+                running = [j.id for j in recent_jobs if j.pending]
+                if running:
+                    poll_jobs(running)
+                for job in recent_jobs:
+                    if job.status == jobs.DONE:
+                        col_l, col_s = st.columns([3, 1])
+                        with col_l:
+                            st.markdown(f"<p style='color: #2C3E50;'>✅ {job.meta['label']} · {datetime.fromtimestamp(job.finished).strftime('%H:%M:%S')}</p>", unsafe_allow_html=True)
+                        with col_s:
+                            if job.meta.get('saved'):
+                                st.caption("Saved")
+                            elif st.button("💾 Save", key=f"save_job_{job.id}", use_container_width=True):
+                                request = job.meta['request']
+                                store.add(user_email, {
+                                    'artwork': request['artwork'], 'period': request['period'],
+                                    'damage': request['damage'], 'output': request['output'],
+                                    'response': job.result, 'time': datetime.fromtimestamp(job.finished)
+                                })
+                                job.meta['saved'] = True
+                                st.rerun()
+                    elif job.status == jobs.FAILED:
+                        st.markdown(f"<p style='color: #2C3E50;'>⚠️ {job.meta['label']}: {job.error[:200]}</p>", unsafe_allow_html=True)
+        
+        with st.expander("📊 Performance Metrics"):
+            latency = metrics.latency_by('output_type', kind='restoration')
+            if latency:
+                st.markdown("<p style='color: #2C3E50;'><strong>Generation latency by output type</strong></p>", unsafe_allow_html=True)
+                st.dataframe([
+                    {'Output Type': name or '(unspecified)', 'Requests': s['count'],
+                     'Mean (s)': round(s['mean'], 2), 'p50 (s)': round(s['p50'], 2), 'p95 (s)': round(s['p95'], 2)}
+                    for name, s in sorted(latency.items())
+                ], use_container_width=True, hide_index=True)
+            else:
+                st.info("No generation requests yet in this server process")
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                cache_status = metrics.totals(metrics.generate_requests, 'cache')
+                st.metric("Cache Hits", cache_status.get('hit', 0))
+                st.caption(f"{cache_status.get('miss', 0)} misses · {cache_status.get('bypass', 0)} regenerated · "
+                           f"{cache_status.get('coalesced', 0)} shared an in-flight call")
+            with col2:
+                errors = metrics.totals(metrics.generation_errors, 'error')
+                st.metric("Errors", sum(errors.values()))
+                if errors:
+                    st.caption(" · ".join(f"{name}: {n}" for name, n in sorted(errors.items())))
+            with col3:
+                directions = metrics.totals(metrics.tokens, 'direction')
+                st.metric("Tokens", directions.get('prompt', 0) + directions.get('output', 0))
+                st.caption(f"{directions.get('prompt', 0)} prompt · {directions.get('output', 0)} output · "
+                           f"{directions.get('cached', 0)} prompt tokens from cached content")
+            
+            saved = metrics.latency_by('kind', metrics.prompt_tokens_saved)
+            if directions.get('cached'):
+                st.caption("Prompt tokens saved per model call by cached context: " +
+                           " · ".join(f"{kind} {s['mean']:.0f}" for kind, s in sorted(saved.items())))
+            
+            by_experience = metrics.totals(metrics.tokens, 'experience')
+            if by_experience:
+                st.caption("Tokens by experience level: " + " · ".join(f"{name}: {n}" for name, n in sorted(by_experience.items())))
+            
+            st.download_button("Download Prometheus Metrics", metrics.render_prometheus(),
+                               file_name="artrestorer_metrics.txt", mime="text/plain")
         
         st.divider()
         
-        if st.session_state.history:
-            for i, record in enumerate(reversed(st.session_state.history)):
-                with st.expander(f"{record['artwork']} - {record['time'].strftime('%Y-%m-%d %H:%M')}"):
+        artworks, outputs = store.facets(user_email)
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            search = st.text_input("Search damage and guidance text", key="history_search")
+        with col2:
+            artwork_filter = st.selectbox("Artwork Type", ["All"] + artworks, key="history_artwork")
+        with col3:
+            output_filter = st.selectbox("Output Type", ["All"] + outputs, key="history_output")
+        
+        filters = {
+            'artwork': None if artwork_filter == "All" else artwork_filter,
+            'output': None if output_filter == "All" else output_filter,
+            'query': search,
+        }
+        # Back to the first page whenever the filters change
+        if st.session_state.get('history_filters') != filters:
+            st.session_state.history_filters = filters
+            st.session_state.history_page = 0
+        
+        matching = store.count(user_email, **filters)
+        pages = max(1, (matching + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+        st.session_state.history_page = min(st.session_state.history_page, pages - 1)
+        records = store.page(user_email, st.session_state.history_page, HISTORY_PAGE_SIZE, **filters)
+        
+        if records:
+            for record in records:
+                with st.expander(f"{record['artwork']} - {record['output']} - {record['time'].strftime('%Y-%m-%d %H:%M')}"):
                     st.markdown(f"<p style='color: #2C3E50;'><strong>Period:</strong> {record['period']}</p>", unsafe_allow_html=True)
                     st.markdown(f"<p style='color: #2C3E50;'><strong>Damage:</strong> {record['damage'][:100]}...</p>", unsafe_allow_html=True)
-                    if st.button("Delete", key=f"del_{i}"):
-                        st.session_state.history.pop(-(i+1))
+                    st.markdown(f"<div style='color: #2C3E50; background-color: white; padding: 20px; border-radius: 10px;'>{record['response']}</div>", unsafe_allow_html=True)
+                    if st.button("Delete", key=f"del_{record['id']}"):
+                        store.delete(user_email, record['id'])
                         st.rerun()
+            
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("← Newer", disabled=st.session_state.history_page == 0, use_container_width=True):
+                    st.session_state.history_page -= 1
+                    st.rerun()
+            with col2:
+                st.markdown(f"<p style='color: #2C3E50; text-align: center;'>Page {st.session_state.history_page + 1} of {pages} · {matching} records</p>", unsafe_allow_html=True)
+            with col3:
+                if st.button("Older →", disabled=st.session_state.history_page >= pages - 1, use_container_width=True):
+                    st.session_state.history_page += 1
+                    st.rerun()
+            
+            with st.expander("📦 Export History"):
+                export_formats = {'jsonl': "JSONL", 'csv': "CSV", 'zip-md': "ZIP of Markdown reports", 'zip-txt': "ZIP of text reports"}
+                col_f, col_s = st.columns(2)
+                with col_f:
+                    export_format = st.radio("Format", list(export_formats), format_func=export_formats.get, key="export_format")
+                with col_s:
+                    filtered_only = st.checkbox("Only records matching the filters", value=True, key="export_filtered")
+                export_filters = filters if filtered_only else {}
+                export_count = matching if filtered_only else saved_count
+                
+                def export_data(email=user_email, fmt=export_format, chosen=dict(export_filters)):
+                    # Only runs when the button is clicked; records are streamed from SQLite in batches
+                    return export.to_file(export.iter_export(store.iter_records(email, **chosen), fmt))
+                
+                st.download_button(f"📥 Export {export_count} Records", export_data,
+                                   export.export_filename(export_format, datetime.now().strftime('%Y%m%d')),
+                                   mime=export.FORMATS[export_format][0], use_container_width=True)
+        elif saved_count:
+            st.info("No saved records match these filters")
         else:
             st.info("No saved records yet")
     
@@ -555,6 +995,68 @@ Damage: {st.session_state.current_output['damage']}
                     'creativity': creativity, 'length': length, 'tone': tone
                 })
                 st.success("Settings saved!")
+        
+        st.session_state.stream_responses = st.toggle("Stream responses as they are generated", st.session_state.stream_responses)
+        st.session_state.prefetch_next = st.toggle("Prepare the output type usually requested next in the background", st.session_state.prefetch_next)
+        
+        transcript = st.session_state.chat_messages
+        session_bytes = session_store.deep_size({key: st.session_state[key] for key in st.session_state})
+        st.caption(f"This session holds {session_bytes / 1024:.0f} KiB: {len(st.session_state.workspace_outputs)} of "
+                   f"{session_store.MAX_OUTPUTS} workspace results ({len(st.session_state.output_archive)} older ones on disk), "
+                   f"{len(transcript) - transcript.spilled} chat messages "
+                   f"in memory and {transcript.spilled} older ones on disk")
+        
+        st.markdown("<h3 style='color: #4A5D3F;'>Response Cache</h3>", unsafe_allow_html=True)
+        similar_modes = ["Off", "Offer", "Return automatically"]
+        st.session_state.similar_mode = st.radio("Answers to near-duplicate requests", similar_modes,
+                                                 index=similar_modes.index(st.session_state.similar_mode), horizontal=True)
+        st.session_state.similar_threshold = st.slider("Similarity threshold", 0.5, 1.0, st.session_state.similar_threshold, 0.01)
+        index_stats = similarity_index.get_index().stats()
+        st.caption(f"{index_stats['entries']} past requests indexed for similarity lookup")
+        
+        cache_stats = response_cache.get_cache().stats()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Cache Hits", cache_stats['hits'])
+        with col2:
+            st.metric("Cache Misses", cache_stats['misses'])
+        with col3:
+            st.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+        with col4:
+            st.metric("Stored Answers", cache_stats['disk_entries'])
+        if st.button("Clear Cache"):
+            response_cache.get_cache().clear()
+            st.rerun()
+        
+        st.markdown("<h3 style='color: #4A5D3F;'>API Quota</h3>", unsafe_allow_html=True)
+        quota = scheduler.get_scheduler().stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Requests Admitted", quota['admitted'])
+        with col2:
+            st.metric("Had to Wait", quota['had_to_wait'])
+        with col3:
+            st.metric("Queued Now", sum(quota['queued'].values()))
+        st.caption(f"Shared limit: {quota['requests_per_minute']:.0f} requests and {quota['tokens_per_minute']:.0f} tokens per minute · "
+                   f"{quota['user_requests_per_minute']:.0f} requests per minute per user · chat is served before workspace, then batch")
+        
+        # Not current(): the page shouldn't wait for a discovery still in progress
+        config = gemini_client.peek()
+        if config and config.model:
+            st.markdown("<h3 style='color: #4A5D3F;'>Model Routing</h3>", unsafe_allow_html=True)
+            st.markdown("<p style='color: #2C3E50;'>How your Creativity and Output Length settings are sent to the model, and which model answers each output type based on measured response times.</p>", unsafe_allow_html=True)
+            rows = []
+            for route in OUTPUT_TYPES + ['chat']:
+                plan = router.plan(config, st.session_state.user, route)
+                rows.append({
+                    'Output': route if route != 'chat' else 'AI Chatbot',
+                    'Model': plan.model_name.split('/')[-1],
+                    'Temperature': plan.generation_config['temperature'],
+                    'Max Tokens': plan.generation_config['max_output_tokens'],
+                    'Measured (s)': None if plan.estimate is None else round(plan.estimate, 1),
+                    'Target (s)': plan.target_seconds,
+                })
+            st.dataframe(rows, use_container_width=True, hide_index=True)
     
     # ETHICS
     elif menu == "⚖️ Ethics":
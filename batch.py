@@ -0,0 +1,214 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import response_cache
+import scheduler
+from generation import GenerationError, build_restoration_prompt, generate_response
+
+FIELDS = ['artwork_type', 'period', 'artist', 'region', 'damage', 'output_type']
+REQUIRED_FIELDS = ['artwork_type', 'damage', 'output_type']
+RESULT_FIELDS = ['id'] + FIELDS + ['response', 'error', 'seconds']
+
+# Column names people tend to use in catalogue exports
+ALIASES = {
+    'artwork': 'artwork_type', 'type': 'artwork_type',
+    'art_period': 'period', 'style': 'period',
+    'artist_name': 'artist',
+    'cultural_region': 'region',
+    'damage_description': 'damage',
+    'output': 'output_type',
+}
+
+
+def normalize_row(raw, index):
+    row = {}
+    for k, v in raw.items():
+        if k is None:
+            continue
+        key = k.strip().lower().replace(' ', '_')
+        key = ALIASES.get(key, key)
+        row[key] = '' if v is None else str(v).strip()
+    row['id'] = row.get('id') or str(index)
+    for field in FIELDS:
+        row.setdefault(field, '')
+    return row
+
+
+def read_rows(data, fmt=None, name=''):
+    """Parse a CSV or JSONL upload (text or bytes) into normalized rows."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if fmt is None:
+        fmt = 'jsonl' if name.lower().endswith(('.jsonl', '.json')) else 'csv'
+
+    if fmt == 'jsonl':
+        raw_rows = [json.loads(line) for line in data.splitlines() if line.strip()]
+    else:
+        raw_rows = list(csv.DictReader(io.StringIO(data)))
+    return [normalize_row(raw, i + 1) for i, raw in enumerate(raw_rows)]
+
+
+def missing_fields(row):
+    return [f for f in REQUIRED_FIELDS if not row.get(f)]
+
+
+class RateLimiter:
+    """Spaces out call starts so no more than `per_minute` begin each minute."""
+
+    def __init__(self, per_minute=None):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class BatchProgress:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def record(self, result):
+        self.done += 1
+        if result['error']:
+            self.failed += 1
+
+    @property
+    def rows_per_minute(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed * 60 if elapsed > 0 else 0.0
+
+
+def _process(row, user_profile, limiter, generate, use_cache):
+    result = {f: row.get(f, '') for f in RESULT_FIELDS}
+    result['response'] = ''
+    result['error'] = ''
+    start = time.monotonic()
+
+    missing = missing_fields(row)
+    if missing:
+        result['error'] = f"Missing required fields: {', '.join(missing)}"
+    else:
+        limiter.wait()
+        try:
+            prompt = build_restoration_prompt(row['artwork_type'], row['period'], row['artist'],
+                                              row['region'], row['damage'], row['output_type'],
+                                              user_profile.get('email'))
+            result['response'] = generate(prompt, user_profile, use_cache=use_cache, output_type=row['output_type'],
+                                          priority=scheduler.BATCH)
+        except GenerationError as e:
+            result['error'] = f"{e.__class__.__name__}: {str(e)}"
+        except Exception as e:
+            result['error'] = f"Error generating response: {str(e)}"
+
+    result['seconds'] = round(time.monotonic() - start, 3)
+    return result
+
+
+def run_batch(rows, user_profile, workers=4, rate_per_minute=None, skip_ids=(),
+              generate=generate_response, use_cache=True):
+    """Yield one result dict per row, in completion order."""
+    limiter = RateLimiter(rate_per_minute)
+    skip_ids = set(skip_ids)
+    pending = [row for row in rows if row['id'] not in skip_ids]
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = [pool.submit(_process, row, user_profile, limiter, generate, use_cache) for row in pending]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Stop queued rows if the caller goes away (e.g. the page reruns)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ResultWriter:
+    """Appends results to a JSONL or CSV file as soon as they finish."""
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._csv = None
+        if self.fmt == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, result):
+        if self._csv is not None:
+            self._csv.writerow(result)
+        else:
+            self._file.write(json.dumps(result, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_results(path):
+    """Latest result per row ID from an output file (later lines win)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            results = list(csv.DictReader(f))
+        else:
+            results = [json.loads(line) for line in f if line.strip()]
+    latest = {}
+    for r in results:
+        latest[str(r['id'])] = r
+    return list(latest.values())
+
+
+def completed_ids(path):
+    """IDs that already have a successful result in an earlier output file."""
+    return {str(r['id']) for r in load_results(path) if not r.get('error')}
+
+
+def results_path(directory, data, user_profile):
+    """Results file for one user's run of an uploaded catalogue with their current settings.
+
+    A resumed run only reuses rows written for the same user and profile, never
+    another user's answers to the same file.
+    """
+    profile = {f: user_profile.get(f, response_cache.PROFILE_DEFAULTS[f]) for f in response_cache.PROFILE_FIELDS}
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps([user_profile.get('email'), profile], sort_keys=True).encode('utf-8'))
+    return os.path.join(directory, digest.hexdigest()[:16] + ".jsonl")
+
+
+def results_to_csv(results):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+    return buffer.getvalue()
+
+
+def results_to_jsonl(results):
+    return ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in results)
@@ -0,0 +1,54 @@
+"""Generate restoration guidance for a whole catalogue without the web UI.
+
+    python batch_restore.py catalogue.csv results.jsonl --workers 8 --rate 60
+
+Rows need artwork_type, damage and output_type; period, artist and region are
+optional. Re-running with the same output file skips rows that already
+succeeded, so an interrupted run can simply be started again.
+"""
+import argparse
+import sys
+
+import batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch restoration guidance from a CSV/JSONL catalogue")
+    parser.add_argument("input", help="CSV or JSONL file with one artwork per row")
+    parser.add_argument("output", help="JSONL or CSV file that results are appended to")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent model calls")
+    parser.add_argument("--rate", type=float, default=None, help="max calls started per minute")
+    parser.add_argument("--no-resume", action="store_true", help="process every row even if already in output")
+    parser.add_argument("--no-cache", action="store_true", help="skip cached answers")
+    parser.add_argument("--experience", default="intermediate", choices=["beginner", "intermediate", "advanced"])
+    parser.add_argument("--tone", default="academic", choices=["academic", "simplified"])
+    parser.add_argument("--creativity", type=int, default=5)
+    parser.add_argument("--length", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with open(args.input, encoding="utf-8-sig") as f:
+        rows = batch.read_rows(f.read(), name=args.input)
+
+    profile = {'experience': args.experience, 'tone': args.tone,
+               'creativity': args.creativity, 'length': args.length}
+    skip = set() if args.no_resume else batch.completed_ids(args.output)
+    todo = len([r for r in rows if r['id'] not in skip])
+    print(f"{len(rows)} rows, {len(rows) - todo} already done, {todo} to process", file=sys.stderr)
+
+    progress = batch.BatchProgress(todo)
+    with batch.ResultWriter(args.output) as writer:
+        for result in batch.run_batch(rows, profile, workers=args.workers, rate_per_minute=args.rate,
+                                      skip_ids=skip, use_cache=not args.no_cache):
+            writer.write(result)
+            progress.record(result)
+            status = f"ERROR {result['error'][:80]}" if result['error'] else "ok"
+            print(f"[{progress.done}/{todo}] row {result['id']}: {status} "
+                  f"({progress.rows_per_minute:.1f} rows/min)", file=sys.stderr)
+
+    print(f"Finished {progress.done} rows, {progress.failed} failed, "
+          f"{progress.rows_per_minute:.1f} rows/min", file=sys.stderr)
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,540 @@
+"""Benchmark the app against the local stand-in Gemini model (no API quota used).
+
+    python benchmark.py --out bench.json
+    python benchmark.py --out new.json --compare bench.json   # exit 1 on regressions
+    python benchmark.py --cold-start-only --cold-start-budget 3  # exit 1 if a fresh process renders slower
+
+The fake model's latency, token rate, error rate and streaming can be set on
+the command line. Caches, history and the similarity index go to a
+temporary directory so runs don't touch (or benefit from) local data.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Metrics where a bigger number is better; everything else is a cost
+HIGHER_IS_BETTER = ('throughput_rps', 'saved_per_call')
+
+# Run in a fresh interpreter: how long until the welcome page has rendered
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+rendered = time.perf_counter()
+print(json.dumps({'streamlit_import_seconds': imported - start, 'first_render_seconds': rendered - imported,
+                  'sdk_loaded': 'google.generativeai' in sys.modules, 'errors': len(at.exception)}))
+"""
+# Top-level modules listed in the import breakdown
+IMPORT_BREAKDOWN_TOP = 12
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values):
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': statistics.fmean(values) if values else 0.0,
+        'n': len(values),
+    }
+
+
+def configure_environment(args, workdir):
+    os.environ['ARTRESTORER_FAKE_MODEL'] = '1'
+    os.environ['ARTRESTORER_FAKE_LATENCY'] = str(args.latency)
+    os.environ['ARTRESTORER_FAKE_TOKEN_RATE'] = str(args.token_rate)
+    os.environ['ARTRESTORER_FAKE_ERROR_RATE'] = str(args.error_rate)
+    os.environ['ARTRESTORER_CACHE_PATH'] = os.path.join(workdir, 'responses.sqlite3')
+    os.environ['ARTRESTORER_HISTORY_PATH'] = os.path.join(workdir, 'history.sqlite3')
+    os.environ['ARTRESTORER_SIMILARITY_DIR'] = os.path.join(workdir, 'similarity')
+    os.environ['ARTRESTORER_KNOWLEDGE_DIR'] = os.path.join(workdir, 'knowledge')
+    os.environ['ARTRESTORER_SESSION_DIR'] = os.path.join(workdir, 'sessions')
+    os.environ['ARTRESTORER_LATENCY_PATH'] = os.path.join(workdir, 'model_latency.json')
+    # Keep retries quick so error-rate runs measure the app, not the sleep
+    os.environ.setdefault('ARTRESTORER_BACKOFF_BASE', '0.05')
+    # No API quota to protect here; the scheduler still runs, just never holds requests back
+    os.environ.setdefault('ARTRESTORER_REQUESTS_PER_MINUTE', '0')
+    os.environ.setdefault('ARTRESTORER_TOKENS_PER_MINUTE', '0')
+    os.environ.setdefault('ARTRESTORER_USER_REQUESTS_PER_MINUTE', '0')
+
+
+def timed_run(element_or_app, timings, flow):
+    start = time.perf_counter()
+    element_or_app.run()
+    timings.setdefault(flow, []).append(time.perf_counter() - start)
+
+
+def timed_until_done(at, timings, flow, busy):
+    """Time a submit plus the polling reruns until its background job has finished."""
+    start = time.perf_counter()
+    at.run()
+    while busy(at):
+        time.sleep(0.02)
+        at.run()
+    timings.setdefault(flow, []).append(time.perf_counter() - start)
+
+
+def run_session(AppTest, index, stream, timings):
+    """Drive one user through welcome, login, workspace, chatbot and history."""
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    timed_run(at, timings, 'welcome')
+    at.button[0].click()
+    timed_run(at, timings, 'welcome_to_login')
+    at.text_input(key="name_input").input(f"Bench User {index}")
+    at.text_input(key="email_input").input(f"bench{index}@example.com")
+    at.button[0].click()
+    timed_run(at, timings, 'login')
+    at.session_state.stream_responses = stream
+
+    at.selectbox(key="artwork_input").select("Painting")
+    at.text_input(key="period_input").input("Baroque")
+    at.text_area(key="damage_input").input(f"Flaking paint and darkened varnish, sample {index}")
+    at.selectbox(key="output_input").select("Conservation Advice")
+    at.checkbox(key="regenerate_input").check()
+    at.button[0].click()
+    timed_until_done(at, timings, 'workspace_generate', lambda a: a.session_state.workspace_jobs)
+    timed_run(at, timings, 'workspace_rerun')
+
+    at.radio[0].set_value("💬 AI Chatbot")
+    timed_run(at, timings, 'chatbot_open')
+    at.chat_input[0].set_value(f"How should I clean a gilded frame? ({index})")
+    timed_until_done(at, timings, 'chatbot_message', lambda a: a.session_state.chat_job)
+    # A long conversation should rerender as fast as a short one
+    transcript = at.session_state.chat_messages
+    for i in range(200):
+        transcript.append("user" if i % 2 else "assistant", f"Earlier turn {i} about consolidating flaking paint. " * 8)
+    timed_run(at, timings, 'chatbot_long_rerun')
+
+    at.radio[0].set_value("📋 History")
+    timed_run(at, timings, 'history')
+    return at
+
+
+def bench_reruns(args):
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    memory = []
+    sessions = []
+    for i in range(args.iterations):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        at = run_session(AppTest, i, not args.no_stream, timings)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        memory.append(after - before)
+        sessions.append(at)
+        exceptions = list(at.exception)
+        if exceptions:
+            raise RuntimeError(f"App raised during benchmark: {exceptions[0].value}")
+    return {flow: summarize(values) for flow, values in timings.items()}, summarize(memory)
+
+
+def bench_generation(args):
+    import generation
+    from resilience import GenerationError
+
+    profile = {'experience': 'intermediate', 'tone': 'academic', 'creativity': 5, 'length': 5}
+    latencies = []
+    first_chunk = []
+    errors = 0
+    for i in range(args.calls):
+        prompt = generation.build_restoration_prompt("Painting", "Baroque", "", "", f"Flaking paint {i}", "Visitor Summary")
+        start = time.perf_counter()
+        try:
+            if args.no_stream:
+                generation.generate_response(prompt, profile, use_cache=False)
+            else:
+                for n, chunk in enumerate(generation.stream_response(prompt, profile, use_cache=False)):
+                    if n == 0:
+                        first_chunk.append(time.perf_counter() - start)
+        except GenerationError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    result = {'latency': summarize(latencies), 'errors': errors}
+    if first_chunk:
+        result['time_to_first_chunk'] = summarize(first_chunk)
+    return result
+
+
+def bench_throughput(args):
+    import generation
+    from resilience import GenerationError
+
+    profile = {'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+    deadline = time.perf_counter() + args.duration
+    completed = [0] * args.sessions
+    errors = [0] * args.sessions
+
+    def session(n):
+        i = 0
+        while time.perf_counter() < deadline:
+            prompt = generation.build_restoration_prompt("Mural", "", "", "", f"Water stain {n}-{i}", "Visitor Summary")
+            try:
+                generation.generate_response(prompt, profile, use_cache=False)
+                completed[n] += 1
+            except GenerationError:
+                errors[n] += 1
+            i += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(args.sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'sessions': args.sessions,
+        'requests': sum(completed),
+        'errors': sum(errors),
+        'throughput_rps': sum(completed) / elapsed if elapsed else 0.0,
+    }
+
+
+def bench_api(args):
+    """Requests per second and latency through the HTTP API, one keep-alive connection per client."""
+    import http.client
+
+    import api
+
+    server = api.make_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    deadline = time.perf_counter() + args.duration
+    latencies = [[] for _ in range(args.sessions)]
+    errors = [0] * args.sessions
+
+    def client(n):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        i = 0
+        while time.perf_counter() < deadline:
+            body = json.dumps({'artwork_type': 'Textile', 'damage': f"Moth damage {n}-{i}",
+                               'output_type': 'Visitor Summary', 'use_cache': False})
+            start = time.perf_counter()
+            conn.request('POST', '/v1/generate', body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                latencies[n].append(time.perf_counter() - start)
+            else:
+                errors[n] += 1
+            i += 1
+        conn.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+    done = [value for values in latencies for value in values]
+    return {
+        'latency': summarize(done),
+        'errors': sum(errors),
+        'throughput_rps': len(done) / elapsed if elapsed else 0.0,
+    }
+
+
+def bench_knowledge(args):
+    """Index build and query times for the guide plus a synthetic document collection."""
+    import knowledge_base
+
+    words = ["canvas", "varnish", "pigment", "gilding", "fresco", "panel", "mould", "tear", "flaking", "lining",
+             "consolidation", "retouching", "solvent", "humidity", "ultramarine", "tempera", "gesso", "crack"]
+    passages = knowledge_base.guide_passages()
+    for i in range(args.documents * 10):
+        text = " ".join(words[(i * 7 + j * 3) % len(words)] for j in range(knowledge_base.PASSAGE_WORDS))
+        passages.append({'source': f"doc{i // 10}.md", 'title': f"doc{i // 10}.md #{i % 10 + 1}", 'text': text})
+    index = knowledge_base.BM25Index(passages)
+    queries = [f"{words[i % len(words)]} {words[(i * 5) % len(words)]} water stains" for i in range(args.calls)]
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, knowledge_base.PROMPT_PASSAGES)
+        timings.append(time.perf_counter() - start)
+    return {'passages': len(passages), 'build_seconds': index.build_seconds, 'query': summarize(timings)}
+
+
+def bench_session_storage(args):
+    """Bytes a full session's results and chat take as plain dicts vs. the compact session store."""
+    import random
+    from datetime import datetime
+
+    import session_store
+
+    rng = random.Random(0)
+    vocabulary = ("consolidate the paint layer with a reversible adhesive before any cleaning; document losses, "
+                  "test solvents on a small area, stabilise humidity, avoid overpainting original material").split()
+
+    def answer(n):
+        return " ".join(rng.choice(vocabulary) for _ in range(n))
+
+    responses = [answer(600) for _ in range(session_store.MAX_OUTPUTS)]
+    chat = [("user" if i % 2 else "assistant", answer(40 if i % 2 else 250)) for i in range(args.chat_messages)]
+
+    plain_outputs = [{'artwork': 'Painting', 'period': 'Baroque', 'damage': 'Flaking paint', 'output': 'Visitor Summary',
+                      'response': r, 'time': datetime.now(), 'group': None} for r in responses]
+    plain = {
+        'workspace_outputs': plain_outputs,
+        # The selected result used to be kept as a separate copy
+        'current_output': dict(plain_outputs[0]),
+        'chat_messages': [{'role': role, 'content': text, 'context_tokens': 100} for role, text in chat],
+    }
+
+    workdir = tempfile.mkdtemp(prefix="artrestorer-session-")
+    texts = session_store.TextStore()
+    transcript = session_store.ChatTranscript(texts, directory=workdir)
+    outputs = [session_store.OutputRecord(texts, o['artwork'], o['period'], o['damage'], o['output'], o['response'], o['time'])
+               for o in plain_outputs]
+    for role, text in chat:
+        transcript.append(role, text, context_tokens=100)
+    compact = {'session_texts': texts, 'workspace_outputs': outputs, 'current_output': outputs[0], 'chat_messages': transcript}
+    return {
+        'plain_bytes': session_store.deep_size(plain),
+        'compact_bytes': session_store.deep_size(compact),
+        'spilled_messages': transcript.spilled,
+    }
+
+
+def bench_context_cache(args):
+    """Prompt tokens the fake model receives for "All Outputs" runs, with and without cached context."""
+    import context_cache
+    import gemini_client
+    import generation
+
+    profile = {'experience': 'expert', 'tone': 'academic', 'creativity': 5, 'length': 5, 'email': 'bench@example.com'}
+    config = gemini_client.current()
+    models = [config.get_model(name) for name in config.available_models]
+    shared = context_cache.get_context_cache()
+    received = {}
+    for mode, cache in (('whole', context_cache.ContextCache(ttl_seconds=0)),
+                        ('cached', context_cache.ContextCache(min_tokens=0))):
+        context_cache._context_cache = cache
+        before = sum(m.prompt_tokens for m in models)
+        for i in range(args.context_artworks):
+            for output_type in generation.OUTPUT_TYPES:
+                prompt = generation.build_restoration_prompt("Painting", "Baroque", "", "Flanders",
+                                                             f"Flaking paint and darkened varnish {mode} {i}", output_type)
+                generation.generate_response(prompt, profile, use_cache=False, output_type=output_type)
+        received[mode] = sum(m.prompt_tokens for m in models) - before
+    context_cache._context_cache = shared
+    return {
+        'calls': args.context_artworks * len(generation.OUTPUT_TYPES),
+        'prompt_tokens_sent': received['whole'],
+        'prompt_tokens_sent_cached': received['cached'],
+        'saved_per_call': (received['whole'] - received['cached']) / (args.context_artworks * len(generation.OUTPUT_TYPES)),
+    }
+
+
+def app_modules():
+    # The modules app.py imports at the top, in order
+    with open(APP_PATH) as f:
+        source = f.read()
+    return list(dict.fromkeys(re.findall(r'^(?:import|from) (\w+)', source, re.M)))
+
+
+def import_breakdown(modules):
+    """{module: cumulative import seconds} for the slowest top-level imports, via -X importtime."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(APP_PATH))
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$', line)
+        # Two spaces of indent per nesting level; keep the modules asked for
+        if match and len(match.group(2)) <= 1 and match.group(3) in modules:
+            times[match.group(3)] = int(match.group(1)) / 1e6
+    return dict(sorted(times.items(), key=lambda item: item[1], reverse=True)[:IMPORT_BREAKDOWN_TOP])
+
+
+def bench_cold_start(args):
+    """Time to first render in fresh processes, what the imports cost, and what is left for later."""
+    runs = []
+    for _ in range(args.cold_starts):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, APP_PATH],
+                              capture_output=True, text=True, cwd=os.path.dirname(APP_PATH))
+        wall = time.perf_counter() - start
+        run = json.loads(proc.stdout.strip().splitlines()[-1])
+        run['process_seconds'] = wall
+        runs.append(run)
+    sdk = subprocess.run([sys.executable, '-c', "import time; s = time.perf_counter(); import google.generativeai; "
+                          "print(time.perf_counter() - s)"], capture_output=True, text=True)
+    return {
+        'process_seconds': statistics.median(r['process_seconds'] for r in runs),
+        'first_render_seconds': statistics.median(r['first_render_seconds'] for r in runs),
+        'streamlit_import_seconds': statistics.median(r['streamlit_import_seconds'] for r in runs),
+        # Deferred to the background warm-up; should never be paid before the first render
+        'sdk_import_seconds': float(sdk.stdout.strip()) if sdk.returncode == 0 else None,
+        'sdk_loaded_before_render': any(r['sdk_loaded'] for r in runs),
+        'errors': sum(r['errors'] for r in runs),
+        'imports': import_breakdown(['streamlit'] + [m for m in app_modules() if m != 'streamlit']),
+    }
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, tolerance):
+    """Metrics that got worse than `baseline` by more than `tolerance` (a fraction)."""
+    regressions = []
+    old = flatten(baseline.get('results', {}))
+    for name, value in flatten(current['results']).items():
+        if name not in old or name.endswith(('.n', 'sessions', 'requests', 'passages', 'spilled_messages', 'plain_bytes',
+                                             'errors', 'calls', 'prompt_tokens_sent')) or '.imports.' in name:
+            continue
+        before = old[name]
+        if not before:
+            continue
+        change = (value - before) / before
+        worse = -change if name.split('.')[-1] in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append((name, before, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ArtRestorer AI against a local fake Gemini model")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model delay before the first token (s)")
+    parser.add_argument("--token-rate", type=float, default=200, help="fake model tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake calls that fail with 503")
+    parser.add_argument("--no-stream", action="store_true", help="use the non-streaming code paths")
+    parser.add_argument("--iterations", type=int, default=5, help="simulated browser sessions through every flow")
+    parser.add_argument("--calls", type=int, default=30, help="direct generate_response calls for percentiles")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions for the throughput test")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to run the throughput test")
+    parser.add_argument("--documents", type=int, default=200, help="synthetic reference documents for the knowledge base test")
+    parser.add_argument("--context-artworks", type=int, default=3, help="artworks run through every output type in the context cache test")
+    parser.add_argument("--chat-messages", type=int, default=200, help="chat messages in the session storage test")
+    parser.add_argument("--cold-starts", type=int, default=3, help="fresh processes for the cold-start test")
+    parser.add_argument("--cold-start-budget", type=float, help="fail if a fresh process takes longer to render (s)")
+    parser.add_argument("--cold-start-only", action="store_true", help="only run the cold-start test")
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", help="earlier JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before flagging (fraction)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="artrestorer-bench-")
+    configure_environment(args, workdir)
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+
+    # First, before this process has imported anything the app uses
+    results = {'cold_start': bench_cold_start(args)}
+    if not args.cold_start_only:
+        reruns, memory = bench_reruns(args)
+        results.update({
+            'reruns': reruns,
+            'memory_per_session_bytes': memory,
+            'generate_response': bench_generation(args),
+            'concurrency': bench_throughput(args),
+            'api': bench_api(args),
+            'knowledge': bench_knowledge(args),
+            'session_storage': bench_session_storage(args),
+            'context_cache': bench_context_cache(args),
+        })
+    output = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'fake_model': {'latency': args.latency, 'token_rate': args.token_rate,
+                       'error_rate': args.error_rate, 'stream': not args.no_stream},
+        'results': results,
+    }
+
+    print_results(results)
+    status = 0
+    cold = results['cold_start']
+    if args.cold_start_budget and cold['process_seconds'] > args.cold_start_budget:
+        print(f"COLD START OVER BUDGET: {cold['process_seconds']:.2f}s > {args.cold_start_budget:.2f}s")
+        status = 1
+    if cold['sdk_loaded_before_render']:
+        print("COLD START: google.generativeai was imported before the first render")
+        status = 1
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('fake_model') != output['fake_model']:
+            print(f"Warning: {args.compare} used a different fake model setup: {baseline.get('fake_model')}")
+        regressions = compare(output, baseline, args.tolerance)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:.4g} -> {after:.4g} ({change:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return status
+
+
+def print_results(results):
+    cold = results['cold_start']
+    print(f"cold start: first render {cold['process_seconds']:.2f}s after process start "
+          f"(streamlit import {cold['streamlit_import_seconds']:.2f}s, script {cold['first_render_seconds']:.2f}s)")
+    if cold['sdk_import_seconds'] is not None:
+        print(f"  google.generativeai import ({cold['sdk_import_seconds']:.2f}s) deferred to the background warm-up")
+    print("  slowest imports: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in cold['imports'].items()))
+    if 'reruns' not in results:
+        return
+
+    reruns = results['reruns']
+    memory = results['memory_per_session_bytes']
+    print(f"{'flow':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for flow, stats in reruns.items():
+        print(f"{flow:<28}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}")
+    gen = results['generate_response']['latency']
+    print(f"{'generate_response':<28}{gen['p50'] * 1000:>10.1f}{gen['p95'] * 1000:>10.1f}{gen['p99'] * 1000:>10.1f}")
+    print(f"memory per session: {memory['p50'] / 1024:.0f} KiB (median)")
+    conc = results['concurrency']
+    print(f"throughput: {conc['throughput_rps']:.1f} req/s with {conc['sessions']} sessions ({conc['errors']} errors)")
+    api_results = results['api']
+    print(f"HTTP API: {api_results['throughput_rps']:.1f} req/s, p50 {api_results['latency']['p50'] * 1000:.1f} ms "
+          f"with {conc['sessions']} keep-alive clients ({api_results['errors']} errors)")
+    kb = results['knowledge']
+    print(f"knowledge base: {kb['passages']} passages indexed in {kb['build_seconds'] * 1000:.1f} ms, "
+          f"query p50 {kb['query']['p50'] * 1000:.2f} ms")
+    storage = results['session_storage']
+    print(f"session storage: {storage['plain_bytes'] / 1024:.0f} KiB as plain dicts -> "
+          f"{storage['compact_bytes'] / 1024:.0f} KiB compact ({storage['spilled_messages']} messages spilled to disk)")
+    shared = results['context_cache']
+    print(f"context cache: {shared['prompt_tokens_sent']} -> {shared['prompt_tokens_sent_cached']} prompt tokens sent "
+          f"over {shared['calls']} calls ({shared['saved_per_call']:.0f} saved per call)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
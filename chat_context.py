@@ -0,0 +1,93 @@
+import os
+
+# Rough budget for everything sent on one chat turn (preamble, summary, turns)
+CHAT_TOKEN_BUDGET = int(os.getenv("ARTRESTORER_CHAT_TOKEN_BUDGET", "2000"))
+# After summarizing, aim this far below the budget so it isn't redone every turn
+TARGET_RATIO = 0.6
+SUMMARY_MAX_WORDS = 150
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose; no network call needed
+    return max(1, len(text) // 4) if text else 0
+
+
+def new_summary():
+    # 'upto' is the number of chat_messages already folded into 'text'
+    return {'text': '', 'upto': 0}
+
+
+class ChatContext:
+    def __init__(self, contents, tokens, summary, summarized_now=0):
+        self.contents = contents
+        self.tokens = tokens
+        self.summary = summary
+        self.summarized_now = summarized_now
+
+
+def _role(message):
+    return 'model' if message['role'] == 'assistant' else 'user'
+
+
+def _transcript(messages):
+    return '\n'.join(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages)
+
+
+def summary_prompt(previous, messages):
+    return f"""Summarize this art restoration conversation in under {SUMMARY_MAX_WORDS} words.
+Keep artwork details, damage, recommendations given and open questions. Plain prose only.
+
+Summary so far:
+{previous or '(none)'}
+
+New turns:
+{_transcript(messages)}"""
+
+
+def build_context(messages, summary, first_turn, summarize, budget=CHAT_TOKEN_BUDGET):
+    """Fit the conversation into `budget` tokens.
+
+    `first_turn(summary_text, question)` builds the opening user turn (system
+    preamble, summary and question). When the turns no longer fit, the oldest
+    ones are folded into the summary with `summarize(previous, messages)`;
+    that only happens when the budget is exceeded and only for the new turns.
+    """
+    summary = dict(summary or new_summary())
+    start = summary['upto']
+    # The greeting and any leading assistant turns carry nothing for the model
+    while start < len(messages) and messages[start]['role'] != 'user':
+        start += 1
+
+    def total(begin, summary_text):
+        turns = messages[begin:]
+        if not turns:
+            return estimate_tokens(first_turn(summary_text, ''))
+        return (estimate_tokens(first_turn(summary_text, turns[0]['content']))
+                + sum(estimate_tokens(m['content']) for m in turns[1:]))
+
+    summarized_now = 0
+    if total(start, summary['text']) > budget and len(messages) - start > 1:
+        # Fold oldest turns until the rest fits under the target, keeping the last user turn
+        target = budget * TARGET_RATIO
+        cut = start
+        while cut < len(messages) - 1 and total(cut, summary['text']) > target:
+            cut += 1
+        while cut < len(messages) - 1 and messages[cut]['role'] != 'user':
+            cut += 1
+        folded = messages[start:cut]
+        if folded:
+            try:
+                summary['text'] = summarize(summary['text'], folded).strip()
+            except Exception:
+                # Without a summary the old turns are simply dropped
+                pass
+            summary['upto'] = cut
+            summarized_now = len(folded)
+            start = cut
+
+    turns = messages[start:]
+    contents = []
+    for i, m in enumerate(turns):
+        text = first_turn(summary['text'], m['content']) if i == 0 else m['content']
+        contents.append({'role': _role(m), 'parts': [text]})
+    return ChatContext(contents, total(start, summary['text']), summary, summarized_now)
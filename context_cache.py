@@ -0,0 +1,141 @@
+"""Upstream cached content for prompt prefixes that several model calls share.
+
+The system preamble and artwork context behind an "All Outputs" run, or the
+opening turn of a chat, are the same on every call. Once a prefix has been
+seen twice it is registered through the model's cached-content API and later
+calls send only what follows it. Models, SDKs or prefixes that can't be
+cached simply get the whole prompt, as before.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from chat_context import estimate_tokens
+
+# How long registered prefixes live upstream; 0 turns context caching off
+TTL_SECONDS = float(os.getenv("ARTRESTORER_CONTEXT_CACHE_TTL", "600"))
+# Gemini refuses (and bills storage for) anything smaller than its minimum
+MIN_TOKENS = int(os.getenv("ARTRESTORER_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+MAX_ENTRIES = 256
+# Sightings of a prefix before registering it; one-off prompts never pay for storage
+REGISTER_AFTER = 2
+# After a failed registration the model is sent whole prompts for this long
+RETRY_SECONDS = 600
+# Stop using an entry a little before it expires upstream
+EXPIRY_MARGIN = 0.9
+
+
+def _text(contents):
+    if isinstance(contents, str):
+        return contents
+    return '\n'.join(str(part) for turn in contents for part in turn.get('parts', []))
+
+
+def _turns(contents):
+    # Cached content is a list of turns; a plain prompt prefix becomes one user turn
+    return [{'role': 'user', 'parts': [contents]}] if isinstance(contents, str) else contents
+
+
+class Entry:
+    __slots__ = ('seen', 'model', 'expires', 'lock')
+
+    def __init__(self):
+        self.seen = 0
+        self.model = None
+        self.expires = 0.0
+        self.lock = threading.Lock()
+
+
+class ContextCache:
+    """Registered prompt prefixes per model, most recently used last."""
+
+    def __init__(self, ttl_seconds=TTL_SECONDS, min_tokens=MIN_TOKENS, max_entries=MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.created = 0
+        self.failed = 0
+        self.reused = 0
+        self._entries = OrderedDict()
+        # model name -> monotonic time its registrations may be tried again
+        self._unsupported = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, config, model_name, model, contents, prefix):
+        """(model, contents, key) to send: a cached-content model and the rest of
+        `contents` once `prefix` is registered, else `model` and the whole prompt.
+
+        `prefix` must be the start of `contents` (a string, or a list of turns);
+        `key` is None unless cached content is used.
+        """
+        if not prefix or not self.ttl_seconds or len(prefix) >= len(contents):
+            return model, contents, None
+        if estimate_tokens(_text(prefix)) < self.min_tokens:
+            return model, contents, None
+        raw = prefix if isinstance(prefix, str) else json.dumps(prefix, sort_keys=True)
+        key = (model_name, hashlib.blake2b(raw.encode('utf-8'), digest_size=16).digest())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry.model is not None and entry.expires <= now):
+                entry = self._entries[key] = Entry()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            entry.seen += 1
+            if entry.model is None and (entry.seen < REGISTER_AFTER or self._unsupported.get(model_name, 0) > now):
+                return model, contents, None
+
+        # Concurrent calls with the same prefix wait for one registration
+        with entry.lock:
+            if entry.model is None:
+                try:
+                    entry.model = config.cached_model(model_name, _turns(prefix), self.ttl_seconds)
+                except Exception:
+                    with self._lock:
+                        self.failed += 1
+                        self._unsupported[model_name] = time.monotonic() + RETRY_SECONDS
+                        self._entries.pop(key, None)
+                    metrics.context_caches.inc(outcome='failed', model=model_name)
+                    return model, contents, None
+                entry.expires = time.monotonic() + self.ttl_seconds * EXPIRY_MARGIN
+                with self._lock:
+                    self.created += 1
+                metrics.context_caches.inc(outcome='created', model=model_name)
+        with self._lock:
+            self.reused += 1
+        return entry.model, contents[len(prefix):], key
+
+    def discard(self, key):
+        # The upstream copy may be gone (deleted or expired early); it is registered again when next seen twice
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'registered': sum(1 for e in self._entries.values() if e.model is not None),
+                'created': self.created,
+                'failed': self.failed,
+                'reused': self.reused,
+                'unsupported_models': sorted(name for name, until in self._unsupported.items()
+                                             if until > time.monotonic()),
+            }
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    # One registry per process, shared by every session
+    global _context_cache
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                _context_cache = ContextCache()
+    return _context_cache
@@ -0,0 +1,151 @@
+"""Saved history as JSONL, CSV or a ZIP of per-record reports, produced as a stream.
+
+Every exporter takes an iterable of history records (e.g.
+HistoryStore.iter_records) and yields bytes chunks, so memory stays flat
+however many records there are and the first bytes are ready at once.
+"""
+import csv
+import io
+import json
+import re
+import tempfile
+import zipfile
+
+FORMATS = {
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+    'zip-md': ('application/zip', 'zip'),
+    'zip-txt': ('application/zip', 'zip'),
+}
+FIELDS = ['id', 'time', 'artwork', 'period', 'damage', 'output', 'response']
+# Records written between chunks for the text formats
+CHUNK_RECORDS = 100
+# Exports bigger than this are spooled to a temporary file instead of memory
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def report_text(record):
+    return f"""ArtRestorer AI Report
+Time: {record['time']}
+Artwork: {record['artwork']}
+Period: {record['period']}
+Damage: {record['damage']}
+
+{record['response']}"""
+
+
+def report_markdown(record):
+    # The same report, as Markdown
+    return f"""# ArtRestorer AI Report
+
+**Time:** {record['time']}  
+**Artwork:** {record['artwork']}  
+**Period:** {record['period']}  
+**Damage:** {record['damage']}  
+**Output:** {record['output']}
+
+{record['response']}
+"""
+
+
+def _row(record):
+    return dict(record, time=record['time'].isoformat(timespec='seconds'))
+
+
+def _batched(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_RECORDS:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+def iter_jsonl(records):
+    return _batched(json.dumps({f: _row(r).get(f) for f in FIELDS}, ensure_ascii=False) + '\n' for r in records)
+
+
+def iter_csv(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS, extrasaction='ignore')
+
+    def lines():
+        writer.writeheader()
+        for record in records:
+            writer.writerow(_row(record))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    # Byte order mark so spreadsheet apps pick UTF-8
+    yield '\ufeff'.encode('utf-8')
+    yield from _batched(lines())
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', (text or '').lower()).strip('-')[:40] or 'untitled'
+
+
+def report_filename(record, extension):
+    return f"{record['id']:06d}_{_slug(record['artwork'])}_{_slug(record['output'])}.{extension}"
+
+
+class _Sink:
+    # Write-only file object for ZipFile; collects output until the generator yields it
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(records, markdown=True):
+    """A ZIP with one report per record, yielded entry by entry."""
+    sink = _Sink()
+    # Not seekable, so ZipFile writes sizes after each entry instead of going back
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for record in records:
+            if markdown:
+                name, body = report_filename(record, 'md'), report_markdown(record)
+            else:
+                name, body = report_filename(record, 'txt'), report_text(record)
+            info = zipfile.ZipInfo(name, date_time=record['time'].timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, body)
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def iter_export(records, fmt):
+    if fmt == 'jsonl':
+        return iter_jsonl(records)
+    if fmt == 'csv':
+        return iter_csv(records)
+    if fmt in ('zip-md', 'zip-txt'):
+        return iter_zip(records, markdown=fmt == 'zip-md')
+    raise ValueError(f"Unknown export format {fmt!r}; use one of {', '.join(FORMATS)}")
+
+
+def to_file(chunks):
+    """The chunks written to a rewound temporary file, for consumers that need a file object."""
+    f = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    for chunk in chunks:
+        f.write(chunk)
+    f.seek(0)
+    return f
+
+
+def export_filename(fmt, stamp):
+    return f"restoration_history_{stamp}.{FORMATS[fmt][1]}"
@@ -0,0 +1,173 @@
+"""Local stand-in for google.generativeai models.
+
+Set ARTRESTORER_FAKE_MODEL=1 to run the app against it, or build one directly
+to exercise retries, fallback, streaming and cached content without network
+access or quota. Each model counts the prompt tokens it actually received.
+"""
+import os
+import random
+import threading
+import time
+
+import gemini_client
+
+FAKE_MODELS = ['models/gemini-1.5-flash', 'models/gemini-1.5-pro']
+
+
+class FakeAPIError(Exception):
+    """Carries an HTTP-style status code like google.api_core exceptions do."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens, cached_tokens=0):
+        # Like Gemini, the prompt count includes the tokens served from cached content
+        self.prompt_token_count = prompt_tokens + cached_tokens
+        self.candidates_token_count = output_tokens
+        self.cached_content_token_count = cached_tokens
+        self.total_token_count = self.prompt_token_count + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def count_tokens(text):
+    # Close enough to Gemini's tokenizer for relative measurements
+    return max(1, len(text) // 4)
+
+
+def _contents_text(contents):
+    if isinstance(contents, str):
+        return contents
+    parts = []
+    for item in contents:
+        if isinstance(item, str):
+            parts.append(item)
+        elif isinstance(item, dict):
+            parts.extend(str(p) for p in item.get('parts', []))
+    return '\n'.join(parts)
+
+
+class FakeModel:
+    def __init__(self, model_name='models/gemini-1.5-flash', latency=0.0, tokens_per_second=0.0,
+                 error_rate=0.0, error_code=503, failures=None, response_tokens=60, seed=None,
+                 supports_caching=True, min_cache_tokens=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_code = error_code
+        # Scripted failures: a list of status codes consumed one per call
+        self.failures = list(failures or [])
+        self.response_tokens = response_tokens
+        self.supports_caching = supports_caching
+        self.min_cache_tokens = min_cache_tokens
+        self.calls = 0
+        # Tokens actually received with requests; cached prefixes are counted in cached_tokens
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.caches_created = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt, max_tokens=None):
+        words = [f"Guidance ({self.model_name.split('/')[-1]}):"]
+        vocabulary = ['consolidate', 'the', 'paint', 'layer', 'with', 'reversible', 'adhesive', 'and',
+                      'document', 'every', 'step', 'before', 'retouching', 'losses', 'carefully.']
+        seed = sum(map(ord, prompt)) % len(vocabulary)
+        # Honour max_output_tokens roughly, one word per token
+        for i in range(min(self.response_tokens, max_tokens or self.response_tokens)):
+            words.append(vocabulary[(seed + i) % len(vocabulary)])
+        return ' '.join(words)
+
+    def _start_call(self, contents, cached_text=''):
+        prompt = _contents_text(contents)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += count_tokens(prompt)
+            if cached_text:
+                self.cached_tokens += count_tokens(cached_text)
+            failure = self.failures.pop(0) if self.failures else None
+            if failure is None and self.error_rate and self._random.random() < self.error_rate:
+                failure = self.error_code
+        if self.latency:
+            time.sleep(self.latency)
+        if failure:
+            raise FakeAPIError(failure, f"{failure} from fake {self.model_name}")
+        if not cached_text:
+            return prompt
+        # The same text the whole prompt would have been, so answers don't change
+        return cached_text + ('' if isinstance(contents, str) else '\n') + prompt
+
+    def generate_content(self, contents, stream=False, generation_config=None, request_options=None,
+                         _cached_text='', **kwargs):
+        prompt = self._start_call(contents, _cached_text)
+        text = self._answer(prompt, (generation_config or {}).get('max_output_tokens'))
+        if _cached_text:
+            usage = FakeUsage(count_tokens(_contents_text(contents)), count_tokens(text), count_tokens(_cached_text))
+        else:
+            usage = FakeUsage(count_tokens(prompt), count_tokens(text))
+        if stream:
+            return self._stream(text, usage)
+        if self.tokens_per_second:
+            time.sleep(count_tokens(text) / self.tokens_per_second)
+        return FakeResponse(text, usage)
+
+    def _stream(self, text, usage):
+        words = text.split(' ')
+        for i in range(0, len(words), 8):
+            chunk = ' '.join(words[i:i + 8]) + ' '
+            if self.tokens_per_second:
+                time.sleep(count_tokens(chunk) / self.tokens_per_second)
+            yield FakeResponse(chunk, usage)
+
+    def count_tokens(self, contents):
+        return FakeUsage(count_tokens(_contents_text(contents)), 0)
+
+    def cache(self, contents, ttl_seconds=None):
+        """Register `contents` like CachedContent.create and return a model bound to it."""
+        text = _contents_text(contents)
+        if not self.supports_caching:
+            raise FakeAPIError(400, f"Cached content is not supported for fake {self.model_name}")
+        if count_tokens(text) < self.min_cache_tokens:
+            raise FakeAPIError(400, f"Cached content needs at least {self.min_cache_tokens} tokens")
+        with self._lock:
+            self.caches_created += 1
+        return FakeCachedModel(self, text)
+
+
+class FakeCachedModel:
+    """A FakeModel with a cached prefix; only the rest of each prompt is received."""
+
+    def __init__(self, model, cached_text):
+        self.model = model
+        self.model_name = model.model_name
+        self.cached_text = cached_text
+
+    def generate_content(self, contents, **kwargs):
+        return self.model.generate_content(contents, _cached_text=self.cached_text, **kwargs)
+
+
+def fake_config(models=None, **model_options):
+    """A GeminiConfig whose models are all FakeModel instances."""
+    models = models or FAKE_MODELS
+    options = {
+        'latency': float(os.getenv("ARTRESTORER_FAKE_LATENCY", "0.2")),
+        'tokens_per_second': float(os.getenv("ARTRESTORER_FAKE_TOKEN_RATE", "200")),
+        'error_rate': float(os.getenv("ARTRESTORER_FAKE_ERROR_RATE", "0")),
+    }
+    options.update(model_options)
+
+    def factory(name):
+        return FakeModel(name, **options)
+
+    config = gemini_client.GeminiConfig(factory(models[0]), models[0], 'fake-key', None, list(models),
+                                        model_factory=factory)
+    config.cache_factory = lambda name, contents, ttl_seconds: config.get_model(name).cache(contents, ttl_seconds)
+    return config
@@ -0,0 +1,263 @@
+import datetime
+import os
+import threading
+import time
+
+import metrics
+
+# Secrets files checked in order (after Streamlit's own st.secrets)
+SECRETS_PATHS = [".secrets/secrets.toml", ".streamlit/secrets.toml"]
+
+# Prefer gemini models in this order
+PREFERRED_MODELS = [
+    'models/gemini-1.5-flash',
+    'models/gemini-1.5-pro',
+    'models/gemini-pro',
+    'models/gemini-1.0-pro',
+]
+
+# How long a resolved client is trusted before model discovery runs again
+MODEL_TTL_SECONDS = float(os.getenv("ARTRESTORER_MODEL_TTL", "3600"))
+# Failed discovery (e.g. network blip) is retried much sooner
+ERROR_TTL_SECONDS = float(os.getenv("ARTRESTORER_MODEL_ERROR_TTL", "60"))
+
+
+def _genai():
+    # The SDK pulls in gRPC and protobuf (about a second); only loaded to resolve a real client
+    import google.generativeai as genai
+    return genai
+
+
+class GeminiConfig:
+    def __init__(self, model=None, model_name=None, api_key=None, api_error=None,
+                 available_models=None, resolve_seconds=0.0, model_factory=None, cache_factory=None):
+        self.model = model
+        self.model_name = model_name
+        self.api_key = api_key
+        self.api_error = api_error
+        self.available_models = available_models or []
+        self.resolve_seconds = resolve_seconds
+        self.resolved_at = time.time()
+        self.model_factory = model_factory
+        self.cache_factory = cache_factory
+        self._models = {model_name: model} if model else {}
+        self._models_lock = threading.Lock()
+
+    def get_model(self, name):
+        # Fallback models are only built the first time they are needed
+        with self._models_lock:
+            if name not in self._models:
+                factory = self.model_factory or _genai().GenerativeModel
+                self._models[name] = factory(name)
+            return self._models[name]
+
+    def cached_model(self, name, contents, ttl_seconds):
+        """A model bound to `contents` stored upstream; requests to it send only what follows.
+
+        Raises when the SDK or model has no cached-content support, or the
+        contents are below the model's minimum size.
+        """
+        if self.cache_factory:
+            return self.cache_factory(name, contents, ttl_seconds)
+        genai = _genai()
+        from google.generativeai import caching
+        cached = caching.CachedContent.create(model=name, contents=contents,
+                                              ttl=datetime.timedelta(seconds=ttl_seconds))
+        return genai.GenerativeModel.from_cached_content(cached)
+
+    def fallback_models(self):
+        return [name for name in PREFERRED_MODELS if name in self.available_models and name != self.model_name]
+
+    def expired(self):
+        ttl = ERROR_TTL_SECONDS if self.api_error else MODEL_TTL_SECONDS
+        return time.time() - self.resolved_at > ttl
+
+
+_lock = threading.Lock()
+_config = None
+_signature = None
+_warmup = None
+_warmup_lock = threading.Lock()
+# Streamlit key the background warm-up was started with, until it has resolved
+_warmup_key = None
+
+# Shared across every session in this process
+stats = {
+    'resolves': 0,
+    'cached_lookups': 0,
+    'last_resolve_seconds': 0.0,
+    'cached_lookup_seconds': 0.0,
+}
+
+
+def _read_key_from_file(path):
+    # Parse the TOML file manually, line like: GEMINI_API_KEY = "key_here"
+    with open(path, 'r') as f:
+        for line in f.read().split('\n'):
+            if 'GEMINI_API_KEY' in line and '=' in line:
+                return line.split('=')[1].strip().strip('"').strip("'")
+    return None
+
+
+def _secrets_signature(streamlit_key):
+    # Anything that could change which key we end up using
+    mtimes = []
+    for path in SECRETS_PATHS:
+        try:
+            mtimes.append(os.path.getmtime(path))
+        except OSError:
+            mtimes.append(None)
+    return (streamlit_key, tuple(mtimes), os.getenv('GEMINI_API_KEY'))
+
+
+def _resolve(streamlit_key):
+    # Local stand-in model, for development and tests without an API key
+    if os.getenv("ARTRESTORER_FAKE_MODEL"):
+        import fake_gemini
+        return fake_gemini.fake_config()
+
+    model = None
+    model_name = None
+    api_error = None
+    api_key = streamlit_key
+    available_models = []
+
+    try:
+        # Try reading from .secrets/secrets.toml, then .streamlit/secrets.toml
+        for secrets_path in SECRETS_PATHS:
+            if api_key:
+                break
+            if os.path.exists(secrets_path):
+                try:
+                    api_key = _read_key_from_file(secrets_path)
+                except Exception as e:
+                    api_error = f"Found {secrets_path} but couldn't read it: {str(e)}"
+
+        # Try environment variable
+        if not api_key:
+            api_key = os.getenv('GEMINI_API_KEY')
+
+        # Configure the API if we found a key
+        if api_key:
+            genai = _genai()
+            genai.configure(api_key=api_key)
+
+            try:
+                # Get list of all available models that support generateContent
+                for m in genai.list_models():
+                    if 'generateContent' in m.supported_generation_methods:
+                        available_models.append(m.name)
+
+                # Find the first available preferred model
+                for pref in PREFERRED_MODELS:
+                    if pref in available_models:
+                        model_name = pref
+                        break
+
+                # If no preferred model found, use the first available one
+                if not model_name and available_models:
+                    model_name = available_models[0]
+
+                if model_name:
+                    model = genai.GenerativeModel(model_name)
+                else:
+                    api_error = "No models supporting generateContent found for your API key"
+
+            except Exception as e:
+                api_error = f"Error listing models: {str(e)}"
+        else:
+            api_error = "No API key found. Please add GEMINI_API_KEY to .secrets/secrets.toml or .streamlit/secrets.toml"
+
+    except Exception as e:
+        api_error = f"Error configuring API: {str(e)}"
+
+    return GeminiConfig(model, model_name, api_key, api_error, available_models)
+
+
+def _fresh(streamlit_key, start):
+    # The resolved client if it still holds for this key, counted as a cached lookup
+    config = _config
+    if config is None or config.expired() or _secrets_signature(streamlit_key) != _signature:
+        return None
+    stats['cached_lookups'] += 1
+    stats['cached_lookup_seconds'] += time.perf_counter() - start
+    metrics.config_lookups.inc(cached='yes')
+    return config
+
+
+def get_gemini_config(streamlit_key=None):
+    """Return the process-wide Gemini client, resolving it only when needed.
+
+    Discovery is repeated when the TTL runs out or when a secrets file or the
+    GEMINI_API_KEY source changes; every other call is a dictionary lookup.
+    """
+    global _config, _signature
+
+    start = time.perf_counter()
+    config = _fresh(streamlit_key, start)
+    if config is not None:
+        return config
+
+    signature = _secrets_signature(streamlit_key)
+    with _lock:
+        # Another session may have resolved it while we waited
+        if _config is not None and signature == _signature and not _config.expired():
+            return _config
+        config = _resolve(streamlit_key)
+        config.resolve_seconds = time.perf_counter() - start
+        _config = config
+        _signature = signature
+        stats['resolves'] += 1
+        stats['last_resolve_seconds'] = config.resolve_seconds
+        metrics.config_resolve_seconds.observe(config.resolve_seconds)
+        metrics.config_lookups.inc(cached='no')
+    return config
+
+
+def warm_up(streamlit_key=None):
+    """Resolve the client on a background thread unless a fresh one is ready or on its way.
+
+    Lets pages render without waiting for the SDK import and model discovery;
+    the first generation picks up the result (or waits for it to finish).
+    """
+    global _warmup, _warmup_key
+    if _fresh(streamlit_key, time.perf_counter()) is not None:
+        return
+    with _warmup_lock:
+        if _warmup is not None and _warmup.is_alive():
+            return
+        _warmup_key = streamlit_key
+        _warmup = threading.Thread(target=get_gemini_config, args=(streamlit_key,), daemon=True,
+                                   name="artrestorer-gemini-warmup")
+        _warmup.start()
+
+
+def peek():
+    # The last resolved client, or None while the first resolve is still running; never blocks
+    return _config
+
+
+def current():
+    # Whatever the app last resolved; headless callers resolve from files/env
+    streamlit_key = _signature[0] if _signature else _warmup_key
+    return get_gemini_config(streamlit_key)
+
+
+def invalidate():
+    global _config, _signature
+    with _lock:
+        _config = None
+        _signature = None
+
+
+def speedup_summary():
+    lookups = stats['cached_lookups']
+    if not lookups or not stats['resolves']:
+        return None
+    avg_lookup = stats['cached_lookup_seconds'] / lookups
+    return {
+        'resolve_seconds': stats['last_resolve_seconds'],
+        'cached_lookup_seconds': avg_lookup,
+        'cached_lookups': lookups,
+        'seconds_saved': max(stats['last_resolve_seconds'] - avg_lookup, 0.0) * lookups,
+    }
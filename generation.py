@@ -0,0 +1,368 @@
+import functools
+import json
+import re
+import sys
+import threading
+import time
+
+import chat_context
+import gemini_client
+import knowledge_base
+import metrics
+import resilience
+import response_cache
+import router
+import scheduler
+import singleflight
+from resilience import ConfigurationError, GenerationError, UpstreamUnavailableError
+
+OUTPUT_TYPES = ["Restoration Technique", "Stylistic Reconstruction", "Symbol Interpretation", "Visitor Summary", "Conservation Advice"]
+
+
+def config_error_message(config):
+    error_msg = f"⚠️ API Configuration Error: {config.api_error}\n\n"
+
+    if config.available_models:
+        error_msg += f"Available models found: {', '.join(config.available_models)}\n\n"
+
+    error_msg += """Please check:
+1. Your API key is valid (get from: https://aistudio.google.com/app/apikey)
+2. You have enabled the Gemini API
+3. Add to .secrets/secrets.toml:
+   GEMINI_API_KEY = "your-key-here"
+"""
+    return error_msg
+
+
+def artwork_context(artwork_type, art_period, artist, region, damage, user=None):
+    prompt = f"""Artwork: {artwork_type}
+Period: {art_period}
+Artist: {artist}
+Region: {region}
+Damage: {damage}
+"""
+    # Reference passages from the local knowledge base, so the model needn't work them out again;
+    # only shared documents and the requesting user's own are quoted
+    notes = knowledge_base.get_knowledge_base().reference_notes(artwork_type, art_period, damage, user=user)
+    if notes:
+        prompt += "\nReference notes:\n" + "\n".join(f"- {note}" for note in notes) + "\n"
+    return prompt
+
+
+def output_request(output_type):
+    return f"\nOutput: {output_type}\n\nProvide detailed restoration guidance."
+
+
+def build_restoration_prompt(artwork_type, art_period, artist, region, damage, output_type, user=None):
+    # The artwork context comes first, so every output type for one artwork shares it as a prefix
+    return artwork_context(artwork_type, art_period, artist, region, damage, user) + output_request(output_type)
+
+
+def similarity_scope(kind, user_profile, *fields):
+    # Answers are only reused for the same output type, prompt-relevant profile and `fields`
+    # (artwork type, period, ...), which must match up to case and punctuation. Only the
+    # free text, such as the damage description, is compared by similarity.
+    profile = [str(user_profile.get(f, response_cache.PROFILE_DEFAULTS[f])) for f in response_cache.PROFILE_FIELDS]
+    exact = [' '.join(re.findall(r'[a-z0-9]+', str(field).lower())) for field in fields]
+    return '|'.join([kind] + profile + exact)
+
+
+@functools.lru_cache(maxsize=256)
+def system_preamble(experience, tone, creativity, length):
+    # Built once per profile; interned so every session with that profile shares one string
+    return sys.intern(f"""You are an art restoration expert.
+User profile: {experience} level
+Tone: {tone}
+Creativity: {creativity}/10
+Detail: {length}/10
+
+""")
+
+
+def profile_preamble(user_profile):
+    return system_preamble(user_profile.get('experience', 'intermediate'), user_profile.get('tone', 'academic'),
+                           user_profile.get('creativity', 5), user_profile.get('length', 5))
+
+
+def build_system_prompt(prompt, user_profile):
+    return profile_preamble(user_profile) + prompt
+
+
+def restoration_prefix(contents, output_type):
+    """The part of a restoration prompt every output type for that artwork shares, or None."""
+    tail = output_request(output_type) if output_type else None
+    if tail and contents.endswith(tail):
+        return contents[:-len(tail)]
+    return None
+
+
+def chat_prefix(contents):
+    # The opening turn (preamble, summary and first question) stays put until the next summary
+    return contents[:1] if len(contents) > 1 else None
+
+
+def _configured():
+    config = gemini_client.current()
+    if not config.model:
+        metrics.generation_errors.inc(error='ConfigurationError')
+        raise ConfigurationError(config_error_message(config))
+    return config
+
+
+def _record(start, labels, outcome, model_name=None):
+    labels = dict(labels, outcome=outcome, model=model_name or labels['model'])
+    metrics.generate_seconds.observe(time.perf_counter() - start, **labels)
+    metrics.generate_requests.inc(**labels)
+    if outcome != 'ok':
+        metrics.generation_errors.inc(error=outcome)
+
+
+def _record_saved(usage, kind):
+    # Prompt tokens this call didn't have to send, thanks to cached content (0 for most calls)
+    saved = getattr(usage, 'cached_content_token_count', 0) or 0
+    metrics.prompt_tokens_saved.observe(saved, kind=kind)
+
+
+class _Quota:
+    """Scheduler tickets for one request: one per upstream call, retries and fallbacks included."""
+
+    def __init__(self, contents, user_profile, flight, on_queue, plan):
+        text = contents if isinstance(contents, str) else json.dumps(contents)
+        self.user = user_profile.get('email', '')
+        self.tokens = chat_context.estimate_tokens(text)
+        self.output_tokens = plan.generation_config['max_output_tokens']
+        self.on_queue = on_queue
+        self.ticket = None
+        self._lock = threading.Lock()
+        # Followers joining the flight may raise the priority while we queue
+        self.priority = flight.watch(self.promote)
+
+    def acquire(self):
+        # Waits for this user's fair share of the API quota
+        sched = scheduler.get_scheduler()
+        if self.ticket is not None:
+            # The previous attempt failed, so none of its token reservation was used
+            sched.release(self.ticket)
+        with self._lock:
+            ticket = self.ticket = sched.enqueue(self.user, self.priority, self.tokens, self.output_tokens)
+        sched.wait(ticket, self.on_queue)
+        metrics.queue_wait_seconds.observe(ticket.waited, priority=scheduler.PRIORITY_NAMES[ticket.priority])
+
+    def promote(self, priority):
+        with self._lock:
+            self.priority = min(self.priority, priority)
+            ticket = self.ticket
+        if ticket is not None:
+            scheduler.get_scheduler().promote(ticket, priority)
+
+    def settle(self, usage):
+        if usage is not None:
+            scheduler.get_scheduler().settle(self.ticket, getattr(usage, 'total_token_count', 0))
+
+    def release(self):
+        if self.ticket is not None:
+            scheduler.get_scheduler().release(self.ticket)
+
+
+def _answer_key(cache_key, key_text, user_profile, plan, model_name):
+    # A fallback model's answer is filed under that model, not the one the plan asked for
+    if model_name == plan.model_name:
+        return cache_key
+    return response_cache.make_key(key_text, user_profile, model_name)
+
+
+def _generate(config, contents, key_text, user_profile, use_cache, kind, output_type, priority, on_queue,
+              prefix=None):
+    start = time.perf_counter()
+    # Model and generation config from the profile, output type and measured latencies
+    plan = router.plan(config, user_profile, output_type or kind)
+    # Keyed by the model that will answer, so one model's answers never stand in for another's
+    cache_key = response_cache.make_key(key_text, user_profile, plan.model_name)
+    labels = {'kind': kind, 'output_type': output_type or '', 'model': plan.model_name,
+              'cache': 'miss' if use_cache else 'bypass'}
+
+    # Same prompt + profile + model has been answered before (by anyone)
+    cache = response_cache.get_cache()
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            _record(start, dict(labels, cache='hit'), 'ok')
+            return cached
+
+    # An identical request already in flight: wait for its answer instead of calling again
+    group = singleflight.get_group()
+    flight, leader = group.join(cache_key, priority)
+    if not leader:
+        metrics.coalesced_requests.inc(kind=kind)
+        try:
+            text, model_name = flight.result()
+        except GenerationError as e:
+            _record(start, dict(labels, cache='coalesced'), e.__class__.__name__, e.model_name)
+            raise
+        _record(start, dict(labels, cache='coalesced'), 'ok', model_name)
+        return text
+
+    quota = _Quota(contents, user_profile, flight, on_queue, plan)
+    try:
+        quota.acquire()
+        call_start = time.perf_counter()
+        response, model_name = resilience.call(config, contents, preferred=plan.model_name, prefix=prefix,
+                                               on_retry=quota.acquire, generation_config=plan.generation_config)
+        text = response.text
+        router.get_tracker().observe(model_name, output_type or kind, time.perf_counter() - call_start)
+    except GenerationError as e:
+        quota.release()
+        group.finish(cache_key, flight, e)
+        _record(start, labels, e.__class__.__name__, e.model_name)
+        raise
+    except BaseException as e:
+        quota.release()
+        group.finish(cache_key, flight, e)
+        raise
+
+    # Only successful answers are cached; errors are raised instead
+    cache.set(_answer_key(cache_key, key_text, user_profile, plan, model_name), text)
+    flight.publish(text, model_name)
+    group.finish(cache_key, flight)
+    usage = getattr(response, 'usage_metadata', None)
+    quota.settle(usage)
+    metrics.record_usage(usage, model_name, user_profile)
+    _record_saved(usage, kind)
+    _record(start, labels, 'ok', model_name)
+    return text
+
+
+def _follow(flight, start, labels, kind):
+    # Replays the leader's chunks, including any it published before we joined
+    model_name = None
+    try:
+        for i, text in enumerate(flight.iter_chunks()):
+            if i == 0:
+                model_name = flight.model_name
+                metrics.first_chunk_seconds.observe(time.perf_counter() - start, kind=kind, model=model_name)
+            yield text
+    except GenerationError as e:
+        _record(start, labels, e.__class__.__name__, e.model_name)
+        raise
+    _record(start, labels, 'ok', flight.model_name)
+
+
+def _stream(config, contents, key_text, user_profile, use_cache, kind, output_type, priority, on_queue,
+            prefix=None):
+    start = time.perf_counter()
+    # Model and generation config from the profile, output type and measured latencies
+    plan = router.plan(config, user_profile, output_type or kind)
+    # Keyed by the model that will answer, so one model's answers never stand in for another's
+    cache_key = response_cache.make_key(key_text, user_profile, plan.model_name)
+    labels = {'kind': kind, 'output_type': output_type or '', 'model': plan.model_name,
+              'cache': 'miss' if use_cache else 'bypass'}
+
+    cache = response_cache.get_cache()
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            _record(start, dict(labels, cache='hit'), 'ok')
+            yield cached
+            return
+
+    group = singleflight.get_group()
+    flight, leader = group.join(cache_key, priority)
+    if not leader:
+        metrics.coalesced_requests.inc(kind=kind)
+        yield from _follow(flight, start, dict(labels, cache='coalesced'), kind)
+        return
+
+    chunks = []
+    usage = None
+    model_name = None
+    quota = _Quota(contents, user_profile, flight, on_queue, plan)
+    try:
+        quota.acquire()
+        call_start = time.perf_counter()
+        for text, model_name, chunk_usage in resilience.stream(config, contents, preferred=plan.model_name,
+                                                               prefix=prefix, on_retry=quota.acquire,
+                                                               generation_config=plan.generation_config):
+            if not chunks:
+                metrics.first_chunk_seconds.observe(time.perf_counter() - start, kind=kind, model=model_name)
+            chunks.append(text)
+            usage = chunk_usage or usage
+            flight.publish(text, model_name)
+            yield text
+    except GenerationError as e:
+        quota.release()
+        group.finish(cache_key, flight, e)
+        _record(start, labels, e.__class__.__name__, e.model_name)
+        raise
+    except GeneratorExit:
+        # Our page stopped reading (e.g. a rerun); anyone following gets a retryable error.
+        # Usage comes with the final chunk, so without it the reservation is returned.
+        if usage is None:
+            quota.release()
+        else:
+            quota.settle(usage)
+        group.finish(cache_key, flight, UpstreamUnavailableError(
+            "The shared request was cancelled before it finished; please try again", model_name))
+        raise
+    except BaseException as e:
+        quota.release()
+        group.finish(cache_key, flight, e)
+        raise
+
+    router.get_tracker().observe(model_name, output_type or kind, time.perf_counter() - call_start)
+    cache.set(_answer_key(cache_key, key_text, user_profile, plan, model_name), "".join(chunks))
+    group.finish(cache_key, flight)
+    quota.settle(usage)
+    metrics.record_usage(usage, model_name, user_profile)
+    _record_saved(usage, kind)
+    _record(start, labels, 'ok', model_name)
+
+
+def generate_response(prompt, user_profile, use_cache=True, output_type=None,
+                      priority=scheduler.INTERACTIVE, on_queue=None):
+    """Return the model's answer, raising a GenerationError if there is none.
+
+    `on_queue(position, eta_seconds)` is called while waiting for quota.
+    """
+    config = _configured()
+    contents = build_system_prompt(prompt, user_profile)
+    return _generate(config, contents, prompt, user_profile, use_cache, 'restoration', output_type, priority,
+                     on_queue, restoration_prefix(contents, output_type))
+
+
+def stream_response(prompt, user_profile, use_cache=True, output_type=None,
+                    priority=scheduler.INTERACTIVE, on_queue=None):
+    # Same as generate_response, but yields text chunks as the model produces them
+    config = _configured()
+    contents = build_system_prompt(prompt, user_profile)
+    yield from _stream(config, contents, prompt, user_profile, use_cache, 'restoration', output_type, priority,
+                       on_queue, restoration_prefix(contents, output_type))
+
+
+def _chat_first_turn(user_profile):
+    def first_turn(summary_text, question):
+        earlier = f"Summary of the conversation so far: {summary_text}\n\n" if summary_text else ""
+        return build_system_prompt(f"{earlier}Art restoration question: {question}", user_profile)
+    return first_turn
+
+
+def build_chat_context(messages, user_profile, summary, on_queue=None):
+    """Multi-turn contents for the chat, kept within the token budget."""
+    config = _configured()
+
+    def summarize(previous, folded):
+        contents = chat_context.summary_prompt(previous, folded)
+        return _generate(config, contents, contents, user_profile, True, 'summary', None, scheduler.CHAT, on_queue)
+
+    return chat_context.build_context(messages, summary, _chat_first_turn(user_profile), summarize)
+
+
+def generate_chat_response(context, user_profile, use_cache=True, on_queue=None):
+    config = _configured()
+    return _generate(config, context.contents, json.dumps(context.contents), user_profile, use_cache, 'chat', None,
+                     scheduler.CHAT, on_queue, chat_prefix(context.contents))
+
+
+def stream_chat_response(context, user_profile, use_cache=True, on_queue=None):
+    config = _configured()
+    yield from _stream(config, context.contents, json.dumps(context.contents), user_profile, use_cache, 'chat', None,
+                       scheduler.CHAT, on_queue, chat_prefix(context.contents))
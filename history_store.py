@@ -0,0 +1,188 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+HISTORY_PATH = os.getenv("ARTRESTORER_HISTORY_PATH", "data/history.sqlite3")
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_email TEXT NOT NULL,
+        created REAL NOT NULL,
+        artwork TEXT NOT NULL DEFAULT '',
+        period TEXT NOT NULL DEFAULT '',
+        damage TEXT NOT NULL DEFAULT '',
+        output TEXT NOT NULL DEFAULT '',
+        response TEXT NOT NULL DEFAULT ''
+    )""",
+    "CREATE INDEX IF NOT EXISTS history_user_time ON history(user_email, created DESC)",
+    "CREATE INDEX IF NOT EXISTS history_user_artwork ON history(user_email, artwork, created DESC)",
+    "CREATE INDEX IF NOT EXISTS history_user_output ON history(user_email, output, created DESC)",
+]
+
+# Full-text index over damage and response, kept in sync by triggers
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+        damage, response, content='history', content_rowid='id')""",
+    """CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+        INSERT INTO history_fts(rowid, damage, response) VALUES (new.id, new.damage, new.response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+        INSERT INTO history_fts(history_fts, rowid, damage, response) VALUES ('delete', old.id, old.damage, old.response);
+    END""",
+]
+
+COLUMNS = "id, created, artwork, period, damage, output, response"
+
+
+def _fts_query(text):
+    # Quote every term so user input can't break the MATCH syntax; prefix-match each
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+def _to_record(row):
+    return {
+        'id': row[0], 'time': datetime.fromtimestamp(row[1]),
+        'artwork': row[2], 'period': row[3], 'damage': row[4],
+        'output': row[5], 'response': row[6],
+    }
+
+
+class HistoryStore:
+    """Saved restoration outputs per user, persisted in SQLite."""
+
+    def __init__(self, path=HISTORY_PATH):
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ':memory:':
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            try:
+                for statement in FTS_SCHEMA:
+                    self._conn.execute(statement)
+                self.full_text = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: fall back to LIKE scans
+                self.full_text = False
+            self._conn.commit()
+
+    def add(self, user_email, record):
+        created = record.get('time') or datetime.now()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO history (user_email, created, artwork, period, damage, output, response) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_email, created.timestamp(), record.get('artwork', ''), record.get('period', ''),
+                 record.get('damage', ''), record.get('output', ''), record.get('response', '')))
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def delete(self, user_email, record_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM history WHERE id = ? AND user_email = ?", (record_id, user_email))
+            self._conn.commit()
+
+    def get(self, user_email, record_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {COLUMNS} FROM history WHERE id = ? AND user_email = ?",
+                (record_id, user_email)).fetchone()
+        return _to_record(row) if row else None
+
+    def _where(self, user_email, artwork=None, output=None, query=None):
+        clauses = ["user_email = ?"]
+        params = [user_email]
+        if artwork:
+            clauses.append("artwork = ?")
+            params.append(artwork)
+        if output:
+            clauses.append("output = ?")
+            params.append(output)
+        if query and query.strip():
+            if self.full_text:
+                match = _fts_query(query)
+                if match:
+                    clauses.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+                    params.append(match)
+            else:
+                clauses.append("(damage LIKE ? OR response LIKE ?)")
+                params.extend([f"%{query.strip()}%"] * 2)
+        return " AND ".join(clauses), params
+
+    def count(self, user_email, artwork=None, output=None, query=None):
+        where, params = self._where(user_email, artwork, output, query)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+
+    def page(self, user_email, page=0, page_size=10, artwork=None, output=None, query=None):
+        """Newest-first slice of a user's records; only this slice is loaded."""
+        where, params = self._where(user_email, artwork, output, query)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {COLUMNS} FROM history WHERE {where} ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+                params + [page_size, page * page_size]).fetchall()
+        return [_to_record(row) for row in rows]
+
+    def iter_records(self, user_email, artwork=None, output=None, query=None, batch_size=500):
+        """Every matching record, newest first, fetched `batch_size` rows at a time.
+
+        Batches continue after the last (created, id) seen rather than using
+        OFFSET, so each one costs the same and the lock is only held per batch.
+        """
+        where, params = self._where(user_email, artwork, output, query)
+        after = None
+        while True:
+            clause, extra = where, []
+            if after:
+                clause += " AND (created < ? OR (created = ? AND id < ?))"
+                extra = [after[0], after[0], after[1]]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {COLUMNS} FROM history WHERE {clause} ORDER BY created DESC, id DESC LIMIT ?",
+                    params + extra + [batch_size]).fetchall()
+            for row in rows:
+                yield _to_record(row)
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][1], rows[-1][0])
+
+    def output_transitions(self):
+        """{(output, next output): count} over records saved for the same artwork and damage."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prev, output, COUNT(*) FROM ("
+                "  SELECT output, LAG(output) OVER ("
+                "    PARTITION BY user_email, artwork, damage ORDER BY created, id) AS prev FROM history"
+                ") WHERE prev IS NOT NULL AND prev != output GROUP BY prev, output").fetchall()
+        return {(prev, output): count for prev, output, count in rows}
+
+    def facets(self, user_email):
+        with self._lock:
+            artworks = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT artwork FROM history WHERE user_email = ? AND artwork != '' ORDER BY artwork",
+                (user_email,))]
+            outputs = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT output FROM history WHERE user_email = ? AND output != '' ORDER BY output",
+                (user_email,))]
+        return artworks, outputs
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # One connection per process, shared by every session
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore()
+    return _store
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import scheduler
+import similarity_index
+from generation import (GenerationError, build_chat_context, generate_chat_response, generate_response,
+                        stream_chat_response, stream_response)
+
+# Mostly waiting on the network or the scheduler, so threads are cheap
+JOB_WORKERS = int(os.getenv("ARTRESTORER_JOB_WORKERS", "32"))
+# Workers one user's jobs may hold at once, the rest wait in that user's queue; the
+# scheduler lets a user start this many requests at once, so more would only sit blocked
+USER_JOB_WORKERS = int(os.getenv("ARTRESTORER_USER_JOB_WORKERS", str(scheduler.USER_BURST)))
+# Finished jobs wait this long for a page to pick them up
+JOB_TTL = 3600
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    def __init__(self, owner, kind, meta=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.kind = kind
+        self.meta = meta or {}
+        self.status = QUEUED
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        # Text streamed so far and the scheduler queue position, for pages polling the job
+        self.chunks = []
+        self.queue = None
+        self._finished = threading.Event()
+
+    @property
+    def pending(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def on_queue(self, position, eta):
+        self.queue = (position, eta)
+
+    def collect(self, chunks):
+        for text in chunks:
+            self.queue = None
+            self.chunks.append(text)
+        return self.text
+
+
+class JobExecutor:
+    """Runs generation on shared worker threads so it outlives the script run that started it.
+
+    Pages keep only job IDs in session state and poll get() for the result.
+    Jobs queue per owner and workers take them round-robin, with at most
+    `user_workers` running for one owner. A job waiting for quota in the
+    scheduler holds its worker, so without the cap one user's pile of
+    regenerations would fill every worker and keep other users' jobs from
+    ever reaching the scheduler's fair share.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, ttl=JOB_TTL, user_workers=USER_JOB_WORKERS):
+        self.ttl = ttl
+        self.user_workers = max(1, min(user_workers, workers))
+        self._jobs = {}
+        # owner -> deque of (job, fn) not started yet; dict order is the round-robin order
+        self._queued = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"artrestorer-job-{i}", daemon=True).start()
+
+    def submit(self, owner, kind, fn, meta=None):
+        """Run fn(job) in the background; returns the job ID."""
+        job = Job(owner, kind, meta)
+        with self._cond:
+            self._prune()
+            self._jobs[job.id] = job
+            self._queued.setdefault(owner, deque()).append((job, fn))
+            self._cond.notify()
+        return job.id
+
+    def _next(self):
+        # Called with the lock held: the first owner in line with a free worker slot
+        for owner, queue in self._queued.items():
+            if self._running.get(owner, 0) < self.user_workers:
+                job, fn = queue.popleft()
+                if queue:
+                    self._queued.move_to_end(owner)
+                else:
+                    del self._queued[owner]
+                self._running[owner] = self._running.get(owner, 0) + 1
+                return job, fn
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next()
+            job, fn = task
+            try:
+                self._run(job, fn)
+            finally:
+                with self._cond:
+                    self._running[job.owner] -= 1
+                    if not self._running[job.owner]:
+                        del self._running[job.owner]
+                    # This owner may have jobs waiting for the slot just freed
+                    self._cond.notify_all()
+
+    def _run(self, job, fn):
+        job.status = RUNNING
+        try:
+            job.result = fn(job)
+            job.status = DONE
+        except GenerationError as e:
+            job.error = str(e)
+            job.status = FAILED
+        except Exception as e:
+            job.error = f"Error generating response: {str(e)}"
+            job.status = FAILED
+        job.queue = None
+        job.finished = time.time()
+        job._finished.set()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_ids, timeout):
+        """Wait up to `timeout` seconds in total for the jobs to finish; True if they all did."""
+        deadline = time.monotonic() + timeout
+        for job_id in job_ids:
+            job = self.get(job_id)
+            if job is not None and not job._finished.wait(max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def for_owner(self, owner, kind=None):
+        """A user's jobs from every session, newest first."""
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.owner == owner and (kind is None or j.kind == kind)]
+        return sorted(jobs, key=lambda j: j.created, reverse=True)
+
+
+def restoration_job(request, user_profile, stream):
+    def run(job):
+        if stream:
+            response = job.collect(stream_response(request['prompt'], user_profile, use_cache=request['use_cache'],
+                                                   output_type=request['output'], on_queue=job.on_queue))
+        else:
+            response = generate_response(request['prompt'], user_profile, use_cache=request['use_cache'],
+                                         output_type=request['output'], on_queue=job.on_queue)
+        similarity_index.get_index().add(request['similar_text'], response, request['similar_scope'])
+        return response
+    return run
+
+
+def prefetch_job(request, user_profile):
+    # Only warms the response cache (and coalesces with the real request if it comes in meanwhile)
+    def run(job):
+        return generate_response(request['prompt'], user_profile, output_type=request['output'],
+                                 priority=scheduler.PREFETCH)
+    return run
+
+
+def chat_job(messages, user_profile, summary, stream, similar_scope=None):
+    """Answers the last message; the result carries the updated summary too.
+
+    `messages` start at summary['upto']; the ones before are already in the summary.
+    """
+    offset = summary['upto']
+
+    def run(job):
+        context = build_chat_context(messages, user_profile, dict(summary, upto=0), on_queue=job.on_queue)
+        if stream:
+            response = job.collect(stream_chat_response(context, user_profile, on_queue=job.on_queue))
+        else:
+            response = generate_chat_response(context, user_profile, on_queue=job.on_queue)
+        if similar_scope:
+            similarity_index.get_index().add(messages[-1]['content'], response, similar_scope)
+        summary_after = dict(context.summary, upto=context.summary['upto'] + offset)
+        return {'response': response, 'summary': summary_after, 'tokens': context.tokens}
+    return run
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # One pool per process, shared by every session
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = JobExecutor()
+    return _executor
@@ -0,0 +1,313 @@
+import itertools
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import metrics
+from chat_context import estimate_tokens
+
+# Plain-text and Markdown reference documents added by users (data/ is kept out of git)
+KNOWLEDGE_DIR = os.getenv("ARTRESTORER_KNOWLEDGE_DIR", "data/knowledge")
+DOCUMENT_EXTENSIONS = ('.txt', '.md')
+# Who uploaded each document; files placed in the directory by hand have no owner and are shared
+OWNERS_FILE = "owners.json"
+# Documents uploaded by these users are shared with everyone, and they may remove any document
+ADMINS = {e.strip().lower() for e in os.getenv("ARTRESTORER_KNOWLEDGE_ADMINS", "").split(',') if e.strip()}
+# Reference notes added to each restoration prompt; 0 turns retrieval off
+PROMPT_TOKEN_BUDGET = int(os.getenv("ARTRESTORER_KNOWLEDGE_TOKENS", "300"))
+PROMPT_PASSAGES = 4
+# Documents are split into passages of about this many words
+PASSAGE_WORDS = 120
+# BM25 parameters (the usual defaults)
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it', 'its', 'of',
+    'on', 'or', 'that', 'the', 'to', 'was', 'were', 'with', 'this', 'these', 'there', 'not', 'no', 'but',
+}
+
+# The Art Guide page is rendered from these, and they are also the built-in passages
+GUIDE_SECTIONS = [
+    {'title': "🎨 Major Art Periods", 'name': "Major Art Periods", 'style': 'paragraphs', 'entries': [
+        ("Ancient (3000 BCE - 400 CE)", "Egyptian, Greek, Roman"),
+        ("Medieval (400 - 1400)", "Byzantine, Romanesque, Gothic"),
+        ("Renaissance (1400 - 1600)", "Linear perspective, naturalism, humanism"),
+        ("Baroque (1600 - 1750)", "Drama, movement, rich color"),
+        ("Modern (1850 - 1970)", "Impressionism, Expressionism, Cubism, Abstract"),
+        ("Contemporary (1970 - Present)", "Diverse movements, new media"),
+    ]},
+    {'title': "🔧 Common Damage Types", 'name': "Common Damage Types", 'style': 'bullets', 'entries': [
+        ("Paint Layer Damage", "Cracking, flaking, blistering"),
+        ("Canvas Issues", "Tears, punctures, sagging"),
+        ("Environmental", "Water stains, mold growth"),
+        ("Chemical", "Darkened varnish, oxidation"),
+        ("Physical", "Scratches, broken fragments"),
+    ]},
+    {'title': "⚖️ Ethical Principles", 'name': "Ethical Principles", 'style': 'bullets', 'entries': [
+        ("Respect for Authenticity", ""),
+        ("Minimal Intervention", ""),
+        ("Reversibility", ""),
+        ("Documentation", ""),
+        ("Cultural Sensitivity", ""),
+        ("Professional Competence", ""),
+    ]},
+]
+
+
+def tokenize(text):
+    # Lowercase words, minus stopwords, with a plural "s" dropped so "stains" matches "stain"
+    terms = []
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def guide_passages():
+    passages = []
+    for section in GUIDE_SECTIONS:
+        for name, description in section['entries']:
+            text = f"{name}: {description}" if description else name
+            passages.append({'source': f"Art Guide · {section['name']}", 'title': name, 'text': text})
+    return passages
+
+
+def split_passages(text, words=PASSAGE_WORDS):
+    """Paragraphs merged (or long ones cut) into chunks of about `words` words."""
+    chunks, current = [], []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph_words = paragraph.split()
+        while len(paragraph_words) > words:
+            if current:
+                chunks.append(' '.join(current))
+                current = []
+            chunks.append(' '.join(paragraph_words[:words]))
+            paragraph_words = paragraph_words[words:]
+        if current and len(current) + len(paragraph_words) > words:
+            chunks.append(' '.join(current))
+            current = []
+        current.extend(paragraph_words)
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+def is_admin(user):
+    return bool(user) and user.lower() in ADMINS
+
+
+def document_passages(directory=KNOWLEDGE_DIR, owners=None):
+    # A passage's owner is None when every user may see it
+    owners = owners or {}
+    passages = []
+    if not directory or not os.path.isdir(directory):
+        return passages
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(DOCUMENT_EXTENSIONS):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except OSError:
+            continue
+        owner = owners.get(filename)
+        if is_admin(owner):
+            owner = None
+        for i, chunk in enumerate(split_passages(text)):
+            passages.append({'source': filename, 'title': f"{filename} #{i + 1}", 'text': chunk, 'owner': owner})
+    return passages
+
+
+class BM25Index:
+    """Inverted index over passages, ranked with Okapi BM25.
+
+    Postings map each term to (passage, term frequency) pairs, so a query
+    only touches passages sharing at least one of its terms.
+    """
+
+    def __init__(self, passages):
+        start = time.perf_counter()
+        self.passages = passages
+        self.postings = {}
+        self.lengths = []
+        for i, passage in enumerate(passages):
+            counts = Counter(tokenize(passage['text']))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((i, tf))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+        self.build_seconds = time.perf_counter() - start
+        metrics.knowledge_seconds.observe(self.build_seconds, op='build')
+
+    def search(self, query, k=5, visible=None):
+        """Top-k (score, passage) pairs, best first; passages sharing no term are left out.
+
+        `visible(passage)`, when given, leaves out the passages it returns False for.
+        """
+        start = time.perf_counter()
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                if visible and not visible(self.passages[i]):
+                    continue
+                norm = K1 * (1 - B + B * self.lengths[i] / self.average_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        metrics.knowledge_seconds.observe(time.perf_counter() - start, op='query')
+        return [(score, self.passages[i]) for i, score in best]
+
+    def stats(self):
+        return {
+            'passages': len(self.passages),
+            'terms': len(self.postings),
+            'build_seconds': self.build_seconds,
+        }
+
+
+class KnowledgeBase:
+    """The Art Guide plus user documents, searchable offline.
+
+    A user sees the guide, shared documents and their own uploads; other
+    users' uploads are never searched or quoted for them.
+    """
+
+    def __init__(self, directory=KNOWLEDGE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._owners_lock = threading.Lock()
+        self.index = self._build()
+
+    def _build(self):
+        return BM25Index(guide_passages() + document_passages(self.directory, self.owners()))
+
+    def owners(self):
+        try:
+            with open(os.path.join(self.directory, OWNERS_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _set_owner(self, filename, owner):
+        with self._owners_lock:
+            owners = self.owners()
+            if owner is None:
+                owners.pop(filename, None)
+            else:
+                owners[filename] = owner
+            path = os.path.join(self.directory, OWNERS_FILE)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(owners, f)
+            os.replace(path + '.tmp', path)
+
+    def can_remove(self, filename, user):
+        owner = self.owners().get(filename)
+        return is_admin(user) or (owner is not None and owner == user)
+
+    def rebuild(self):
+        index = self._build()
+        with self._lock:
+            self.index = index
+        return index
+
+    def search(self, query, k=5, user=None):
+        """Passages from the guide, shared documents and `user`'s own uploads."""
+        with self._lock:
+            index = self.index
+        if is_admin(user):
+            return index.search(query, k)
+        return index.search(query, k, lambda passage: passage.get('owner') in (None, user))
+
+    def _document_names(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if f.lower().endswith(DOCUMENT_EXTENSIONS))
+
+    def documents(self, user=None):
+        """Document names `user` can see: shared ones and their own (admins see all)."""
+        names = self._document_names()
+        if is_admin(user):
+            return names
+        owners = self.owners()
+        return [name for name in names if owners.get(name) in (None, user) or is_admin(owners.get(name))]
+
+    def add_document(self, filename, text, user=None):
+        """Save `user`'s reference document and re-index; returns the stored file name.
+
+        The directory is shared by every user, so an existing document is
+        never replaced: a clashing name gets a "-2", "-3", ... suffix instead.
+        """
+        filename = os.path.basename(filename) or 'document.txt'
+        if not filename.lower().endswith(DOCUMENT_EXTENSIONS):
+            filename += '.txt'
+        stem, extension = os.path.splitext(filename)
+        os.makedirs(self.directory, exist_ok=True)
+        for n in itertools.count(1):
+            name = filename if n == 1 else f"{stem}-{n}{extension}"
+            try:
+                # 'x' fails if the file exists, so two uploads at once can't pick the same name
+                with open(os.path.join(self.directory, name), 'x', encoding='utf-8') as f:
+                    f.write(text)
+                break
+            except FileExistsError:
+                continue
+        if user:
+            self._set_owner(name, user)
+        self.rebuild()
+        return name
+
+    def remove_document(self, filename, user=None):
+        """Delete a document; raises PermissionError unless `user` uploaded it or is an admin."""
+        filename = os.path.basename(filename)
+        if not self.can_remove(filename, user):
+            raise PermissionError(f"{filename} can only be removed by the user who added it")
+        path = os.path.join(self.directory, filename)
+        if os.path.exists(path):
+            os.remove(path)
+            self._set_owner(filename, None)
+            self.rebuild()
+
+    def reference_notes(self, artwork_type, art_period, damage, budget=PROMPT_TOKEN_BUDGET, user=None):
+        """Best-matching passages `user` may see for a restoration request, within `budget` tokens."""
+        if budget <= 0:
+            return []
+        notes, used = [], 0
+        for _, passage in self.search(f"{artwork_type} {art_period} {damage}", PROMPT_PASSAGES, user):
+            cost = estimate_tokens(passage['text'])
+            if used + cost > budget:
+                continue
+            notes.append(passage['text'])
+            used += cost
+        return notes
+
+    def stats(self):
+        with self._lock:
+            stats = self.index.stats()
+        stats['documents'] = len(self._document_names())
+        return stats
+
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base():
+    # One index per process, shared by every session
+    global _knowledge_base
+    if _knowledge_base is None:
+        with _knowledge_base_lock:
+            if _knowledge_base is None:
+                _knowledge_base = KnowledgeBase()
+    return _knowledge_base
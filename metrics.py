@@ -0,0 +1,243 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = os.getenv("ARTRESTORER_METRICS_PORT")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# For local work measured in microseconds to milliseconds
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+# For token counts rather than seconds
+TOKEN_BUCKETS = (0, 100, 250, 500, 1000, 2500, 5000, 10000, 32768, 131072)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in items]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self.values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.samples().items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return {key: list(series) for key, series in self.values.items()}
+
+    def summary(self, series):
+        """count, mean and estimated p50/p95 for one label series."""
+        counts = series[:-1]
+        total = sum(counts)
+        if not total:
+            return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0}
+        return {
+            'count': total,
+            'mean': series[-1] / total,
+            'p50': self._quantile(counts, total, 0.5),
+            'p95': self._quantile(counts, total, 0.95),
+        }
+
+    def _quantile(self, counts, total, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        target = q * total
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and seen + count >= target:
+                return lower + (upper - lower) * (target - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.samples().items():
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += series[i]
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+
+def counter(name, help_text):
+    metric = Counter(name, help_text)
+    REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help_text, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+
+generate_seconds = histogram(
+    "artrestorer_generate_seconds", "Time to produce a full answer, including cache lookups and retries")
+first_chunk_seconds = histogram(
+    "artrestorer_first_chunk_seconds", "Time until the first streamed chunk reaches the page")
+generate_requests = counter(
+    "artrestorer_generate_requests_total", "Generation requests by kind, output type, model, cache status and outcome")
+generation_errors = counter(
+    "artrestorer_generation_errors_total", "Failed generation requests by error class")
+tokens = counter(
+    "artrestorer_tokens_total", "Tokens reported in response usage metadata")
+coalesced_requests = counter(
+    "artrestorer_coalesced_requests_total", "Requests that shared an identical in-flight call instead of making their own")
+queue_wait_seconds = histogram(
+    "artrestorer_queue_wait_seconds", "Time a request waited in the scheduler for its share of the API quota")
+prefetches = counter(
+    "artrestorer_prefetches_total", "Speculative generations of the output type usually requested next")
+config_resolve_seconds = histogram(
+    "artrestorer_config_resolve_seconds", "Time spent resolving the Gemini client (key lookup and model discovery)")
+config_lookups = counter(
+    "artrestorer_config_lookups_total", "Gemini client lookups, by whether a cached client was reused")
+knowledge_seconds = histogram(
+    "artrestorer_knowledge_seconds", "Knowledge base index builds and queries, by operation", FAST_BUCKETS)
+prompt_tokens_saved = histogram(
+    "artrestorer_prompt_tokens_saved", "Prompt tokens per model call served from cached content instead of being sent",
+    TOKEN_BUCKETS)
+context_caches = counter(
+    "artrestorer_context_caches_total", "Cached-content registrations of shared prompt prefixes, by outcome")
+
+
+def record_usage(usage, model, user_profile):
+    """Add prompt/output token counts from a response's usage_metadata."""
+    if usage is None:
+        return
+    labels = {
+        'model': model or 'unknown',
+        'experience': user_profile.get('experience', 'intermediate'),
+        'length': user_profile.get('length', 5),
+    }
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    # Already part of prompt_token_count, but not sent with the request
+    cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+    if prompt_tokens:
+        tokens.inc(prompt_tokens, direction='prompt', **labels)
+    if output_tokens:
+        tokens.inc(output_tokens, direction='output', **labels)
+    if cached_tokens:
+        tokens.inc(cached_tokens, direction='cached', **labels)
+
+
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def latency_by(label, metric=None, **match):
+    """Per-value latency summaries of a histogram (generate_seconds by default) grouped by one label."""
+    metric = metric or generate_seconds
+    grouped = {}
+    for key, series in metric.samples().items():
+        labels = dict(key)
+        if any(labels.get(k) != v for k, v in match.items()):
+            continue
+        bucket = grouped.setdefault(labels.get(label, ''), [0] * len(series))
+        for i, value in enumerate(series):
+            bucket[i] += value
+    return {value: metric.summary(series) for value, series in grouped.items()}
+
+
+def totals(metric, label):
+    grouped = {}
+    for key, value in metric.samples().items():
+        name = dict(key).get(label, '')
+        grouped[name] = grouped.get(name, 0) + value
+    return grouped
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port=METRICS_PORT):
+    """Serve /metrics for Prometheus from a daemon thread (once per process)."""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(('0.0.0.0', int(port)), _MetricsHandler)
+            except OSError:
+                # Port taken, e.g. by another worker process; skip rather than crash the page
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
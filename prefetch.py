@@ -0,0 +1,56 @@
+import threading
+from collections import Counter, OrderedDict
+
+import history_store
+
+# A next output needs this many observations before it is prefetched
+MIN_SUPPORT = 2
+# Artworks remembered per process for spotting what is asked next
+MAX_RECENT = 10000
+
+
+class NextOutputModel:
+    """Counts which output type people ask for next about the same artwork."""
+
+    def __init__(self, transitions=None):
+        self._transitions = {}
+        # (user, artwork text) -> last output type requested, oldest first
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+        for (output, next_output), count in (transitions or {}).items():
+            self._transitions.setdefault(output, Counter())[next_output] += count
+
+    def record(self, user, artwork, output):
+        key = (user, artwork)
+        with self._lock:
+            previous = self._last.pop(key, None)
+            self._last[key] = output
+            if len(self._last) > MAX_RECENT:
+                self._last.popitem(last=False)
+            if previous and previous != output:
+                self._transitions.setdefault(previous, Counter())[output] += 1
+
+    def predict(self, output, exclude=()):
+        """Most common output type requested after `output`, or None if there is no clear pattern."""
+        with self._lock:
+            counts = list(self._transitions.get(output, Counter()).most_common())
+        for next_output, count in counts:
+            if count < MIN_SUPPORT:
+                break
+            if next_output not in exclude:
+                return next_output
+        return None
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    # One model per process, seeded from what people saved before
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = NextOutputModel(history_store.get_store().output_transitions())
+    return _model
@@ -0,0 +1,270 @@
+import os
+import random
+import threading
+import time
+
+import context_cache
+
+# Per-call timeout handed to the SDK, and the overall budget for one request
+CALL_TIMEOUT_SECONDS = float(os.getenv("ARTRESTORER_CALL_TIMEOUT", "60"))
+TOTAL_DEADLINE_SECONDS = float(os.getenv("ARTRESTORER_TOTAL_DEADLINE", "120"))
+MAX_ATTEMPTS = int(os.getenv("ARTRESTORER_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_SECONDS = float(os.getenv("ARTRESTORER_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX_SECONDS = float(os.getenv("ARTRESTORER_BACKOFF_MAX", "16"))
+BREAKER_FAILURES = int(os.getenv("ARTRESTORER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("ARTRESTORER_BREAKER_RESET", "30"))
+
+
+class GenerationError(Exception):
+    """Base for every failure of a model call; never cached or saved as an answer."""
+    retryable = False
+    fallback = False
+
+    def __init__(self, message, model_name=None):
+        super().__init__(message)
+        self.model_name = model_name
+
+
+class ConfigurationError(GenerationError):
+    pass
+
+
+class RateLimitedError(GenerationError):
+    retryable = True
+    fallback = True
+
+
+class UpstreamUnavailableError(GenerationError):
+    retryable = True
+    fallback = True
+
+
+class DeadlineExceededError(GenerationError):
+    retryable = True
+    fallback = True
+
+
+class ModelNotAvailableError(GenerationError):
+    fallback = True
+
+
+class CircuitOpenError(GenerationError):
+    fallback = True
+
+
+class InvalidRequestError(GenerationError):
+    pass
+
+
+class BlockedResponseError(GenerationError):
+    pass
+
+
+def classify(exc, model_name=None):
+    """Turn an SDK/transport exception into one of the GenerationError types."""
+    if isinstance(exc, GenerationError):
+        return exc
+    message = str(exc) or exc.__class__.__name__
+    name = exc.__class__.__name__
+    code = getattr(exc, 'code', None)
+    if not isinstance(code, int):
+        code = None
+
+    if code == 429 or name in ('ResourceExhausted', 'TooManyRequests'):
+        return RateLimitedError(message, model_name)
+    if code == 504 or name in ('DeadlineExceeded', 'TimeoutError', 'ReadTimeout'):
+        return DeadlineExceededError(message, model_name)
+    if (code is not None and code >= 500) or name in ('ServiceUnavailable', 'InternalServerError', 'ServerError', 'ConnectionError'):
+        return UpstreamUnavailableError(message, model_name)
+    if code == 404 or name == 'NotFound':
+        return ModelNotAvailableError(message, model_name)
+    # response.text raises ValueError when the candidate was blocked or empty
+    if isinstance(exc, ValueError) and ('finish_reason' in message or 'safety' in message.lower()):
+        return BlockedResponseError(message, model_name)
+    return InvalidRequestError(message, model_name)
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, then lets one probe through."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(model_name):
+    # One breaker per model, shared by every session in the process
+    with _breakers_lock:
+        if model_name not in _breakers:
+            _breakers[model_name] = CircuitBreaker()
+        return _breakers[model_name]
+
+
+def breaker_states():
+    with _breakers_lock:
+        return {name: b.state for name, b in _breakers.items()}
+
+
+def backoff_delay(attempt):
+    # Full jitter: uniform in [0, base * 2^attempt], capped
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def model_chain(config, preferred=None):
+    """`preferred` (or the resolved model) first, then the other available preferred models."""
+    chain = [preferred] if preferred else []
+    if config.model_name not in chain:
+        chain.append(config.model_name)
+    for name in config.fallback_models():
+        if name not in chain:
+            chain.append(name)
+    return chain
+
+
+def _attempts(config, deadline, preferred=None):
+    # Yields (model_name, model, timeout) for each try, sleeping between retries
+    last_error = None
+    for model_name in model_chain(config, preferred):
+        breaker = breaker_for(model_name)
+        for attempt in range(MAX_ATTEMPTS):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(
+                    f"Gave up after {TOTAL_DEADLINE_SECONDS:.0f}s: {last_error or 'no response'}", model_name)
+            if not breaker.allow():
+                last_error = CircuitOpenError(f"{model_name} is failing; skipping it for now", model_name)
+                break
+            error = yield model_name, config.get_model(model_name), min(CALL_TIMEOUT_SECONDS, remaining)
+            last_error = error
+            if not isinstance(error, (RateLimitedError, UpstreamUnavailableError, DeadlineExceededError)):
+                # Our request, not the upstream, is at fault
+                breaker.record_success()
+            if not error.retryable:
+                break
+            if attempt + 1 < MAX_ATTEMPTS:
+                time.sleep(min(backoff_delay(attempt), max(deadline - time.monotonic(), 0)))
+        if last_error is not None and not last_error.fallback:
+            raise last_error
+    raise last_error or UpstreamUnavailableError("No model could answer the request")
+
+
+def _cache_gone(error, cache_key):
+    # A cached-content call refused as missing or invalid: the prefix goes with the prompt again
+    if cache_key is None or not isinstance(error, (ModelNotAvailableError, InvalidRequestError)):
+        return False
+    context_cache.get_context_cache().discard(cache_key)
+    return True
+
+
+def call(config, contents, preferred=None, prefix=None, on_retry=None, **kwargs):
+    """generate_content with deadlines, retries, circuit breaking and model fallback.
+
+    Starts with `preferred` if given, else the resolved model. `prefix`, the
+    start of `contents` shared with other calls, is sent as cached content
+    where the model supports it. `on_retry()` runs before every upstream
+    request after the first (retries and fallbacks), e.g. to take quota for
+    it. Returns (response, model_name). Raises a GenerationError subclass on
+    failure.
+    """
+    deadline = time.monotonic() + TOTAL_DEADLINE_SECONDS
+    attempts = _attempts(config, deadline, preferred)
+    model_name, model, timeout = next(attempts)
+    first = True
+    while True:
+        if not first and on_retry:
+            on_retry()
+        first = False
+        request_model, request_contents, cache_key = context_cache.get_context_cache().prepare(
+            config, model_name, model, contents, prefix)
+        try:
+            response = request_model.generate_content(request_contents, request_options={'timeout': timeout}, **kwargs)
+            response.text  # raises for blocked / empty candidates
+        except Exception as e:
+            error = classify(e, model_name)
+            if _cache_gone(error, cache_key):
+                prefix = None
+                continue
+            if isinstance(error, (RateLimitedError, UpstreamUnavailableError, DeadlineExceededError)):
+                breaker_for(model_name).record_failure()
+            model_name, model, timeout = attempts.send(error)
+            continue
+        breaker_for(model_name).record_success()
+        return response, model_name
+
+
+def stream(config, contents, preferred=None, prefix=None, on_retry=None, **kwargs):
+    """Streaming variant of call(): yields (text_chunk, model_name, usage_metadata).
+
+    Retries and fallback only happen before the first chunk; once text has
+    reached the caller a failure is raised as-is.
+    """
+    deadline = time.monotonic() + TOTAL_DEADLINE_SECONDS
+    attempts = _attempts(config, deadline, preferred)
+    model_name, model, timeout = next(attempts)
+    first = True
+    while True:
+        if not first and on_retry:
+            on_retry()
+        first = False
+        started = False
+        request_model, request_contents, cache_key = context_cache.get_context_cache().prepare(
+            config, model_name, model, contents, prefix)
+        try:
+            for chunk in request_model.generate_content(request_contents, stream=True,
+                                                        request_options={'timeout': timeout}, **kwargs):
+                text = chunk.text
+                if text:
+                    started = True
+                    yield text, model_name, getattr(chunk, 'usage_metadata', None)
+        except Exception as e:
+            error = classify(e, model_name)
+            if isinstance(error, (RateLimitedError, UpstreamUnavailableError, DeadlineExceededError)):
+                breaker_for(model_name).record_failure()
+            if started:
+                raise error
+            if _cache_gone(error, cache_key):
+                prefix = None
+                continue
+            model_name, model, timeout = attempts.send(error)
+            continue
+        breaker_for(model_name).record_success()
+        return
@@ -0,0 +1,132 @@
+"""Restoration guidance from the command line, or as a local HTTP API, without the web UI.
+
+    python restore.py generate --artwork-type Painting --damage "Flaking paint" --output-type "Visitor Summary"
+    python restore.py guide "water stains"      # offline, no model call
+    python restore.py export --email me@example.org --format zip-md -o history.zip
+    python restore.py serve --port 8765
+
+Uses the same model configuration, cache, scheduler and metrics as the app.
+For whole catalogues see batch_restore.py.
+"""
+import argparse
+import json
+import sys
+import time
+
+import api
+import export
+import history_store
+import knowledge_base
+from generation import OUTPUT_TYPES, GenerationError, build_restoration_prompt, generate_response, stream_response
+
+
+def add_profile_arguments(parser):
+    parser.add_argument("--experience", default="intermediate", choices=["beginner", "intermediate", "advanced"])
+    parser.add_argument("--tone", default="academic", choices=["academic", "simplified"])
+    parser.add_argument("--creativity", type=int, default=5)
+    parser.add_argument("--length", type=int, default=5)
+
+
+def generate(args):
+    profile = {'experience': args.experience, 'tone': args.tone,
+               'creativity': args.creativity, 'length': args.length, 'email': 'cli'}
+    prompt = build_restoration_prompt(args.artwork_type, args.period, args.artist, args.region,
+                                      args.damage, args.output_type)
+    start = time.perf_counter()
+    try:
+        if args.stream and not args.json:
+            for text in stream_response(prompt, profile, use_cache=not args.no_cache, output_type=args.output_type):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            sys.stdout.write("\n")
+        else:
+            response = generate_response(prompt, profile, use_cache=not args.no_cache, output_type=args.output_type)
+            if args.json:
+                print(json.dumps({'response': response, 'seconds': round(time.perf_counter() - start, 3)},
+                                 ensure_ascii=False))
+            else:
+                print(response)
+    except GenerationError as e:
+        print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def guide(args):
+    for score, passage in knowledge_base.get_knowledge_base().search(args.query, args.k):
+        print(f"[{score:.2f}] {passage['source']}: {passage['text']}")
+    return 0
+
+
+def export_history(args):
+    records = history_store.get_store().iter_records(args.email, artwork=args.artwork, output=args.output_type,
+                                                    query=args.query)
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    count = 0
+    try:
+        for chunk in export.iter_export(records, args.format):
+            out.write(chunk)
+            count += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Wrote {count} bytes", file=sys.stderr)
+    return 0
+
+
+def serve(args):
+    server = api.make_server(args.host, args.port, verbose=args.verbose)
+    host, port = server.server_address[:2]
+    print(f"ArtRestorer API listening on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ArtRestorer AI without the web UI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="generate guidance for one artwork")
+    gen.add_argument("--artwork-type", required=True)
+    gen.add_argument("--damage", required=True)
+    gen.add_argument("--output-type", required=True, choices=OUTPUT_TYPES)
+    gen.add_argument("--period", default="")
+    gen.add_argument("--artist", default="")
+    gen.add_argument("--region", default="")
+    gen.add_argument("--stream", action="store_true", help="print the answer as it is generated")
+    gen.add_argument("--json", action="store_true", help="print a JSON object instead of plain text")
+    gen.add_argument("--no-cache", action="store_true", help="skip cached answers")
+    add_profile_arguments(gen)
+    gen.set_defaults(func=generate)
+
+    gd = commands.add_parser("guide", help="search the Art Guide and reference documents offline")
+    gd.add_argument("query")
+    gd.add_argument("-k", type=int, default=5, help="passages to show")
+    gd.set_defaults(func=guide)
+
+    exp = commands.add_parser("export", help="stream a user's saved history to a file")
+    exp.add_argument("--email", required=True)
+    exp.add_argument("--format", default="jsonl", choices=list(export.FORMATS))
+    exp.add_argument("--artwork")
+    exp.add_argument("--output-type")
+    exp.add_argument("--query", help="full-text search over damage and guidance")
+    exp.add_argument("-o", "--output", help="file to write (default: stdout)")
+    exp.set_defaults(func=export_history)
+
+    srv = commands.add_parser("serve", help="run the HTTP API")
+    srv.add_argument("--host", default=api.API_HOST)
+    srv.add_argument("--port", type=int, default=api.API_PORT)
+    srv.add_argument("--verbose", action="store_true", help="log every request")
+    srv.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
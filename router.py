@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+
+import gemini_client
+
+LATENCY_PATH = os.getenv("ARTRESTORER_LATENCY_PATH", ".cache/model_latency.json")
+# Weight of the newest observation in the moving average
+EWMA_ALPHA = 0.2
+SAVE_EVERY_SECONDS = 30
+
+# Output tokens at the middle Output Length setting (5/10)
+BASE_OUTPUT_TOKENS = {
+    'Visitor Summary': 300,
+    'Symbol Interpretation': 600,
+    'Conservation Advice': 700,
+    'Stylistic Reconstruction': 900,
+    'Restoration Technique': 1200,
+    'chat': 600,
+    'summary': 300,
+}
+DEFAULT_OUTPUT_TOKENS = 800
+
+# Seconds a full answer should take; the cheapest model that meets it wins
+TARGET_SECONDS = {
+    'Visitor Summary': 4,
+    'Symbol Interpretation': 8,
+    'Conservation Advice': 8,
+    'Stylistic Reconstruction': 15,
+    'Restoration Technique': 15,
+    'chat': 6,
+    'summary': 5,
+}
+DEFAULT_TARGET_SECONDS = 10
+
+# Worth the larger model whenever it stays within the target
+QUALITY_OUTPUTS = {'Restoration Technique', 'Stylistic Reconstruction'}
+
+
+def temperature(creativity):
+    # Creativity 1-10 -> 0.1-1.0
+    creativity = min(10, max(1, int(creativity)))
+    return round(0.1 + (creativity - 1) * 0.1, 2)
+
+
+def max_output_tokens(route, length):
+    # Output Length 1-10 scales the base budget from 0.6x to 1.5x
+    length = min(10, max(1, int(length)))
+    return int(BASE_OUTPUT_TOKENS.get(route, DEFAULT_OUTPUT_TOKENS) * (0.5 + length * 0.1))
+
+
+def is_quality_model(name):
+    return 'flash' not in name
+
+
+class LatencyTracker:
+    """Moving averages of answer time per model and route, saved between runs."""
+
+    def __init__(self, path=LATENCY_PATH):
+        self.path = path
+        self._averages = {}
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._averages = {tuple(k.split('|', 1)): v for k, v in json.load(f).items()}
+            except (OSError, ValueError):
+                self._averages = {}
+
+    def observe(self, model_name, route, seconds):
+        with self._lock:
+            for key in ((model_name, route), (model_name, '')):
+                previous = self._averages.get(key)
+                self._averages[key] = seconds if previous is None else previous + EWMA_ALPHA * (seconds - previous)
+            if time.monotonic() - self._saved_at >= SAVE_EVERY_SECONDS:
+                self._save()
+
+    def estimate(self, model_name, route):
+        """Expected seconds for this route, else for the model overall; None if never measured."""
+        with self._lock:
+            value = self._averages.get((model_name, route))
+            return value if value is not None else self._averages.get((model_name, ''))
+
+    def _save(self):
+        self._saved_at = time.monotonic()
+        if not self.path:
+            return
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump({'|'.join(k): v for k, v in self._averages.items()}, f)
+        except OSError:
+            # Only a hint for the next start; routing works without it
+            pass
+
+
+class Plan:
+    def __init__(self, model_name, generation_config, target_seconds, estimate=None):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.target_seconds = target_seconds
+        self.estimate = estimate
+
+
+def choose_model(config, route, tracker):
+    """(model name, expected seconds) for a route.
+
+    Quality routes try the larger models first, everything else the cheaper
+    ones. The first model whose measured latency meets the route's target
+    (or that hasn't been measured yet) is used; if none does, the fastest.
+    """
+    available = [name for name in gemini_client.PREFERRED_MODELS if name in config.available_models]
+    if config.model_name not in available:
+        available.insert(0, config.model_name)
+    prefer_quality = route in QUALITY_OUTPUTS
+    ordered = sorted(available, key=lambda name: is_quality_model(name) != prefer_quality)
+    target = TARGET_SECONDS.get(route, DEFAULT_TARGET_SECONDS)
+    estimates = {name: tracker.estimate(name, route) for name in ordered}
+    for name in ordered:
+        if estimates[name] is None or estimates[name] <= target:
+            return name, estimates[name]
+    fastest = min(ordered, key=lambda name: estimates[name])
+    return fastest, estimates[fastest]
+
+
+def plan(config, user_profile, route):
+    """Model and generation config for one request; `route` is the output type or 'chat'/'summary'."""
+    model_name, estimate = choose_model(config, route, get_tracker())
+    generation_config = {
+        'temperature': temperature(user_profile.get('creativity', 5)),
+        # Summaries have their own word limit, whatever the user's length setting
+        'max_output_tokens': max_output_tokens(route, 5 if route == 'summary' else user_profile.get('length', 5)),
+    }
+    return Plan(model_name, generation_config, TARGET_SECONDS.get(route, DEFAULT_TARGET_SECONDS), estimate)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    # One tracker per process, shared by every session
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = LatencyTracker()
+    return _tracker
@@ -0,0 +1,267 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Quota of the API key; 0 turns a limit off
+REQUESTS_PER_MINUTE = float(os.getenv("ARTRESTORER_REQUESTS_PER_MINUTE", "60"))
+TOKENS_PER_MINUTE = float(os.getenv("ARTRESTORER_TOKENS_PER_MINUTE", "1000000"))
+USER_REQUESTS_PER_MINUTE = float(os.getenv("ARTRESTORER_USER_REQUESTS_PER_MINUTE", "20"))
+# Bursts may use this many seconds' worth of quota at once
+BURST_SECONDS = 10
+# Requests one user may start at once, e.g. an "All Outputs" run plus a chat message
+USER_BURST = int(os.getenv("ARTRESTORER_USER_BURST", "6"))
+# Output tokens reserved when the caller has no cap; corrected from usage_metadata afterwards
+EXPECTED_OUTPUT_TOKENS = 1024
+# How often waiting requests report their queue position
+POLL_SECONDS = 0.5
+
+# Lower number = served first
+CHAT = 0
+INTERACTIVE = 1
+BATCH = 2
+# Speculative work nobody has asked for yet
+PREFETCH = 3
+PRIORITY_NAMES = {CHAT: 'chat', INTERACTIVE: 'interactive', BATCH: 'batch', PREFETCH: 'prefetch'}
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second up to BURST_SECONDS' worth (or min_capacity)."""
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS, min_capacity=1.0):
+        self.rate = per_minute / 60
+        self.capacity = max(float(min_capacity), self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (0 = now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        # A request bigger than the whole bucket goes once the bucket is full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        # Positive = more was used than reserved; the level may go negative (debt)
+        if not self.unlimited:
+            self.level -= amount
+
+
+class Ticket:
+    def __init__(self, user, priority, cost):
+        self.user = user
+        self.priority = priority
+        self.cost = cost
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.settled = False
+        self.waited = 0.0
+
+
+class Scheduler:
+    """Fair-share admission in front of model calls.
+
+    Requests queue per priority and, within a priority, per user; users are
+    served round-robin, so one user's pile of regenerations can't starve
+    anyone else. A request is admitted when the global request and token
+    buckets and that user's own request bucket all have room (batch rows
+    and prefetches skip the per-user bucket).
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 user_requests_per_minute=USER_REQUESTS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.user_requests_per_minute = user_requests_per_minute
+        self._user_buckets = {}
+        # priority -> user -> deque of tickets; dict order is the round-robin order
+        self._queues = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._cond = threading.Condition()
+        self.admitted = 0
+        self.queued_total = 0
+
+    def _user_bucket(self, user):
+        bucket = self._user_buckets.get(user)
+        if bucket is None:
+            bucket = self._user_buckets[user] = TokenBucket(self.user_requests_per_minute, min_capacity=USER_BURST)
+        return bucket
+
+    def _dispatch(self):
+        """Admit every request that can go now; returns seconds until the next might."""
+        while True:
+            now = time.monotonic()
+            chosen = None
+            wait = float('inf')
+            for priority in sorted(self._queues):
+                for user, queue in self._queues[priority].items():
+                    ticket = queue[0]
+                    global_wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(ticket.cost, now))
+                    # Batch and prefetch only get leftover quota anyway, so they don't eat the user's share
+                    user_wait = self._user_bucket(user).wait_time(1, now) if priority < BATCH else 0.0
+                    if not global_wait and not user_wait:
+                        chosen = ticket
+                        break
+                    wait = min(wait, max(global_wait, user_wait))
+                    if global_wait:
+                        # Out of global quota: nobody behind this request goes first
+                        return wait
+                if chosen:
+                    break
+            if chosen is None:
+                return wait
+
+            users = self._queues[chosen.priority]
+            users[chosen.user].popleft()
+            # Served users go to the back of the line
+            if users[chosen.user]:
+                users.move_to_end(chosen.user)
+            else:
+                del users[chosen.user]
+            self.requests.take(1)
+            self.tokens.take(chosen.cost)
+            if chosen.priority < BATCH:
+                self._user_bucket(chosen.user).take(1)
+            chosen.granted = True
+            chosen.waited = now - chosen.enqueued
+            self.admitted += 1
+            if chosen.waited > 0.01:
+                self.queued_total += 1
+            self._cond.notify_all()
+
+    def _position(self, ticket):
+        """(requests ahead of this one, estimated seconds until it is admitted)."""
+        ahead = 0
+        mine = list(self._queues[ticket.priority].get(ticket.user, ()))
+        rank = mine.index(ticket) if ticket in mine else 0
+        for priority, users in self._queues.items():
+            for user, queue in users.items():
+                if priority < ticket.priority:
+                    ahead += len(queue)
+                elif priority == ticket.priority and user != ticket.user:
+                    # Round-robin: each other user gets one turn per turn of ours
+                    ahead += min(len(queue), rank + 1)
+        ahead += rank
+        eta = 0.0
+        if not self.requests.unlimited:
+            eta = (ahead + 1) / self.requests.rate
+        user_bucket = self._user_bucket(ticket.user)
+        if not user_bucket.unlimited and ticket.priority < BATCH:
+            eta = max(eta, (rank + 1) / user_bucket.rate)
+        return ahead, eta
+
+    def acquire(self, user, priority=INTERACTIVE, tokens=0, on_wait=None, output_tokens=EXPECTED_OUTPUT_TOKENS):
+        """Block until the request may call the model; returns its Ticket.
+
+        `tokens` is the prompt size and `output_tokens` the most the answer
+        may use. `on_wait(position, eta_seconds)` is called from this thread
+        every POLL_SECONDS while the request is queued.
+        """
+        return self.wait(self.enqueue(user, priority, tokens, output_tokens), on_wait)
+
+    def enqueue(self, user, priority=INTERACTIVE, tokens=0, output_tokens=EXPECTED_OUTPUT_TOKENS):
+        """Queue a request without waiting; wait() must follow."""
+        ticket = Ticket(user or '', priority, tokens + output_tokens)
+        with self._cond:
+            self._queues[priority].setdefault(ticket.user, deque()).append(ticket)
+        return ticket
+
+    def wait(self, ticket, on_wait=None):
+        """Block until an enqueued ticket is admitted; see acquire()."""
+        try:
+            while True:
+                with self._cond:
+                    wait = self._dispatch()
+                    if ticket.granted:
+                        break
+                    position, eta = self._position(ticket)
+                if on_wait:
+                    on_wait(position, eta)
+                with self._cond:
+                    if not ticket.granted:
+                        self._cond.wait(min(wait, POLL_SECONDS))
+        except BaseException:
+            self._cancel(ticket)
+            raise
+        return ticket
+
+    def promote(self, ticket, priority):
+        """Move a still-queued request up to `priority`, e.g. because someone more urgent waits on its answer."""
+        with self._cond:
+            if ticket.granted or priority >= ticket.priority:
+                return
+            users = self._queues[ticket.priority]
+            queue = users.get(ticket.user)
+            if not queue or ticket not in queue:
+                return
+            queue.remove(ticket)
+            if not queue:
+                del users[ticket.user]
+            ticket.priority = priority
+            self._queues[priority].setdefault(ticket.user, deque()).append(ticket)
+            self._cond.notify_all()
+
+    def _cancel(self, ticket):
+        with self._cond:
+            queue = self._queues[ticket.priority].get(ticket.user)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.priority][ticket.user]
+            self._cond.notify_all()
+
+    def settle(self, ticket, used_tokens):
+        """Correct the token reservation once the real usage is known."""
+        if not used_tokens:
+            return
+        with self._cond:
+            if not ticket.settled:
+                ticket.settled = True
+                self.tokens.adjust(used_tokens - ticket.cost)
+
+    def release(self, ticket):
+        """Give back the token reservation of a call that failed; its request still counts."""
+        with self._cond:
+            if ticket.granted and not ticket.settled:
+                ticket.settled = True
+                self.tokens.adjust(-ticket.cost)
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            queued = {PRIORITY_NAMES[p]: sum(len(q) for q in users.values()) for p, users in self._queues.items()}
+        return {
+            'queued': queued,
+            'admitted': self.admitted,
+            'had_to_wait': self.queued_total,
+            'requests_per_minute': self.requests.rate * 60,
+            'tokens_per_minute': self.tokens.rate * 60,
+            'user_requests_per_minute': self.user_requests_per_minute,
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    # One scheduler per process, so the quota is shared by every session
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler()
+    return _scheduler
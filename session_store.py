@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime
+
+# Older chat messages and workspace results are written here once a session holds more than the caps
+SESSION_DIR = os.getenv("ARTRESTORER_SESSION_DIR", ".cache/sessions")
+MAX_OUTPUTS = int(os.getenv("ARTRESTORER_SESSION_OUTPUTS", "10"))
+MAX_CHAT_MESSAGES = int(os.getenv("ARTRESTORER_SESSION_CHAT_MESSAGES", "40"))
+# zlib only pays off above a few hundred bytes
+COMPRESS_MIN_BYTES = 256
+# Spill files of sessions that ended without clearing up are removed after this long
+SPILL_TTL = 24 * 3600
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class TextStore:
+    """One session's response and message bodies, each distinct text kept once.
+
+    Bodies are keyed by content hash and reference counted, so the same
+    answer shown in the workspace and the chat costs one copy. Longer
+    bodies are zlib-compressed.
+    """
+
+    __slots__ = ('_blobs', '_refs')
+
+    def __init__(self):
+        self._blobs = {}
+        self._refs = {}
+
+    def put(self, text):
+        text = text or ''
+        key = _digest(text)
+        if key in self._refs:
+            self._refs[key] += 1
+        else:
+            data = text.encode('utf-8')
+            self._blobs[key] = zlib.compress(data) if len(data) >= COMPRESS_MIN_BYTES else text
+            self._refs[key] = 1
+        return key
+
+    def get(self, key):
+        blob = self._blobs[key]
+        return blob if isinstance(blob, str) else zlib.decompress(blob).decode('utf-8')
+
+    def release(self, key):
+        refs = self._refs.get(key, 0) - 1
+        if refs > 0:
+            self._refs[key] = refs
+        else:
+            self._refs.pop(key, None)
+            self._blobs.pop(key, None)
+
+    def __len__(self):
+        return len(self._blobs)
+
+
+class OutputRecord:
+    """A generated answer shown in the workspace."""
+
+    __slots__ = ('artwork', 'period', 'damage', 'output', 'created', 'group', 'job_id', '_key', '_texts')
+
+    def __init__(self, texts, artwork, period, damage, output, response, time=None, group=None, job_id=None):
+        self.artwork = artwork
+        self.period = period
+        self.damage = damage
+        self.output = output
+        self.created = (time or datetime.now()).timestamp()
+        self.group = group
+        self.job_id = job_id
+        self._texts = texts
+        self._key = texts.put(response)
+
+    @property
+    def response(self):
+        return self._texts.get(self._key)
+
+    @property
+    def time(self):
+        return datetime.fromtimestamp(self.created)
+
+    def release(self):
+        self._texts.release(self._key)
+
+    def to_dict(self):
+        return {'artwork': self.artwork, 'period': self.period, 'damage': self.damage, 'output': self.output,
+                'response': self.response, 'time': self.time, 'group': self.group}
+
+
+class ChatMessage:
+    __slots__ = ('role', 'context_tokens', 'reused', '_key')
+
+    def __init__(self, key, role, context_tokens=None, reused=None):
+        self.role = role
+        self.context_tokens = context_tokens
+        self.reused = reused
+        self._key = key
+
+    def to_dict(self, texts):
+        message = {'role': self.role, 'content': texts.get(self._key)}
+        if self.context_tokens is not None:
+            message['context_tokens'] = self.context_tokens
+        if self.reused is not None:
+            message['reused'] = self.reused
+        return message
+
+
+class ChatTranscript:
+    """A session's chat messages, with all but the newest `limit` spilled to a file.
+
+    Indexes count from the first message ever sent, spilled or not, so
+    chat summaries can keep pointing into the transcript.
+    """
+
+    def __init__(self, texts, limit=MAX_CHAT_MESSAGES, directory=SESSION_DIR):
+        self.id = uuid.uuid4().hex
+        self.limit = limit
+        self.directory = directory
+        self.spilled = 0
+        self.user_turns = 0
+        self._texts = texts
+        self._recent = []
+
+    @property
+    def spill_path(self):
+        return os.path.join(self.directory, f"chat_{self.id}.jsonl")
+
+    def __len__(self):
+        return self.spilled + len(self._recent)
+
+    def __iter__(self):
+        return iter(self.turns())
+
+    def append(self, role, content, context_tokens=None, reused=None):
+        self._recent.append(ChatMessage(self._texts.put(content), role, context_tokens, reused))
+        if role == 'user':
+            self.user_turns += 1
+        if self.limit and len(self._recent) > self.limit:
+            self._spill(len(self._recent) - self.limit)
+
+    def pop(self):
+        message = self._recent.pop()
+        if message.role == 'user':
+            self.user_turns -= 1
+        result = message.to_dict(self._texts)
+        self._texts.release(message._key)
+        return result
+
+    def _spill(self, count):
+        if self.spilled == 0:
+            prune_spill_files(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for message in self._recent[:count]:
+                f.write(json.dumps(message.to_dict(self._texts), ensure_ascii=False) + '\n')
+                self._texts.release(message._key)
+        del self._recent[:count]
+        self.spilled += count
+
+    def _read_spilled(self, start):
+        if start >= self.spilled:
+            return []
+        with open(self.spill_path, encoding='utf-8') as f:
+            return [json.loads(line) for i, line in enumerate(f) if i >= start]
+
+    def turns(self, start=0):
+        """Messages from index `start` on as dicts; only reads the spill file if it must."""
+        recent = [m.to_dict(self._texts) for m in self._recent[max(0, start - self.spilled):]]
+        return self._read_spilled(start) + recent
+
+    def clear(self):
+        for message in self._recent:
+            self._texts.release(message._key)
+        self._recent = []
+        if self.spilled and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spilled = 0
+        self.user_turns = 0
+
+
+class OutputArchive:
+    """Workspace results pushed out of memory by newer ones, kept in a file for the session."""
+
+    def __init__(self, directory=SESSION_DIR):
+        self.id = uuid.uuid4().hex
+        self.directory = directory
+        self.count = 0
+
+    @property
+    def spill_path(self):
+        return os.path.join(self.directory, f"outputs_{self.id}.jsonl")
+
+    def __len__(self):
+        return self.count
+
+    def add(self, record):
+        if self.count == 0:
+            prune_spill_files(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(record.to_dict(), time=record.created), ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def records(self):
+        """Archived results as dicts, newest first."""
+        if not self.count:
+            return []
+        with open(self.spill_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        for record in records:
+            record['time'] = datetime.fromtimestamp(record['time'])
+        return records[::-1]
+
+    def clear(self):
+        if self.count and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.count = 0
+
+
+def prune_spill_files(directory=SESSION_DIR, ttl=SPILL_TTL):
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - ttl
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.startswith(('chat_', 'outputs_')) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def deep_size(obj, seen=None):
+    """Bytes held by `obj` and everything it references (each object counted once)."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    else:
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                size += deep_size(getattr(obj, slot), seen)
+        if hasattr(obj, '__dict__'):
+            size += deep_size(vars(obj), seen)
+    return size
@@ -0,0 +1,344 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+INDEX_DIR = os.getenv("ARTRESTORER_SIMILARITY_DIR", ".cache/similarity")
+DIM = 1024
+# Bumped whenever embed() changes; an index built with another version is emptied on open
+EMBED_VERSION = 2
+NGRAM_SIZES = (3, 4)
+# Character n-grams only smooth over spelling; the words decide
+NGRAM_WEIGHT = 0.5
+# Where the damage is says little about what it is
+LOCATION_WEIGHT = 0.3
+# Paraphrase and non-paraphrase pairs the default threshold is calibrated on
+PAIRS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "similarity_pairs.jsonl")
+# calibrate() over PAIRS_PATH; run `python similarity_index.py` after changing embed()
+DEFAULT_THRESHOLD = float(os.getenv("ARTRESTORER_SIMILARITY_THRESHOLD", "0.67"))
+
+# Below this many entries a brute-force scan is already fast enough
+TRAIN_AT = 4096
+KMEANS_SAMPLE = 8192
+KMEANS_ITERATIONS = 8
+N_PROBE = 8
+# Clusters per square root of the entry count
+CLUSTER_FACTOR = 2
+
+STOP_WORDS = frozenset(
+    "a an the and or but on in of to at by for from with off into onto over under about is are was were be been "
+    "has have had it its this that there some any very my i do does did how what which should can could".split())
+LOCATION_WORDS = frozenset(
+    "corner left right upper lower top bottom edge side middle centre center back front area part whole".split())
+# Irregular and British forms, so they meet their usual spelling
+SPELLINGS = {'torn': 'tear', 'tore': 'tear', 'mould': 'mold', 'grey': 'gray'}
+SUFFIXES = ('ing', 'ed', 'es', 's', 'e')
+
+
+def normalize_text(text):
+    return ' ' + re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip() + ' '
+
+
+def stem(word):
+    word = SPELLINGS.get(word, word)
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    if word.endswith('our'):
+        word = word[:-3] + 'or'
+    return word
+
+
+_LOCATION_STEMS = frozenset(stem(w) for w in LOCATION_WORDS)
+
+
+def features(text):
+    """(feature, weight) pairs: word stems, plus their character n-grams at a lower weight."""
+    result = []
+    for word in normalize_text(text).split():
+        if word in STOP_WORDS:
+            continue
+        word = stem(word)
+        weight = LOCATION_WEIGHT if word in _LOCATION_STEMS else 1.0
+        result.append(('w ' + word, weight))
+        padded = f' {word} '
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                result.append(('c ' + padded[i:i + n], weight * NGRAM_WEIGHT))
+    return result
+
+
+def embed(text, dim=DIM):
+    """Hashed bag of word stems and character n-grams (L2 normalized).
+
+    Word order, stop words, inflection and spelling variants don't count, so
+    "flaking paint" and "paint flakes" coincide.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in features(text):
+        vector[zlib.crc32(feature.encode('utf-8')) % dim] += weight
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+def load_pairs(path=PAIRS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def calibrate(pairs):
+    """(threshold, score of each pair) that best separates paraphrases from the rest.
+
+    A wrongly reused answer costs more than a fresh call, so false matches
+    count twice; ties go to the higher threshold.
+    """
+    scores = [float(embed(pair['a']) @ embed(pair['b'])) for pair in pairs]
+    ranked = sorted(set(scores))
+    candidates = [(low + high) / 2 for low, high in zip(ranked, ranked[1:])] or ranked
+
+    def cost(threshold):
+        return sum((2 if not pair['same'] else 1)
+                   for pair, score in zip(pairs, scores) if (score >= threshold) != pair['same'])
+    best = min(candidates, key=lambda t: (cost(t), -t))
+    return round(best, 2), scores
+
+
+def _kmeans(data, k, iterations, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                centroids[c] = centroid / norm if norm else centroid
+    return centroids
+
+
+def scope_id(scope):
+    return zlib.crc32(scope.encode('utf-8'))
+
+
+class SimilarityIndex:
+    """Offline nearest-neighbour lookup over past prompts and their answers.
+
+    Vectors are appended to a memory-mapped float32 file and the prompts and
+    answers are kept in SQLite. Once there are TRAIN_AT entries, the vectors
+    are clustered with k-means and also written in cluster order to a second
+    memory-mapped file (an IVF index). A query then scans only the N_PROBE
+    closest clusters as contiguous slices, plus entries added since the last
+    training. That keeps lookups at about two milliseconds at 100k entries.
+    """
+
+    def __init__(self, directory=INDEX_DIR, dim=DIM):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, 'vectors.f32')
+        self._scopes_path = os.path.join(directory, 'scopes.u32')
+        self._ivf_path = os.path.join(directory, 'ivf_vectors.f32')
+        self._ivf_meta_path = os.path.join(directory, 'ivf_meta.npz')
+        self._conn = sqlite3.connect(os.path.join(directory, 'entries.sqlite3'), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != EMBED_VERSION:
+            # Vectors (and scopes) from another embedding can't be compared with new ones
+            self._conn.execute("DROP TABLE IF EXISTS entries")
+            for path in (self._vectors_path, self._scopes_path, self._ivf_path, self._ivf_meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._conn.execute(f"PRAGMA user_version = {EMBED_VERSION}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "idx INTEGER PRIMARY KEY, scope TEXT NOT NULL, text TEXT NOT NULL, "
+            "response TEXT NOT NULL, created REAL NOT NULL, cluster INTEGER NOT NULL DEFAULT -1)")
+        self._conn.commit()
+
+        self.count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        self._capacity = 0
+        self._vectors = None
+        self._scopes = None
+        self._ensure_capacity(max(self.count, 1024))
+
+        # IVF state: centroids, vectors in cluster order and where each cluster starts
+        self.centroids = None
+        self.trained_count = 0
+        self._ivf = None
+        self._ivf_ids = None
+        self._ivf_scopes = None
+        self._offsets = None
+        self._pending = {}
+        if os.path.exists(self._ivf_meta_path) and os.path.exists(self._ivf_path):
+            meta = np.load(self._ivf_meta_path)
+            self._set_ivf(meta['centroids'], meta['ids'], meta['offsets'], int(meta['trained_count']))
+            # Entries added after the last training wait in per-cluster lists
+            for idx, cluster in self._conn.execute(
+                    "SELECT idx, cluster FROM entries WHERE idx >= ? ORDER BY idx", (self.trained_count,)):
+                self._pending.setdefault(cluster, []).append(idx)
+
+    def _ensure_capacity(self, needed):
+        if needed <= self._capacity:
+            return
+        capacity = max(1024, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._scopes.flush()
+        # Grow the backing files in place; existing rows keep their offsets
+        for path, size in ((self._vectors_path, capacity * self.dim * 4), (self._scopes_path, capacity * 4)):
+            with open(path, 'ab') as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self._scopes = np.memmap(self._scopes_path, dtype=np.uint32, mode='r+', shape=(capacity,))
+        self._capacity = capacity
+
+    def _set_ivf(self, centroids, ids, offsets, trained_count):
+        self.centroids = centroids.astype(np.float32)
+        self._ivf_ids = ids
+        self._offsets = offsets
+        self.trained_count = trained_count
+        self._ivf = np.memmap(self._ivf_path, dtype=np.float32, mode='r', shape=(len(ids), self.dim))
+        self._ivf_scopes = np.asarray(self._scopes[ids])
+
+    def _train(self):
+        self._vectors.flush()
+        self._scopes.flush()
+        data = np.asarray(self._vectors[:self.count])
+        rng = np.random.default_rng(0)
+        sample = data[rng.choice(len(data), KMEANS_SAMPLE, replace=False)] if len(data) > KMEANS_SAMPLE else data
+        k = int(CLUSTER_FACTOR * np.sqrt(self.count))
+        centroids = _kmeans(sample, k, KMEANS_ITERATIONS)
+        assign = np.argmax(data @ centroids.T, axis=1)
+        ids = np.argsort(assign, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(assign[ids], np.arange(k + 1))
+
+        # Write the cluster-ordered copy to a temp file, then swap it in
+        self._ivf = None
+        tmp_path = self._ivf_path + '.tmp'
+        ivf = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(len(ids), self.dim))
+        ivf[:] = data[ids]
+        ivf.flush()
+        del ivf
+        os.replace(tmp_path, self._ivf_path)
+        np.savez(self._ivf_meta_path, centroids=centroids, ids=ids, offsets=offsets, trained_count=self.count)
+        self._conn.executemany("UPDATE entries SET cluster = ? WHERE idx = ?",
+                               [(int(c), i) for i, c in enumerate(assign)])
+        self._conn.commit()
+        self._set_ivf(centroids, ids, offsets, self.count)
+        self._pending = {}
+
+    def add(self, text, response, scope=''):
+        vector = embed(text, self.dim)
+        with self._lock:
+            idx = self.count
+            self._ensure_capacity(idx + 1)
+            self._vectors[idx] = vector
+            self._scopes[idx] = scope_id(scope)
+            cluster = -1
+            if self.centroids is not None:
+                cluster = int(np.argmax(self.centroids @ vector))
+                self._pending.setdefault(cluster, []).append(idx)
+            self._conn.execute(
+                "INSERT INTO entries (idx, scope, text, response, created, cluster) VALUES (?, ?, ?, ?, ?, ?)",
+                (idx, scope, text, response, time.time(), cluster))
+            self._conn.commit()
+            self.count += 1
+            # Recluster whenever the index has doubled since the last training
+            if self.count >= TRAIN_AT and self.count >= 2 * max(self.trained_count, TRAIN_AT // 2):
+                self._train()
+        return idx
+
+    def _score(self, query, scope):
+        """(entry ids, scores) for every candidate worth looking at."""
+        if self.centroids is None:
+            ids = np.arange(self.count)
+            scores = self._vectors[:self.count] @ query
+            scopes = self._scopes[:self.count]
+        else:
+            nprobe = min(N_PROBE, len(self.centroids))
+            probes = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+            id_parts, score_parts, scope_parts = [], [], []
+            for c in probes:
+                start, end = self._offsets[c], self._offsets[c + 1]
+                id_parts.append(self._ivf_ids[start:end])
+                score_parts.append(self._ivf[start:end] @ query)
+                scope_parts.append(self._ivf_scopes[start:end])
+                pending = self._pending.get(int(c))
+                if pending:
+                    id_parts.append(np.array(pending, dtype=np.int64))
+                    score_parts.append(self._vectors[pending] @ query)
+                    scope_parts.append(self._scopes[pending])
+            ids = np.concatenate(id_parts)
+            scores = np.concatenate(score_parts)
+            scopes = np.concatenate(scope_parts)
+        if scope is not None:
+            mask = scopes == scope_id(scope)
+            ids, scores = ids[mask], scores[mask]
+        return ids, scores
+
+    def search(self, text, k=5, scope=None):
+        """Top-k (score, entry) pairs, best first; only entries in `scope` if given."""
+        query = embed(text, self.dim)
+        with self._lock:
+            if not self.count:
+                return []
+            ids, scores = self._score(query, scope)
+            if not len(ids):
+                return []
+            top = min(len(ids), k)
+            best = np.argpartition(scores, -top)[-top:]
+            best = best[np.argsort(scores[best])[::-1]]
+            results = []
+            for b in best:
+                row = self._conn.execute(
+                    "SELECT idx, scope, text, response, created FROM entries WHERE idx = ?",
+                    (int(ids[b]),)).fetchone()
+                results.append((float(scores[b]), {
+                    'id': row[0], 'scope': row[1], 'text': row[2], 'response': row[3], 'created': row[4]}))
+        return results
+
+    def best_match(self, text, scope=None, threshold=DEFAULT_THRESHOLD):
+        results = self.search(text, k=1, scope=scope)
+        if results and results[0][0] >= threshold:
+            return results[0]
+        return None
+
+    def stats(self):
+        return {
+            'entries': self.count,
+            'clusters': 0 if self.centroids is None else len(self.centroids),
+            'dim': self.dim,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    # One index per process, shared by every session
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex()
+    return _index
+
+
+if __name__ == "__main__":
+    threshold, pair_scores = calibrate(load_pairs())
+    for pair, score in sorted(zip(load_pairs(), pair_scores), key=lambda item: item[1]):
+        print(f"{score:.3f} {'same' if pair['same'] else 'diff'}  {pair['a']} | {pair['b']}")
+    print(f"threshold {threshold} (DEFAULT_THRESHOLD is {DEFAULT_THRESHOLD})")
@@ -0,0 +1,121 @@
+import threading
+
+
+class Flight:
+    """One upstream generation shared by every request with the same key.
+
+    The leader publishes text chunks as they arrive (a non-streamed answer
+    is a single chunk) and then finishes, with an error if it failed.
+    Followers can read the chunks live or wait for the whole answer.
+    """
+
+    def __init__(self, priority=None):
+        self.chunks = []
+        self.model_name = None
+        self.error = None
+        self.done = False
+        self.followers = 0
+        # The most urgent scheduler priority anyone waiting on this flight asked for
+        self.priority = priority
+        self._on_boost = None
+        self._cond = threading.Condition()
+
+    def watch(self, on_boost):
+        """Leader side: call on_boost(priority) whenever a follower raises the priority; returns it now."""
+        with self._cond:
+            self._on_boost = on_boost
+            return self.priority
+
+    def boost(self, priority):
+        """Follower side: the answer is needed at `priority`, so the leader shouldn't queue behind that."""
+        with self._cond:
+            if priority is None or (self.priority is not None and priority >= self.priority) or self.done:
+                return
+            self.priority = priority
+            on_boost = self._on_boost
+        if on_boost:
+            on_boost(priority)
+
+    def publish(self, text, model_name):
+        with self._cond:
+            self.chunks.append(text)
+            self.model_name = model_name
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def iter_chunks(self):
+        """Yield chunks as the leader publishes them, then raise its error if any."""
+        sent = 0
+        while True:
+            with self._cond:
+                while sent == len(self.chunks) and not self.done:
+                    self._cond.wait()
+                new = self.chunks[sent:]
+                done = self.done
+            for text in new:
+                yield text
+            sent += len(new)
+            if done and sent == len(self.chunks):
+                break
+        if self.error is not None:
+            raise self.error
+
+    def result(self):
+        with self._cond:
+            while not self.done:
+                self._cond.wait()
+        if self.error is not None:
+            raise self.error
+        return "".join(self.chunks), self.model_name
+
+
+class SingleFlight:
+    """In-flight requests by key, so concurrent duplicates make one upstream call."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key, priority=None):
+        """(flight, is_leader); the leader must call finish() when it is done.
+
+        A follower more urgent than the flight boosts it, so a request that
+        joins a prefetch is not stuck behind batch work in the scheduler.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight(priority)
+                return flight, True
+            flight.followers += 1
+        flight.boost(priority)
+        return flight, False
+
+    def finish(self, key, flight, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+_group = None
+_group_lock = threading.Lock()
+
+
+def get_group():
+    # One group per process, shared by every session
+    global _group
+    if _group is None:
+        with _group_lock:
+            if _group is None:
+                _group = SingleFlight()
+    return _group
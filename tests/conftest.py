@@ -0,0 +1,81 @@
+"""Shared setup for the test suite: run with `python -m pytest -q` from the repository root.
+
+Every model is a fake_gemini.FakeModel, so no API key, network access or
+quota is needed. Caches and indexes go to a temporary directory, and the
+process-wide singletons are rebuilt for each test.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix="artrestorer-tests-")
+os.environ.update({
+    'ARTRESTORER_CACHE_PATH': os.path.join(_workdir, 'responses.sqlite3'),
+    'ARTRESTORER_HISTORY_PATH': os.path.join(_workdir, 'history.sqlite3'),
+    'ARTRESTORER_SIMILARITY_DIR': os.path.join(_workdir, 'similarity'),
+    'ARTRESTORER_KNOWLEDGE_DIR': os.path.join(_workdir, 'knowledge'),
+    'ARTRESTORER_LATENCY_PATH': os.path.join(_workdir, 'model_latency.json'),
+    'ARTRESTORER_SESSION_DIR': os.path.join(_workdir, 'sessions'),
+    # Retries shouldn't make the suite slow
+    'ARTRESTORER_BACKOFF_BASE': '0.01',
+    'ARTRESTORER_BACKOFF_MAX': '0.05',
+    # Tests that want cached content build their own ContextCache
+    'ARTRESTORER_CONTEXT_CACHE_TTL': '0',
+})
+
+import context_cache  # noqa: E402
+import fake_gemini  # noqa: E402
+import gemini_client  # noqa: E402
+import history_store  # noqa: E402
+import knowledge_base  # noqa: E402
+import resilience  # noqa: E402
+import response_cache  # noqa: E402
+import router  # noqa: E402
+import scheduler  # noqa: E402
+import similarity_index  # noqa: E402
+import singleflight  # noqa: E402
+
+FLASH, PRO = fake_gemini.FAKE_MODELS
+
+
+@pytest.fixture(autouse=True)
+def fresh_singletons(monkeypatch, tmp_path):
+    monkeypatch.setattr(context_cache, '_context_cache', context_cache.ContextCache())
+    monkeypatch.setattr(gemini_client, '_config', None)
+    monkeypatch.setattr(gemini_client, '_signature', None)
+    monkeypatch.setattr(gemini_client, 'stats', dict.fromkeys(gemini_client.stats, 0))
+    monkeypatch.setattr(gemini_client, '_warmup', None)
+    monkeypatch.setattr(gemini_client, '_warmup_key', None)
+    monkeypatch.setattr(history_store, '_store', history_store.HistoryStore(str(tmp_path / 'history.sqlite3')))
+    monkeypatch.setattr(knowledge_base, '_knowledge_base', knowledge_base.KnowledgeBase(str(tmp_path / 'knowledge')))
+    monkeypatch.setattr(resilience, '_breakers', {})
+    monkeypatch.setattr(response_cache, '_cache', response_cache.ResponseCache(str(tmp_path / 'responses.sqlite3')))
+    monkeypatch.setattr(scheduler, '_scheduler', scheduler.Scheduler(0, 0, 0))
+    monkeypatch.setattr(similarity_index, '_index', similarity_index.SimilarityIndex(str(tmp_path / 'similarity')))
+    monkeypatch.setattr(singleflight, '_group', singleflight.SingleFlight())
+    monkeypatch.setattr(router, '_tracker', router.LatencyTracker(str(tmp_path / 'model_latency.json')))
+
+
+@pytest.fixture
+def make_config(monkeypatch):
+    """make_config(flash_model, pro_model=None): a GeminiConfig over the given FakeModels.
+
+    The first model is the resolved one, the second its fallback; the app's
+    generation functions use the config too.
+    """
+    def make(flash, pro=None):
+        models = {FLASH: flash}
+        if pro is not None:
+            models[PRO] = pro
+        config = gemini_client.GeminiConfig(flash, FLASH, 'fake-key', None, list(models),
+                                            model_factory=models.__getitem__)
+        config.cache_factory = lambda name, contents, ttl_seconds: models[name].cache(contents, ttl_seconds)
+        monkeypatch.setattr(gemini_client, 'current', lambda: config)
+        monkeypatch.setattr(gemini_client, '_config', config)
+        return config
+    return make
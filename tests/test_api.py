@@ -0,0 +1,201 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import api
+import export
+import gemini_client
+import history_store
+from conftest import FLASH
+from fake_gemini import FakeModel
+
+ROW = {'artwork_type': 'Painting', 'period': 'Baroque', 'damage': 'flaking paint', 'output_type': 'Visitor Summary'}
+AUTH = {'Authorization': 'Bearer secret'}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Models come from make_config, never from a real discovery
+    monkeypatch.setattr(gemini_client, 'warm_up', lambda streamlit_key=None: None)
+    server = api.make_server('127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    data = json.dumps(body).encode('utf-8') if isinstance(body, dict) else body
+    conn.request(method, path, body=data, headers=dict({'Content-Type': 'application/json'}, **(headers or {})))
+    response = conn.getresponse()
+    payload = response.read().decode('utf-8')
+    conn.close()
+    return response, payload
+
+
+def test_health_reports_the_model(server, make_config):
+    starting, _ = request(server, 'GET', '/health')
+    make_config(FakeModel(FLASH))
+
+    response, payload = request(server, 'GET', '/health')
+
+    assert starting.status == 503
+    assert response.status == 200
+    assert json.loads(payload)['model'] == FLASH
+
+
+def test_generate_returns_the_answer(server, make_config):
+    make_config(FakeModel(FLASH))
+
+    response, payload = request(server, 'POST', '/v1/generate', dict(ROW, id='inv-7'))
+
+    body = json.loads(payload)
+    assert response.status == 200
+    assert body['id'] == 'inv-7' and body['response'].startswith("Guidance")
+
+
+def test_streamed_generate_ends_with_a_done_line(server, make_config):
+    make_config(FakeModel(FLASH))
+
+    response, payload = request(server, 'POST', '/v1/generate', dict(ROW, stream=True))
+
+    lines = [json.loads(line) for line in payload.splitlines()]
+    assert response.getheader('Content-Type').startswith('application/x-ndjson')
+    assert "".join(line.get('text', '') for line in lines).startswith("Guidance")
+    assert lines[-1]['done']
+
+
+def test_upstream_errors_map_to_http_status(server, make_config):
+    make_config(FakeModel(FLASH, failures=[400]))
+
+    response, payload = request(server, 'POST', '/v1/generate', ROW)
+
+    assert response.status == 400
+    assert json.loads(payload)['error'] == 'InvalidRequestError'
+
+
+def test_batch_keeps_row_order_and_reports_bad_rows(server, make_config):
+    make_config(FakeModel(FLASH))
+    rows = [ROW, {'artwork_type': 'Mural'}, dict(ROW, damage='mould')]
+
+    response, payload = request(server, 'POST', '/v1/batch', {'rows': rows, 'workers': 3})
+
+    body = json.loads(payload)
+    assert response.status == 200
+    assert [r['id'] for r in body['results']] == ['1', '2', '3']
+    assert body['failed'] == 1 and body['results'][1]['error'].startswith("Missing required fields")
+
+
+@pytest.mark.parametrize('body, message', [
+    (b'{not json', "not valid JSON"),
+    ({'artwork_type': 'Painting'}, "Missing required fields"),
+    ({'rows': []}, "'rows' must be a non-empty list"),
+    (dict(ROW, profile={'tone': 'sarcastic'}), "'profile.tone' must be one of"),
+    (dict(ROW, profile={'creativity': 11}), "'profile.creativity' must be a whole number from 1 to 10"),
+    (dict(ROW, profile={'length': True}), "'profile.length' must be a whole number from 1 to 10"),
+])
+def test_bad_requests_get_a_400(server, make_config, body, message):
+    make_config(FakeModel(FLASH))
+    path = '/v1/batch' if isinstance(body, dict) and 'rows' in body else '/v1/generate'
+
+    response, payload = request(server, 'POST', path, body)
+
+    assert response.status == 400
+    assert message in json.loads(payload)['message']
+
+
+def test_token_is_required_when_configured(server, make_config, monkeypatch):
+    make_config(FakeModel(FLASH))
+    monkeypatch.setattr(api, 'API_TOKEN', 'secret')
+
+    denied, _ = request(server, 'POST', '/v1/generate', ROW)
+    allowed, _ = request(server, 'POST', '/v1/generate', ROW, AUTH)
+
+    assert (denied.status, allowed.status) == (401, 200)
+
+
+def save_history():
+    store = history_store.get_store()
+    saved = [('ann@example.org', 'flaking paint'), ('ann@example.org', 'mould'), ('bob@example.org', 'tear')]
+    for email, damage in saved:
+        store.add(email, {'artwork': 'Painting', 'damage': damage, 'response': 'consolidate'})
+
+
+def test_history_export_is_refused_without_a_configured_token(server, monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', None)
+    save_history()
+
+    response, payload = request(server, 'GET', '/v1/history/export?email=ann@example.org&format=jsonl')
+
+    assert response.status == 403
+    assert json.loads(payload)['error'] == 'Forbidden'
+
+
+def test_history_export_streams_one_users_records(server, monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', 'secret')
+    save_history()
+
+    denied, _ = request(server, 'GET', '/v1/history/export?email=ann@example.org&format=jsonl')
+    response, payload = request(server, 'GET', '/v1/history/export?email=ann@example.org&format=jsonl', headers=AUTH)
+
+    assert denied.status == 401
+
+    assert response.status == 200
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+    assert 'attachment; filename="restoration_history_' in response.getheader('Content-Disposition')
+    assert [json.loads(line)['damage'] for line in payload.splitlines()] == ['mould', 'flaking paint']
+
+
+def test_history_export_rejects_an_unknown_format(server, monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', 'secret')
+    response, payload = request(server, 'GET', '/v1/history/export?email=ann@example.org&format=pdf', headers=AUTH)
+
+    assert response.status == 400
+    assert "'format' must be one of" in json.loads(payload)['message']
+
+
+def test_history_export_failing_before_the_first_chunk_gets_a_500(server, monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', 'secret')
+
+    def broken(records, fmt):
+        raise OSError("database is locked")
+        yield
+
+    monkeypatch.setattr(export, 'iter_export', broken)
+    response, payload = request(server, 'GET', '/v1/history/export?email=ann@example.org', headers=AUTH)
+
+    assert response.status == 500
+    assert json.loads(payload) == {'error': 'InternalError', 'message': "OSError: database is locked"}
+
+
+def test_history_export_failing_midway_ends_with_an_error_record(server, monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', 'secret')
+
+    def broken(records, fmt):
+        yield b'{"damage": "mould"}\n'
+        raise OSError("database is locked")
+
+    monkeypatch.setattr(export, 'iter_export', broken)
+    # The closing chunk is never sent, so the client sees a truncated download
+    with pytest.raises(http.client.IncompleteRead) as truncated:
+        request(server, 'GET', '/v1/history/export?email=ann@example.org', headers=AUTH)
+
+    lines = truncated.value.partial.decode('utf-8').splitlines()
+    assert json.loads(lines[-1]) == {'error': 'InternalError', 'message': "OSError: database is locked"}
+
+
+def test_unexpected_errors_get_a_json_500(server, make_config, monkeypatch):
+    make_config(FakeModel(FLASH))
+
+    def broken(*args, **kwargs):
+        raise KeyError('plan')
+
+    monkeypatch.setattr(api, 'generate_response', broken)
+    response, payload = request(server, 'POST', '/v1/generate', ROW)
+
+    assert response.status == 500
+    assert json.loads(payload) == {'error': 'InternalError', 'message': "KeyError: 'plan'"}
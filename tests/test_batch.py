@@ -0,0 +1,83 @@
+import threading
+
+import batch
+
+PROFILE = {'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+CATALOGUE = """ID,Artwork,Style,Damage Description,Output
+1,Painting,Baroque,flaking paint,Conservation Advice
+2,Fresco,Renaissance,salt efflorescence,Restoration Technique
+3,Sculpture,,,Visitor Summary
+"""
+
+
+class FakeGenerate:
+    def __init__(self, fail_on=()):
+        self.prompts = []
+        self.fail_on = fail_on
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, user_profile, **options):
+        with self._lock:
+            self.prompts.append(prompt)
+        if any(word in prompt for word in self.fail_on):
+            raise RuntimeError("503 overloaded")
+        return "Guidance for " + prompt.splitlines()[0]
+
+
+def run(rows, path, generate, skip_ids=()):
+    with batch.ResultWriter(str(path)) as writer:
+        for result in batch.run_batch(rows, PROFILE, workers=2, skip_ids=skip_ids, generate=generate):
+            writer.write(result)
+
+
+def test_catalogue_columns_are_mapped_to_fields():
+    rows = batch.read_rows(CATALOGUE.encode('utf-8-sig'), name='catalogue.csv')
+
+    assert [row['id'] for row in rows] == ['1', '2', '3']
+    assert rows[0]['artwork_type'] == 'Painting' and rows[0]['period'] == 'Baroque'
+    assert batch.missing_fields(rows[2]) == ['damage']
+
+
+def test_jsonl_rows_without_an_id_are_numbered():
+    rows = batch.read_rows('{"artwork_type": "Painting"}\n\n{"artwork_type": "Mural"}\n', name='rows.jsonl')
+
+    assert [row['id'] for row in rows] == ['1', '2']
+
+
+def test_failed_and_invalid_rows_are_reported_not_raised(tmp_path):
+    rows = batch.read_rows(CATALOGUE)
+    path = tmp_path / 'results.jsonl'
+
+    run(rows, path, FakeGenerate(fail_on=['Fresco']))
+
+    results = {r['id']: r for r in batch.load_results(str(path))}
+    assert results['1']['response'] == "Guidance for Artwork: Painting"
+    assert results['2']['error'].startswith("Error generating response")
+    assert results['3']['error'] == "Missing required fields: damage"
+
+
+def test_rerun_resumes_only_the_rows_that_did_not_succeed(tmp_path):
+    rows = batch.read_rows(CATALOGUE)
+    rows[2]['damage'] = 'chipped nose'
+    path = tmp_path / 'results.csv'
+    run(rows, path, FakeGenerate(fail_on=['Fresco']))
+
+    done = batch.completed_ids(str(path))
+    retry = FakeGenerate()
+    run(rows, path, retry, skip_ids=done)
+
+    assert done == {'1', '3'}
+    assert len(retry.prompts) == 1 and 'Fresco' in retry.prompts[0]
+    # The retried row's newer line replaces its failure
+    assert batch.completed_ids(str(path)) == {'1', '2', '3'}
+
+
+def test_results_file_is_kept_apart_per_user_and_settings(tmp_path):
+    data = CATALOGUE.encode('utf-8')
+    ann = dict(PROFILE, email='ann@example.org')
+    path = batch.results_path(str(tmp_path), data, ann)
+
+    assert batch.results_path(str(tmp_path), data, dict(ann)) == path
+    assert batch.results_path(str(tmp_path), data, dict(ann, email='bob@example.org')) != path
+    assert batch.results_path(str(tmp_path), data, dict(ann, tone='academic')) != path
+    assert batch.results_path(str(tmp_path), data + b"\n", ann) != path
@@ -0,0 +1,72 @@
+import chat_context
+
+
+def first_turn(summary_text, question):
+    return f"You are an art restoration expert.\nSummary: {summary_text}\n\n{question}"
+
+
+def conversation(turns, words=40):
+    messages = [{'role': 'assistant', 'content': "Hello! Ask me anything about restoration."}]
+    for i in range(turns):
+        messages.append({'role': 'user', 'content': f"question {i} " + "about varnish " * words})
+        messages.append({'role': 'assistant', 'content': f"answer {i} " + "use a solvent gel " * words})
+    return messages
+
+
+class Summarizer:
+    def __init__(self):
+        self.folded = []
+
+    def __call__(self, previous, messages):
+        self.folded.append(len(messages))
+        return f"{previous} {len(messages)} turns about varnish".strip()
+
+
+def test_short_conversation_is_sent_whole_without_summarizing():
+    messages = conversation(2)
+    summarize = Summarizer()
+
+    context = chat_context.build_context(messages, None, first_turn, summarize, budget=2000)
+
+    # The greeting is dropped and roles map onto Gemini's
+    assert [c['role'] for c in context.contents] == ['user', 'model', 'user', 'model']
+    assert context.contents[0]['parts'][0].startswith("You are an art restoration expert.")
+    assert summarize.folded == [] and context.summarized_now == 0
+
+
+def test_old_turns_are_folded_into_the_summary_to_fit_the_budget():
+    messages = conversation(10) + [{'role': 'user', 'content': "and the frame?"}]
+    summarize = Summarizer()
+
+    context = chat_context.build_context(messages, None, first_turn, summarize, budget=500)
+
+    assert context.tokens <= 500
+    assert context.contents[0]['role'] == 'user'
+    assert context.contents[-1]['parts'][0].endswith("and the frame?")
+    assert "turns about varnish" in context.contents[0]['parts'][0]
+    assert context.summary['upto'] == len(messages) - len(context.contents)
+
+
+def test_summary_is_reused_until_the_budget_is_exceeded_again():
+    messages = conversation(10)
+    summarize = Summarizer()
+    first = chat_context.build_context(messages, None, first_turn, summarize, budget=500)
+
+    messages.append({'role': 'user', 'content': "thanks"})
+    second = chat_context.build_context(messages, first.summary, first_turn, summarize, budget=500)
+
+    assert len(summarize.folded) == 1
+    assert second.summary == first.summary
+    assert second.contents[-1]['parts'][0].endswith("thanks")
+
+
+def test_failed_summary_drops_the_old_turns():
+    messages = conversation(10)
+
+    def broken(previous, turns):
+        raise RuntimeError("503")
+
+    context = chat_context.build_context(messages, None, first_turn, broken, budget=500)
+
+    assert context.tokens <= 500
+    assert context.summary['text'] == ''
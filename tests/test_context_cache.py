@@ -0,0 +1,78 @@
+import context_cache
+from conftest import FLASH
+from fake_gemini import FakeModel
+from generation import OUTPUT_TYPES, build_restoration_prompt, generate_response
+
+PROFILE = {'email': 'ann@example.org', 'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+DAMAGE = "Flaking paint along the craquelure, lifting in the sky and along the lower edge. " * 10
+
+
+def all_outputs():
+    # Every output type for one artwork, as the "All Outputs" button asks for them
+    return [generate_response(build_restoration_prompt("Painting", "Baroque", "", "", DAMAGE, output), PROFILE,
+                              use_cache=False, output_type=output)
+            for output in OUTPUT_TYPES]
+
+
+def enable_caching(monkeypatch):
+    cache = context_cache.ContextCache(ttl_seconds=600, min_tokens=0)
+    monkeypatch.setattr(context_cache, '_context_cache', cache)
+    return cache
+
+
+def test_shared_artwork_prefix_is_cached_and_not_sent_again(make_config, monkeypatch):
+    uncached = FakeModel(FLASH)
+    make_config(uncached)
+    expected = all_outputs()
+
+    cached = FakeModel(FLASH)
+    make_config(cached)
+    cache = enable_caching(monkeypatch)
+    answers = all_outputs()
+
+    assert answers == expected
+    assert cached.caches_created == 1 and cache.stats()['reused'] == len(OUTPUT_TYPES) - 1
+    # Every call's prompt was received (give or take rounding), but the shared prefix only went upstream twice
+    assert abs(cached.prompt_tokens + cached.cached_tokens - uncached.prompt_tokens) <= len(OUTPUT_TYPES)
+    assert cached.prompt_tokens < uncached.prompt_tokens / 2
+
+
+def test_model_without_cached_content_gets_whole_prompts(make_config, monkeypatch):
+    plain = FakeModel(FLASH)
+    make_config(plain)
+    expected = all_outputs()
+
+    unsupported = FakeModel(FLASH, supports_caching=False)
+    make_config(unsupported)
+    cache = enable_caching(monkeypatch)
+
+    assert all_outputs() == expected
+    assert unsupported.prompt_tokens == plain.prompt_tokens
+    assert cache.stats()['failed'] == 1
+    assert cache.stats()['unsupported_models'] == [FLASH]
+
+
+def test_prefix_is_registered_on_its_second_sighting_only(make_config):
+    flash = FakeModel(FLASH)
+    config = make_config(flash)
+    cache = context_cache.ContextCache(ttl_seconds=600, min_tokens=0)
+    prefix = "Artwork: Painting\n" * 20
+
+    first = cache.prepare(config, FLASH, flash, prefix + "Output: A", prefix)
+    second = cache.prepare(config, FLASH, flash, prefix + "Output: B", prefix)
+
+    assert first == (flash, prefix + "Output: A", None)
+    assert second[1] == "Output: B" and second[0] is not flash
+    assert flash.caches_created == 1
+
+
+def test_small_prefixes_are_never_registered(make_config):
+    flash = FakeModel(FLASH)
+    config = make_config(flash)
+    cache = context_cache.ContextCache(ttl_seconds=600, min_tokens=1024)
+
+    for output in ("A", "B", "C"):
+        model, contents, key = cache.prepare(config, FLASH, flash, "Artwork: Painting\nOutput: " + output,
+                                             "Artwork: Painting\n")
+        assert (model, key) == (flash, None)
+    assert flash.caches_created == 0
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta
+
+import export
+import history_store
+
+START = datetime(2026, 1, 1, 9, 0)
+
+
+def fill(store, count, user='ann@example.org'):
+    for i in range(count):
+        # Pairs of records share a timestamp, so ordering has to fall back to the ID
+        store.add(user, {'time': START + timedelta(minutes=i // 2), 'artwork': 'Painting', 'period': 'Baroque',
+                         'damage': f"damage {i}", 'output': 'Conservation Advice', 'response': f"answer {i}"})
+
+
+def test_keyset_batches_match_the_paged_order():
+    store = history_store.HistoryStore(':memory:')
+    fill(store, 23)
+    fill(store, 3, user='bob@example.org')
+
+    records = list(store.iter_records('ann@example.org', batch_size=5))
+
+    assert [r['id'] for r in records] == [r['id'] for r in store.page('ann@example.org', page_size=100)]
+    assert len(records) == 23
+
+
+def test_jsonl_and_csv_hold_every_record():
+    store = history_store.HistoryStore(':memory:')
+    fill(store, 250)
+
+    jsonl = b''.join(export.iter_export(store.iter_records('ann@example.org'), 'jsonl')).decode('utf-8')
+    rows = list(csv.DictReader(io.StringIO(
+        b''.join(export.iter_export(store.iter_records('ann@example.org'), 'csv')).decode('utf-8-sig'))))
+
+    lines = [json.loads(line) for line in jsonl.splitlines()]
+    assert len(lines) == len(rows) == 250
+    assert lines[0]['response'] == rows[0]['response'] == "answer 249"
+    assert lines[0]['time'] == "2026-01-01T11:04:00"
+
+
+def test_export_is_produced_as_records_are_read():
+    store = history_store.HistoryStore(':memory:')
+    fill(store, 1000)
+    read = []
+
+    def counted(records):
+        for record in records:
+            read.append(record)
+            yield record
+
+    chunks = export.iter_export(counted(store.iter_records('ann@example.org')), 'jsonl')
+    next(chunks)
+
+    assert len(read) == export.CHUNK_RECORDS
+
+
+def test_zip_has_one_report_per_record():
+    store = history_store.HistoryStore(':memory:')
+    fill(store, 3)
+
+    data = b''.join(export.iter_export(store.iter_records('ann@example.org'), 'zip-md'))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = archive.namelist()
+        report = archive.read(names[0]).decode('utf-8')
+    assert names == ['000003_painting_conservation-advice.md', '000002_painting_conservation-advice.md',
+                     '000001_painting_conservation-advice.md']
+    assert report.startswith("# ArtRestorer AI Report") and "answer 2" in report
@@ -0,0 +1,79 @@
+import gemini_client
+
+
+def fake_resolve(monkeypatch, api_error=None):
+    resolves = []
+
+    def resolve(streamlit_key):
+        resolves.append(streamlit_key)
+        return gemini_client.GeminiConfig(object(), 'models/gemini-1.5-flash', streamlit_key, api_error)
+
+    monkeypatch.setattr(gemini_client, '_resolve', resolve)
+    return resolves
+
+
+def test_client_is_resolved_once_and_then_looked_up(monkeypatch):
+    resolves = fake_resolve(monkeypatch)
+
+    first = gemini_client.get_gemini_config('key')
+    second = gemini_client.get_gemini_config('key')
+
+    assert first is second
+    assert resolves == ['key']
+    assert gemini_client.stats['cached_lookups'] == 1
+    assert gemini_client.speedup_summary()['cached_lookups'] == 1
+
+
+def test_changed_key_resolves_again(monkeypatch):
+    resolves = fake_resolve(monkeypatch)
+
+    gemini_client.get_gemini_config('key')
+    monkeypatch.setenv('GEMINI_API_KEY', 'other')
+    gemini_client.get_gemini_config('key')
+    gemini_client.get_gemini_config('new key')
+
+    assert resolves == ['key', 'key', 'new key']
+
+
+def test_failed_discovery_is_retried_after_the_error_ttl(monkeypatch):
+    resolves = fake_resolve(monkeypatch, api_error="Error listing models: timeout")
+    monkeypatch.setattr(gemini_client, 'ERROR_TTL_SECONDS', 0)
+
+    gemini_client.get_gemini_config('key')
+    gemini_client.get_gemini_config('key')
+
+    assert len(resolves) == 2
+
+
+def test_invalidate_forces_discovery(monkeypatch):
+    resolves = fake_resolve(monkeypatch)
+
+    gemini_client.get_gemini_config('key')
+    gemini_client.invalidate()
+    gemini_client.get_gemini_config('key')
+
+    assert len(resolves) == 2
+
+
+def test_warm_up_resolves_in_the_background(monkeypatch):
+    resolves = fake_resolve(monkeypatch)
+
+    assert gemini_client.peek() is None
+    gemini_client.warm_up('key')
+    gemini_client._warmup.join(5)
+
+    assert gemini_client.peek().api_key == 'key'
+    gemini_client.warm_up('key')
+    assert resolves == ['key']
+
+
+def test_warm_up_and_current_count_as_cached_lookups(monkeypatch):
+    fake_resolve(monkeypatch)
+    gemini_client.get_gemini_config('key')
+
+    # What app.py does on every rerun, and what every generation does
+    gemini_client.warm_up('key')
+    gemini_client.current()
+
+    assert gemini_client.stats['cached_lookups'] == 2
+    assert gemini_client.speedup_summary()['cached_lookups'] == 2
@@ -0,0 +1,79 @@
+import pytest
+
+import resilience
+import response_cache
+from conftest import FLASH, PRO
+from fake_gemini import FakeModel
+from generation import GenerationError, generate_response, stream_response
+
+PROFILE = {'email': 'ann@example.org', 'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+PROMPT = "Painting, Baroque: flaking paint. Conservation Advice"
+
+
+def cached(prompt, model_name=FLASH):
+    return response_cache.get_cache().get(response_cache.make_key(prompt, PROFILE, model_name))
+
+
+def test_successful_answer_is_cached_and_reused(make_config):
+    flash = FakeModel(FLASH)
+    make_config(flash)
+
+    first = generate_response(PROMPT, PROFILE)
+    second = generate_response(PROMPT, PROFILE)
+
+    assert first == second == cached(PROMPT)
+    assert flash.calls == 1
+
+
+def test_errors_are_never_cached(make_config):
+    flash = FakeModel(FLASH, failures=[503] * resilience.MAX_ATTEMPTS)
+    make_config(flash)
+
+    with pytest.raises(GenerationError):
+        generate_response(PROMPT, PROFILE)
+    assert cached(PROMPT) is None
+
+    # The next request goes to the model again instead of replaying the failure
+    text = generate_response(PROMPT, PROFILE)
+    assert text.startswith("Guidance")
+    assert flash.calls == resilience.MAX_ATTEMPTS + 1
+
+
+def test_fallback_answer_is_filed_under_the_model_that_gave_it(make_config):
+    make_config(FakeModel(FLASH, failures=[503] * resilience.MAX_ATTEMPTS), FakeModel(PRO))
+
+    text = generate_response(PROMPT, PROFILE)
+
+    assert cached(PROMPT, PRO) == text
+    assert cached(PROMPT, FLASH) is None
+
+
+def test_answers_are_keyed_by_the_routed_model(make_config):
+    flash, pro = FakeModel(FLASH), FakeModel(PRO)
+    make_config(flash, pro)
+
+    # Restoration techniques are routed to the larger model, visitor summaries to the cheaper one
+    technique = generate_response(PROMPT, PROFILE, output_type="Restoration Technique")
+    summary = generate_response(PROMPT, PROFILE, output_type="Visitor Summary")
+
+    assert cached(PROMPT, PRO) == technique and cached(PROMPT, FLASH) == summary
+    assert (flash.calls, pro.calls) == (1, 1)
+
+
+def test_rejected_request_is_not_cached(make_config):
+    make_config(FakeModel(FLASH, failures=[400]))
+
+    with pytest.raises(resilience.InvalidRequestError):
+        generate_response(PROMPT, PROFILE)
+    assert cached(PROMPT) is None
+
+
+def test_failed_stream_is_not_cached(make_config):
+    flash = FakeModel(FLASH, failures=[503] * resilience.MAX_ATTEMPTS)
+    make_config(flash)
+
+    with pytest.raises(GenerationError):
+        list(stream_response(PROMPT, PROFILE))
+    assert cached(PROMPT) is None
+
+    assert "".join(stream_response(PROMPT, PROFILE)) == cached(PROMPT)
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import history_store
+
+START = datetime(2026, 1, 1, 9, 0)
+
+
+def record(minutes, artwork='Painting', output='Conservation Advice', damage='flaking paint', response='consolidate'):
+    return {'time': START + timedelta(minutes=minutes), 'artwork': artwork, 'period': 'Baroque',
+            'damage': damage, 'output': output, 'response': response}
+
+
+def test_pages_are_newest_first_and_per_user():
+    store = history_store.HistoryStore(':memory:')
+    for minutes in range(25):
+        store.add('ann@example.org', record(minutes))
+    store.add('bob@example.org', record(99))
+
+    first = store.page('ann@example.org', page=0, page_size=10)
+    last = store.page('ann@example.org', page=2, page_size=10)
+
+    assert store.count('ann@example.org') == 25
+    assert first[0]['time'] == START + timedelta(minutes=24)
+    assert [r['time'] for r in first] == sorted((r['time'] for r in first), reverse=True)
+    assert len(last) == 5 and last[-1]['time'] == START
+
+
+def test_filters_and_search_combine():
+    store = history_store.HistoryStore(':memory:')
+    store.add('ann@example.org', record(0, damage='water stains on the canvas'))
+    store.add('ann@example.org', record(1, artwork='Fresco', damage='salt efflorescence'))
+    store.add('ann@example.org', record(2, output='Visitor Summary', damage='stained varnish'))
+
+    assert store.count('ann@example.org', artwork='Fresco') == 1
+    assert store.count('ann@example.org', output='Conservation Advice') == 2
+    # Prefix match on every term
+    assert [r['damage'] for r in store.page('ann@example.org', query='stain')] == [
+        'stained varnish', 'water stains on the canvas']
+    assert store.count('ann@example.org', output='Visitor Summary', query='stain') == 1
+    assert store.facets('ann@example.org') == (['Fresco', 'Painting'], ['Conservation Advice', 'Visitor Summary'])
+
+
+def test_search_text_cannot_break_the_query():
+    store = history_store.HistoryStore(':memory:')
+    store.add('ann@example.org', record(0))
+
+    # Quotes, brackets and wildcards are dropped rather than parsed
+    assert store.count('ann@example.org', query='(flak* paint"') == 1
+    assert store.count('ann@example.org', query='"') == 1
+
+
+def test_users_cannot_read_or_delete_each_others_records():
+    store = history_store.HistoryStore(':memory:')
+    record_id = store.add('ann@example.org', record(0))
+
+    store.delete('bob@example.org', record_id)
+
+    assert store.get('bob@example.org', record_id) is None
+    assert store.get('ann@example.org', record_id)['response'] == 'consolidate'
+    store.delete('ann@example.org', record_id)
+    assert store.count('ann@example.org', query='paint') == 0
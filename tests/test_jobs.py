@@ -0,0 +1,62 @@
+import threading
+import time
+
+import jobs
+from conftest import FLASH
+from fake_gemini import FakeModel
+
+PROFILE = {'email': 'ann@example.org', 'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+REQUEST = {'prompt': "Painting, Baroque: flaking paint. Conservation Advice", 'use_cache': True,
+           'output': "Conservation Advice", 'similar_text': "flaking paint",
+           'similar_scope': "Conservation Advice|beginner|simplified|5|5"}
+
+
+def finished(executor, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while executor.get(job_id).pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return executor.get(job_id)
+
+
+def test_streamed_job_keeps_running_without_a_page_reading_it(make_config):
+    make_config(FakeModel(FLASH))
+    executor = jobs.JobExecutor(workers=2)
+
+    job_id = executor.submit('ann@example.org', 'restoration', jobs.restoration_job(REQUEST, PROFILE, stream=True))
+    job = finished(executor, job_id)
+
+    assert job.status == jobs.DONE
+    assert job.result == job.text and job.text.startswith("Guidance")
+    assert executor.for_owner('ann@example.org', 'restoration') == [job]
+    assert executor.for_owner('bob@example.org') == []
+
+
+def test_failed_job_reports_the_error(make_config):
+    make_config(FakeModel(FLASH, failures=[400]))
+    executor = jobs.JobExecutor(workers=2)
+
+    job = finished(executor, executor.submit('ann@example.org', 'restoration',
+                                             jobs.restoration_job(REQUEST, PROFILE, stream=False)))
+
+    assert job.status == jobs.FAILED
+    assert "400" in job.error
+
+
+def test_another_users_job_runs_while_one_user_fills_the_queue():
+    executor = jobs.JobExecutor(workers=4, user_workers=2)
+    release = threading.Event()
+
+    def blocked(job):
+        # Stands in for a job waiting on the scheduler for its turn
+        release.wait(10)
+        return 'a'
+
+    try:
+        pile = [executor.submit('a', 'restoration', blocked) for _ in range(20)]
+        single = executor.submit('b', 'restoration', lambda job: 'b')
+
+        assert finished(executor, single, timeout=2).result == 'b'
+        assert sum(executor.get(job_id).status == jobs.RUNNING for job_id in pile) == 2
+    finally:
+        release.set()
+    assert all(finished(executor, job_id).status == jobs.DONE for job_id in pile)
@@ -0,0 +1,89 @@
+import pytest
+
+import knowledge_base
+
+ANN = 'ann@example.org'
+BOB = 'bob@example.org'
+LINING = """Lining a torn canvas
+
+A weak or torn canvas can be lined with a new support using a reversible adhesive.
+Test the adhesive on a sample first and record every step."""
+
+
+def test_guide_passages_are_ranked_by_relevance(tmp_path):
+    kb = knowledge_base.KnowledgeBase(str(tmp_path))
+
+    (score, best), = kb.search("water stains and mold", k=1)
+
+    assert best['title'] == "Environmental"
+    assert score > 0
+    assert kb.search("zzz unrelated") == []
+
+
+def test_long_documents_are_split_into_passages():
+    text = "\n\n".join(" ".join(["word"] * 50) for _ in range(5))
+
+    passages = knowledge_base.split_passages(text, words=120)
+
+    assert [len(p.split()) for p in passages] == [100, 100, 50]
+
+
+def test_added_document_is_retrieved_into_prompts(tmp_path):
+    kb = knowledge_base.KnowledgeBase(str(tmp_path))
+
+    name = kb.add_document("lining.md", LINING, ANN)
+
+    assert kb.documents(ANN) == [name]
+    notes = kb.reference_notes("Painting", "Baroque", "torn canvas", user=ANN)
+    assert any("reversible adhesive" in note for note in notes)
+    assert sum(knowledge_base.estimate_tokens(note) for note in notes) <= knowledge_base.PROMPT_TOKEN_BUDGET
+    assert kb.reference_notes("Painting", "Baroque", "torn canvas", budget=0, user=ANN) == []
+
+
+def test_a_users_document_is_never_shown_to_another_user(tmp_path):
+    kb = knowledge_base.KnowledgeBase(str(tmp_path))
+    kb.add_document("lining.md", LINING, ANN)
+
+    assert kb.documents(BOB) == []
+    assert kb.search("reversible adhesive", user=BOB) == []
+    assert all("reversible adhesive" not in note for note in kb.reference_notes("Painting", "", "torn canvas", user=BOB))
+    # Nor to requests with no user, such as the API's guide search
+    assert kb.search("reversible adhesive") == []
+
+
+def test_curated_documents_are_shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base, 'ADMINS', {'curator@example.org'})
+    (tmp_path / "varnish.md").write_text("Remove darkened varnish with a tested solvent gel.")
+    kb = knowledge_base.KnowledgeBase(str(tmp_path))
+    kb.add_document("lining.md", LINING, 'curator@example.org')
+
+    assert kb.documents(BOB) == ["lining.md", "varnish.md"]
+    assert kb.search("reversible adhesive", user=BOB)
+    assert kb.search("darkened varnish", user=BOB)
+
+
+def test_only_the_owner_or_an_admin_can_remove_a_document(tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base, 'ADMINS', {'curator@example.org'})
+    kb = knowledge_base.KnowledgeBase(str(tmp_path))
+    name = kb.add_document("lining.md", LINING, ANN)
+
+    with pytest.raises(PermissionError):
+        kb.remove_document(name, BOB)
+    assert not kb.can_remove(name, BOB)
+    kb.remove_document(name, ANN)
+
+    assert kb.documents(ANN) == []
+    assert all("reversible adhesive" not in note for note in kb.reference_notes("Painting", "", "torn canvas", user=ANN))
+    other = kb.add_document("notes.md", LINING, BOB)
+    kb.remove_document(other, 'curator@example.org')
+    assert kb.documents('curator@example.org') == []
+
+
+def test_upload_with_a_taken_name_gets_a_new_one(tmp_path):
+    kb = knowledge_base.KnowledgeBase(str(tmp_path))
+
+    first = kb.add_document("../notes.md", LINING)
+    second = kb.add_document("notes.md", "Relining with wax-resin adhesive.")
+
+    assert (first, second) == ("notes.md", "notes-2.md")
+    assert (tmp_path / "notes.md").read_text() == LINING
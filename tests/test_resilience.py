@@ -0,0 +1,153 @@
+import pytest
+
+import resilience
+from conftest import FLASH, PRO
+from fake_gemini import FakeModel
+
+
+def test_retries_transient_errors_then_succeeds(make_config):
+    flash = FakeModel(FLASH, failures=[503, 429])
+    config = make_config(flash)
+
+    response, model_name = resilience.call(config, "Consolidate flaking paint")
+
+    assert model_name == FLASH
+    assert flash.calls == 3
+    assert response.text.startswith("Guidance (gemini-1.5-flash)")
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    # Full jitter: the upper end of each draw is base * 2^attempt, up to the cap
+    monkeypatch.setattr(resilience.random, 'uniform', lambda low, high: high)
+    monkeypatch.setattr(resilience, 'BACKOFF_BASE_SECONDS', 1.0)
+    monkeypatch.setattr(resilience, 'BACKOFF_MAX_SECONDS', 5.0)
+
+    assert [resilience.backoff_delay(attempt) for attempt in range(5)] == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_sleeps_between_retries(make_config, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, 'sleep', sleeps.append)
+    config = make_config(FakeModel(FLASH, failures=[503, 503]))
+
+    resilience.call(config, "Consolidate flaking paint")
+
+    assert len(sleeps) == 2
+
+
+def test_on_retry_runs_before_every_request_after_the_first(make_config):
+    retries = []
+    config = make_config(FakeModel(FLASH, failures=[503, 503, 503]), FakeModel(PRO))
+
+    resilience.call(config, "Consolidate flaking paint", on_retry=lambda: retries.append(1))
+
+    # Two retries of flash, then the fallback to pro
+    assert len(retries) == 3
+
+
+def test_falls_back_when_the_model_keeps_failing(make_config):
+    flash = FakeModel(FLASH, failures=[503] * resilience.MAX_ATTEMPTS)
+    pro = FakeModel(PRO)
+    config = make_config(flash, pro)
+
+    _, model_name = resilience.call(config, "Consolidate flaking paint")
+
+    assert model_name == PRO
+    assert (flash.calls, pro.calls) == (resilience.MAX_ATTEMPTS, 1)
+
+
+def test_invalid_request_is_neither_retried_nor_sent_elsewhere(make_config):
+    flash = FakeModel(FLASH, failures=[400])
+    pro = FakeModel(PRO)
+    config = make_config(flash, pro)
+
+    with pytest.raises(resilience.InvalidRequestError):
+        resilience.call(config, "Consolidate flaking paint")
+    assert (flash.calls, pro.calls) == (1, 0)
+
+
+def test_streaming_falls_back_before_the_first_chunk(make_config):
+    config = make_config(FakeModel(FLASH, failures=[503] * resilience.MAX_ATTEMPTS), FakeModel(PRO))
+
+    chunks = list(resilience.stream(config, "Consolidate flaking paint"))
+
+    assert {model_name for _, model_name, _ in chunks} == {PRO}
+    assert "".join(text for text, _, _ in chunks).startswith("Guidance (gemini-1.5-pro)")
+
+
+def test_breaker_opens_after_repeated_failures(make_config, monkeypatch):
+    monkeypatch.setitem(resilience._breakers, FLASH, resilience.CircuitBreaker(failure_threshold=3))
+    monkeypatch.setattr(resilience, 'MAX_ATTEMPTS', 3)
+    flash = FakeModel(FLASH, failures=[503] * 3)
+    pro = FakeModel(PRO)
+    config = make_config(flash, pro)
+
+    resilience.call(config, "first")
+    assert resilience.breaker_for(FLASH).state == 'open'
+
+    # Flash is skipped without a call while its breaker is open
+    _, model_name = resilience.call(config, "second")
+    assert model_name == PRO
+    assert flash.calls == 3
+
+
+def test_open_breaker_with_no_fallback_fails_fast(make_config, monkeypatch):
+    monkeypatch.setitem(resilience._breakers, FLASH, resilience.CircuitBreaker(failure_threshold=3))
+    monkeypatch.setattr(resilience, 'MAX_ATTEMPTS', 3)
+    flash = FakeModel(FLASH, failures=[503] * 3)
+    config = make_config(flash)
+
+    with pytest.raises(resilience.UpstreamUnavailableError):
+        resilience.call(config, "first")
+    with pytest.raises(resilience.CircuitOpenError):
+        resilience.call(config, "second")
+    assert flash.calls == 3
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = resilience.CircuitBreaker(failure_threshold=2, reset_seconds=0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'half-open'
+
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    breaker = resilience.CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    now[0] += 30
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_half_open_probe_closes_the_breaker_on_success(make_config, monkeypatch):
+    monkeypatch.setitem(resilience._breakers, FLASH, resilience.CircuitBreaker(failure_threshold=3))
+    monkeypatch.setattr(resilience, 'MAX_ATTEMPTS', 3)
+    flash = FakeModel(FLASH, failures=[503] * 3)
+    config = make_config(flash)
+    with pytest.raises(resilience.UpstreamUnavailableError):
+        resilience.call(config, "first")
+
+    breaker = resilience.breaker_for(FLASH)
+    monkeypatch.setattr(breaker, 'reset_seconds', 0)
+    _, model_name = resilience.call(config, "second")
+
+    assert model_name == FLASH
+    assert breaker.state == 'closed'
@@ -0,0 +1,64 @@
+import response_cache
+
+PROFILE = {'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+MODEL = 'models/gemini-1.5-flash'
+
+
+def test_key_ignores_whitespace_case_and_unused_profile_fields():
+    key = response_cache.make_key("Flaking  paint\n on panel", PROFILE, MODEL)
+
+    assert key == response_cache.make_key("flaking paint on panel ", dict(PROFILE, name="Ann"), MODEL)
+    assert key != response_cache.make_key("flaking paint on panel", dict(PROFILE, tone='academic'), MODEL)
+    assert key != response_cache.make_key("flaking paint on panel", PROFILE, 'models/gemini-1.5-pro')
+
+
+def test_answers_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'responses.sqlite3')
+    response_cache.ResponseCache(path).set('key', 'consolidate')
+
+    cache = response_cache.ResponseCache(path)
+
+    assert cache.get('key') == 'consolidate'
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_expired_entries_are_dropped(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = response_cache.ResponseCache(str(tmp_path / 'responses.sqlite3'), ttl_seconds=60)
+    cache.set('key', 'consolidate')
+
+    now[0] += 61
+
+    assert cache.get('key') is None
+    assert cache.stats()['disk_entries'] == 0
+
+
+def test_least_recently_used_rows_are_evicted_from_disk(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    # No memory tier, so every lookup reaches the disk
+    cache = response_cache.ResponseCache(str(tmp_path / 'responses.sqlite3'), memory_entries=0, disk_entries=2)
+    for key in ('a', 'b'):
+        cache.set(key, key)
+        now[0] += 1
+    cache.get('a')
+    now[0] += 1
+
+    cache.set('c', 'c')
+
+    assert cache.stats()['disk_entries'] == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == 'a'
+
+
+def test_memory_tier_keeps_only_the_most_recent_entries():
+    cache = response_cache.ResponseCache(None, memory_entries=2)
+    cache.set('a', 'a')
+    cache.set('b', 'b')
+    cache.get('a')
+
+    cache.set('c', 'c')
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('a', 'c')
@@ -0,0 +1,44 @@
+import router
+from conftest import FLASH, PRO
+from fake_gemini import FakeModel
+
+PROFILE = {'experience': 'beginner', 'tone': 'simplified', 'creativity': 8, 'length': 10}
+
+
+def test_profile_sets_temperature_and_output_budget(make_config):
+    plan = router.plan(make_config(FakeModel(FLASH)), PROFILE, 'Visitor Summary')
+
+    assert plan.generation_config == {'temperature': 0.8, 'max_output_tokens': 450}
+    assert router.temperature(1) == 0.1 and router.temperature(10) == 1.0
+    assert router.max_output_tokens('Visitor Summary', 10) == 450
+    assert router.max_output_tokens('Visitor Summary', 1) == 180
+
+
+def test_quality_outputs_prefer_the_larger_model_until_it_is_too_slow(make_config):
+    config = make_config(FakeModel(FLASH), FakeModel(PRO))
+    tracker = router.get_tracker()
+
+    assert router.choose_model(config, 'Restoration Technique', tracker)[0] == PRO
+    assert router.choose_model(config, 'Visitor Summary', tracker)[0] == FLASH
+
+    tracker.observe(PRO, 'Restoration Technique', 40)
+    assert router.choose_model(config, 'Restoration Technique', tracker) == (FLASH, None)
+
+
+def test_fastest_model_is_used_when_none_meets_the_target(make_config):
+    config = make_config(FakeModel(FLASH), FakeModel(PRO))
+    tracker = router.get_tracker()
+    tracker.observe(FLASH, 'Visitor Summary', 12)
+    tracker.observe(PRO, 'Visitor Summary', 9)
+
+    assert router.choose_model(config, 'Visitor Summary', tracker) == (PRO, 9)
+
+
+def test_latencies_are_saved_for_the_next_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(router, 'SAVE_EVERY_SECONDS', 0)
+    path = str(tmp_path / 'model_latency.json')
+    router.LatencyTracker(path).observe(FLASH, 'chat', 3.0)
+
+    assert router.LatencyTracker(path).estimate(FLASH, 'chat') == 3.0
+    # Other routes fall back to the model's overall average
+    assert router.LatencyTracker(path).estimate(FLASH, 'summary') == 3.0
@@ -0,0 +1,112 @@
+import pytest
+
+import resilience
+import scheduler
+from conftest import FLASH
+from fake_gemini import FakeModel
+from generation import GenerationError, generate_response, stream_response
+
+PROFILE = {'email': 'ann@example.org', 'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+
+
+def queued_scheduler(*users):
+    """A scheduler with no request quota left, holding one ticket per entry of `users`."""
+    sched = scheduler.Scheduler(requests_per_minute=60, tokens_per_minute=0, user_requests_per_minute=0)
+    sched.requests.level = 0
+    tickets = [sched.enqueue(user) for user in users]
+    return sched, tickets
+
+
+def admit(sched, requests):
+    # Quota for `requests` more calls arrives at once
+    with sched._cond:
+        sched.requests.level = requests
+        sched._dispatch()
+
+
+def test_users_take_turns_within_a_priority():
+    sched, tickets = queued_scheduler(*['a'] * 20, 'b')
+
+    admit(sched, 2)
+
+    # B's one request goes second, not after all twenty of A's
+    assert [t.user for t in tickets if t.granted] == ['a', 'b']
+    assert sum(t.granted for t in tickets if t.user == 'a') == 1
+
+
+def test_queue_position_counts_one_turn_per_other_user():
+    sched, tickets = queued_scheduler(*['a'] * 20, 'b')
+
+    with sched._cond:
+        position, _ = sched._position(tickets[-1])
+
+    assert position == 1
+
+
+def test_higher_priority_goes_first_and_can_be_promoted():
+    sched, tickets = queued_scheduler('a', 'b')
+    prefetch = sched.enqueue('c', scheduler.PREFETCH)
+    chat = sched.enqueue('d', scheduler.CHAT)
+    sched.promote(prefetch, scheduler.CHAT)
+
+    admit(sched, 2)
+
+    assert chat.granted and prefetch.granted
+    assert not any(t.granted for t in tickets)
+
+
+def test_user_bucket_limits_one_user_but_not_another():
+    sched = scheduler.Scheduler(requests_per_minute=0, tokens_per_minute=0, user_requests_per_minute=6)
+    burst = sched._user_bucket('a').capacity
+    mine = [sched.enqueue('a') for _ in range(int(burst) + 3)]
+    other = sched.enqueue('b')
+
+    with sched._cond:
+        # Like acquire(), dispatch again while another admission is due any moment
+        while sched._dispatch() < 1:
+            pass
+
+    assert sum(t.granted for t in mine) == burst
+    assert other.granted
+
+
+def test_token_reservation_is_corrected_by_real_usage():
+    sched = scheduler.Scheduler(requests_per_minute=0, tokens_per_minute=60000, user_requests_per_minute=0)
+    full = sched.tokens.level
+
+    ticket = sched.acquire('a', tokens=100)
+    sched.settle(ticket, 300)
+
+    assert round(full - sched.tokens.level) == 300
+
+
+def test_every_retry_takes_a_request_and_failed_calls_return_their_tokens(make_config, monkeypatch):
+    sched = scheduler.Scheduler(requests_per_minute=600, tokens_per_minute=600000, user_requests_per_minute=0)
+    monkeypatch.setattr(scheduler, '_scheduler', sched)
+    make_config(FakeModel(FLASH, failures=[503] * resilience.MAX_ATTEMPTS))
+    full = sched.tokens.level
+
+    with pytest.raises(GenerationError):
+        generate_response("Painting, Baroque: flaking paint. Conservation Advice", PROFILE)
+
+    assert sched.admitted == resilience.MAX_ATTEMPTS
+    assert sched.tokens.level == pytest.approx(full)
+
+
+def test_stream_closed_before_its_usage_arrives_returns_its_tokens(make_config, monkeypatch):
+    sched = scheduler.Scheduler(requests_per_minute=600, tokens_per_minute=600000, user_requests_per_minute=0)
+    monkeypatch.setattr(scheduler, '_scheduler', sched)
+    make_config(FakeModel(FLASH))
+    # Usage metadata only arrives with the last chunk, which a closed stream never reads
+    stream = resilience.stream
+    monkeypatch.setattr(resilience, 'stream', lambda *args, **kwargs: (
+        (text, model_name, None) for text, model_name, _ in stream(*args, **kwargs)))
+    full = sched.tokens.level
+
+    chunks = stream_response("Painting, Baroque: flaking paint. Conservation Advice", PROFILE)
+    next(chunks)
+    assert sched.tokens.level < full
+    chunks.close()
+
+    assert sched.admitted == 1
+    assert sched.tokens.level == pytest.approx(full)
@@ -0,0 +1,77 @@
+import os
+
+import session_store
+
+ANSWER = "Consolidate the flaking paint with a reversible adhesive. " * 20
+
+
+def test_identical_texts_are_stored_once_and_freed_with_the_last_reference():
+    texts = session_store.TextStore()
+    first = session_store.OutputRecord(texts, 'Painting', 'Baroque', 'flaking paint', 'Conservation Advice', ANSWER)
+    second = session_store.OutputRecord(texts, 'Painting', 'Baroque', 'flaking', 'Conservation Advice', ANSWER)
+
+    assert len(texts) == 1
+    assert first.response == second.response == ANSWER
+    # Long answers are kept compressed
+    assert session_store.deep_size(texts) < len(ANSWER)
+
+    first.release()
+    assert second.response == ANSWER
+    second.release()
+    assert len(texts) == 0
+
+
+def test_chat_over_the_cap_spills_to_disk_and_reads_back_in_order(tmp_path):
+    chat = session_store.ChatTranscript(session_store.TextStore(), limit=4, directory=str(tmp_path))
+    for i in range(10):
+        chat.append('user' if i % 2 == 0 else 'assistant', f"message {i}", context_tokens=i)
+
+    assert (len(chat), chat.spilled) == (10, 6)
+    assert os.path.exists(chat.spill_path)
+    assert [m['content'] for m in chat.turns()] == [f"message {i}" for i in range(10)]
+    assert [m['content'] for m in chat.turns(8)] == ["message 8", "message 9"]
+    assert chat.turns(3)[0] == {'role': 'assistant', 'content': "message 3", 'context_tokens': 3}
+    assert chat.user_turns == 5
+
+
+def test_clearing_the_chat_removes_its_spill_file(tmp_path):
+    texts = session_store.TextStore()
+    chat = session_store.ChatTranscript(texts, limit=2, directory=str(tmp_path))
+    for i in range(5):
+        chat.append('user', f"message {i}")
+
+    chat.clear()
+
+    assert len(chat) == 0 and len(texts) == 0
+    assert not os.path.exists(chat.spill_path)
+
+
+def test_results_past_the_cap_are_archived_newest_first(tmp_path):
+    texts = session_store.TextStore()
+    archive = session_store.OutputArchive(str(tmp_path))
+    for damage in ("mould", "flaking paint"):
+        record = session_store.OutputRecord(texts, 'Painting', 'Baroque', damage, 'Conservation Advice', ANSWER)
+        archive.add(record)
+        record.release()
+
+    records = archive.records()
+    assert len(archive) == 2
+    assert [r['damage'] for r in records] == ["flaking paint", "mould"]
+    assert records[0]['response'] == ANSWER
+
+    archive.clear()
+    assert archive.records() == []
+    assert not os.path.exists(archive.spill_path)
+
+
+def test_stale_spill_files_are_pruned(tmp_path):
+    stale = [tmp_path / 'chat_old.jsonl', tmp_path / 'outputs_old.jsonl']
+    for path in stale:
+        path.write_text('{}\n')
+        os.utime(path, (0, 0))
+    fresh = tmp_path / 'chat_new.jsonl'
+    fresh.write_text('{}\n')
+
+    session_store.prune_spill_files(str(tmp_path))
+
+    assert not any(path.exists() for path in stale) and fresh.exists()
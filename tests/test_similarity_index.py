@@ -0,0 +1,64 @@
+import similarity_index
+from generation import similarity_scope
+
+PROFILE = {'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+SCOPE = "Conservation Advice|beginner|simplified|5|5"
+
+
+def scope(artwork_type, period):
+    return similarity_scope("Conservation Advice", PROFILE, artwork_type, period, "", "")
+
+
+def test_reworded_request_matches_only_in_its_scope(tmp_path):
+    index = similarity_index.SimilarityIndex(str(tmp_path))
+    index.add("flaking paint on the wooden panel", "consolidate", SCOPE)
+
+    match = index.best_match("flaking paint on a wooden panel", SCOPE)
+
+    assert match and match[1]['response'] == "consolidate"
+    assert index.best_match("flaking paint on a wooden panel", "Visitor Summary|beginner|simplified|5|5") is None
+
+
+def test_entries_survive_reopening_the_index(tmp_path):
+    similarity_index.SimilarityIndex(str(tmp_path)).add("flaking paint", "consolidate", SCOPE)
+
+    index = similarity_index.SimilarityIndex(str(tmp_path))
+
+    assert index.stats()['entries'] == 1
+    assert index.best_match("flaking paint", SCOPE)[1]['response'] == "consolidate"
+
+
+def test_clustered_index_still_finds_exact_repeats(tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity_index, 'TRAIN_AT', 64)
+    index = similarity_index.SimilarityIndex(str(tmp_path))
+    for i in range(100):
+        index.add(f"damage report {i}: cracks in panel {i * 7} and losses near figure {i * 13}", f"answer {i}", SCOPE)
+
+    assert index.stats()['clusters'] > 0
+    for i in (0, 63, 99):
+        text = f"damage report {i}: cracks in panel {i * 7} and losses near figure {i * 13}"
+        assert index.best_match(text, SCOPE)[1]['response'] == f"answer {i}"
+
+
+def test_default_threshold_is_calibrated_on_the_checked_in_pairs():
+    threshold, _ = similarity_index.calibrate(similarity_index.load_pairs())
+
+    assert threshold == similarity_index.DEFAULT_THRESHOLD
+
+
+def test_paraphrase_matches_and_different_damage_does_not(tmp_path):
+    index = similarity_index.SimilarityIndex(str(tmp_path))
+    index.add("flaking paint", "consolidate", scope("Painting", "Baroque"))
+    index.add("water stains on the lower left corner", "dry and reduce the tideline", scope("Painting", "Baroque"))
+
+    match = index.best_match("paint flakes", scope("Painting", "baroque"))
+    assert match and match[1]['response'] == "consolidate"
+    assert index.best_match("mold growth on the lower left corner", scope("Painting", "Baroque")) is None
+
+
+def test_other_artwork_details_never_match(tmp_path):
+    index = similarity_index.SimilarityIndex(str(tmp_path))
+    index.add("flaking paint", "consolidate", scope("Painting", "Baroque"))
+
+    assert index.best_match("flaking paint", scope("Painting", "Rococo")) is None
+    assert index.best_match("flaking paint", scope("Mural", "Baroque")) is None
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import resilience
+import scheduler
+import singleflight
+from conftest import FLASH
+from fake_gemini import FakeModel
+from generation import GenerationError, generate_response, stream_response
+
+PROFILE = {'email': 'ann@example.org', 'experience': 'beginner', 'tone': 'simplified', 'creativity': 5, 'length': 5}
+PROMPT = "Painting, Baroque: flaking paint. Conservation Advice"
+
+
+def test_followers_share_the_leaders_chunks_and_error():
+    group = singleflight.SingleFlight()
+    flight, leader = group.join('key')
+    same, second_leader = group.join('key')
+
+    flight.publish("consolidate ", FLASH)
+    error = resilience.UpstreamUnavailableError("503", FLASH)
+    group.finish('key', flight, error)
+
+    assert leader and not second_leader and same is flight
+    chunks = []
+    with pytest.raises(resilience.UpstreamUnavailableError):
+        for text in same.iter_chunks():
+            chunks.append(text)
+    assert chunks == ["consolidate "]
+    # A finished flight is forgotten, so the next request starts a new one
+    assert group.join('key')[1]
+
+
+def test_more_urgent_follower_raises_the_flights_priority():
+    group = singleflight.SingleFlight()
+    flight, _ = group.join('key', scheduler.PREFETCH)
+    raised = []
+
+    assert flight.watch(raised.append) == scheduler.PREFETCH
+    group.join('key', scheduler.PREFETCH)
+    group.join('key', scheduler.INTERACTIVE)
+    group.join('key', scheduler.BATCH)
+
+    assert raised == [scheduler.INTERACTIVE]
+
+
+def test_concurrent_identical_requests_make_one_call(make_config):
+    flash = FakeModel(FLASH, latency=0.3)
+    make_config(flash)
+
+    with ThreadPoolExecutor(5) as pool:
+        answers = list(pool.map(lambda _: generate_response(PROMPT, PROFILE), range(5)))
+
+    assert flash.calls == 1
+    assert len(set(answers)) == 1
+
+
+def test_followers_get_the_leaders_failure(make_config):
+    flash = FakeModel(FLASH, latency=0.3, failures=[400])
+    make_config(flash)
+
+    def attempt(_):
+        try:
+            return generate_response(PROMPT, PROFILE)
+        except GenerationError as e:
+            return e.__class__
+
+    with ThreadPoolExecutor(3) as pool:
+        outcomes = list(pool.map(attempt, range(3)))
+
+    assert outcomes == [resilience.InvalidRequestError] * 3
+    assert flash.calls == 1
+
+
+def test_stream_follower_replays_chunks_it_missed(make_config):
+    flash = FakeModel(FLASH, latency=0.3)
+    make_config(flash)
+    leader = stream_response(PROMPT, PROFILE)
+    first = next(leader)
+
+    follower = []
+    thread = threading.Thread(target=lambda: follower.extend(stream_response(PROMPT, PROFILE)))
+    thread.start()
+    flight, = singleflight.get_group()._flights.values()
+    while not flight.followers:
+        time.sleep(0.01)
+    rest = list(leader)
+    thread.join(5)
+
+    assert flash.calls == 1
+    assert "".join(follower) == first + "".join(rest)